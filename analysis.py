@@ -9,21 +9,61 @@
 #       calcuate object's magnitude of acceleration, and acceleration in 
 #       both x-, y-direction
 #
+#   both take the launch parameters (obj, v0, deg) as an option; then they use the
+#   closed form of the drag (or vacuum) motion instead of fitting splines to the
+#   sampled trajectory, which stays the fallback for arbitrary data
+#
 #   motion.getMaxHeight
 #       calcuate object's highest position
 #
+#   motion.apex
+#       time, height and x-position of the highest point of arrays of launches,
+#       in closed form
+#
 #   motion.NewtonMethod
-#       Newton's method to find the root
+#       Newton's method to find the root, with a bounded number of steps
 
 from numpy import linspace
+from numpy import asarray
+from numpy import cos
+from numpy import deg2rad
+from numpy import errstate
+from numpy import full_like
+from numpy import inf
+from numpy import log1p
+from numpy import maximum
+from numpy import where
+from numpy import sin
 from numpy import average
 from numpy import sqrt
 from numpy import power as pow
-from scipy.interpolate import interp1d
 from statistics import median
+from projectile import g, p, _closed_form
+import instrument
+
+def _derivatives(t, obj, v0, deg, drag=True):
+    # velocity and acceleration of the launch at times t, from projectile._closed_form
+    # (the vacuum parabola gives scalars, they are broadcast to the shape of t)
+    t = asarray(t, dtype=float)
+    x, y, vx, vy, ax, ay = _closed_form(obj, v0, deg, drag)(t)
+    return [full_like(t, a) for a in (vx, vy, ax, ay)]
+
+def interp1d(*args, **kwargs):
+    # scipy.interpolate.interp1d, imported on first use: scipy takes longer to import than
+    # the rest of the simulation, and only the spline fits need it
+    from scipy.interpolate import interp1d
+    return interp1d(*args, **kwargs)
 
 class motion:
-    def velocity(self, T, X, Y):
+    @instrument.timed()
+    def velocity(self, T, X, Y, obj=None, v0=None, deg=None, drag=True):
+        # with the launch parameters, the velocity is exact and evaluated on the same
+        # times the spline fit returns (T without its end points)
+        if obj is not None and v0 is not None and deg is not None:
+            t = T[1:T.size-1]
+            vx, vy, ax, ay = _derivatives(t, obj, v0, deg, drag)
+            return t, sqrt(pow(vx, 2) + pow(vy, 2)), vx, vy
+
         # increase sample size of T (time) by twice
         Ti = linspace(T[0], T[-1], 2 * T.size - 1)
         dt = Ti[1] - Ti[0] # calculate delta time
@@ -48,7 +88,15 @@ class motion:
         
         return t, v, vx, vy
         
-    def acceleration(self, T, X, Y):
+    @instrument.timed()
+    def acceleration(self, T, X, Y, obj=None, v0=None, deg=None, drag=True):
+        # with the launch parameters, the acceleration is exact and evaluated on the
+        # same times the spline fit returns (T without two points at each end)
+        if obj is not None and v0 is not None and deg is not None:
+            t = T[2:T.size-2]
+            vx, vy, ax, ay = _derivatives(t, obj, v0, deg, drag)
+            return t, sqrt(pow(ax, 2) + pow(ay, 2)), ax, ay
+
         # calculate the velocity of the object
         Tv, V, Vx, Vy = self.velocity(self, T, X, Y)
         
@@ -76,7 +124,14 @@ class motion:
         
         return t, a, ax, ay
 
-    def getMaxHeight(self, T, X, Y):
+    @instrument.timed()
+    def getMaxHeight(self, T, X, Y, obj=None, v0=None, deg=None, drag=True):
+        # with the launch parameters, the time of the highest point is exact
+        if obj is not None and v0 is not None and deg is not None:
+            if not drag:
+                return self.apex(self, v0, deg, m=obj.m, Cd=0.0, A=obj.A, x0=obj.x0, y0=obj.y0)[0]
+            return self.apex(self, v0, deg, m=obj.m, Cd=obj.Cd, A=obj.A, x0=obj.x0, y0=obj.y0)[0]
+
         # get velocity and accerlation
         Tv, V, Vx, Vy = self.velocity(self, T, X, Y)
         Ta, A, Ax, Ay = self.acceleration(self, T, X, Y)
@@ -84,17 +139,53 @@ class motion:
         # interpolate the velocity and acceraltion function
         fvY  = interp1d(Tv, Vy, kind='quadratic')
         faY  = interp1d(Ta, Ay, kind='quadratic')
-        tmax = self.NewtonMethod(self, fv=fvY, fa=faY, x0=median(Tv)) # newton's method
+        # newton's method, kept inside the times where both fits are defined
+        tmax = self.NewtonMethod(self, fv=fvY, fa=faY, x0=median(Tv), bounds=(Ta[0], Ta[-1]))
         
         return tmax
+
+    @instrument.timed()
+    def apex(self, v0, deg, m=1.0, Cd=0.0, A=0.05, x0=0.0, y0=0.0):
+        # highest point of the launches, all parameters may be arrays
+        #   drag:   vy = 0 at t = (vt / |g|) * ln(1 + v0 * sin(theta) / vt)
+        #   vacuum: (Cd = 0) vy = 0 at t = v0 * sin(theta) / |g|
+        # a launch going down has its highest point at t = 0
+        # returns the time, height and x-position of the highest point
+        theta = deg2rad(asarray(deg, dtype=float))
+        vx0 = v0 * cos(theta)
+        vy0 = maximum(v0 * sin(theta), 0.0)
+        Cd = asarray(Cd, dtype=float)
+
+        with errstate(divide='ignore', invalid='ignore'):
+            vt = where(Cd > 0, sqrt((2 * m * abs(g)) / (p * A * Cd)), inf) # terminal velocity
+            t_drag = (vt / abs(g)) * log1p(vy0 / vt)
+            x_drag = x0 + ((vx0 * vt) / abs(g)) * (vy0 / (vt + vy0)) # 1 - exp(g*t/vt) at the apex
+            y_drag = y0 + (vt / abs(g)) * vy0 - vt * t_drag
+        t_vacuum = vy0 / abs(g)
+        x_vacuum = x0 + vx0 * t_vacuum
+        y_vacuum = y0 + vy0 * vy0 / (2 * abs(g))
+
+        vacuum = vt == inf
+        t = where(vacuum, t_vacuum, t_drag)
+        y = where(vacuum, y_vacuum, y_drag)
+        x = where(vacuum, x_vacuum, x_drag)
+        return t[()], y[()], x[()]
         
-    def NewtonMethod(self, fv, fa, x0, tol=0.001):
-        x1 = x0 - fv(x0) / fa(x0)
-        x2 = x1 - fv(x1) / fa(x1)
-        
-        if abs(x1 - x2) > tol: # recursive function
-            y = self.NewtonMethod(self, fv, fa, x0=x1)
-        else:
-            y = x0
+    @instrument.timed()
+    def NewtonMethod(self, fv, fa, x0, tol=0.001, maxiter=50, bounds=None):
+        # iterates x1 = x0 - fv(x0) / fa(x0) at most maxiter times, each estimate kept
+        # inside bounds (lo, hi) when given, and returns the estimate once it moves
+        # less than tol
+        x1 = x0
+        for i in range(maxiter):
+            slope = fa(x0)
+            if slope == 0:
+                break
+            x1 = x0 - fv(x0) / slope
+            if bounds is not None:
+                x1 = min(max(x1, bounds[0]), bounds[1])
+            if abs(x1 - x0) <= tol:
+                break
+            x0 = x1
             
-        return y
\ No newline at end of file
+        return x1
\ No newline at end of file
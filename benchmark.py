@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+
+"""Benchmarks of the simulation hot paths -
+    Runs each stage on synthetic launch sets of 1, 1k, 100k and 1M throws (seeded,
+    no input file or display needed) and reports, per stage and size:
+    - throughput (launches per second)
+    - latency percentiles (p50, p90, p99) of one call of the stage
+    - peak memory allocated during the stage (tracemalloc, in a separate run since it
+      makes every allocation slower)
+
+    Each stage is first called once on a single launch, so lazy imports (scipy) and
+    first-call costs are not timed.
+
+    Stages that run one launch per Python call are capped at --max-scalar launches,
+    since they would take hours on 1M throws. With --output the results are saved as
+    JSON with the git commit, so two runs can be compared with --compare.
+
+    The import time of the main modules is measured too, in a fresh interpreter, against
+    import_budget; the simulation core must not load the plotting stack (matplotlib,
+    scipy). --check exits with an error when a module is over its budget.
+
+    Usage:
+        python benchmark.py [--sizes 1,1000,100000,1000000] [--stages drag,classify,...]
+                            [--max-scalar N] [--output results.json] [--compare old.json]
+                            [--check] [--no-memory]
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import objects as obj
+import projectile as proj
+from read_data import read_data, row_dtype
+from runner import launch_columns
+
+default_sizes = (1, 1000, 100000, 1000000)
+
+# Longest time allowed to import each module in a fresh interpreter, in seconds (NumPy
+# alone takes about 0.1 s); none of them may load the plotting stack
+import_budget = {
+    'projectile': 0.25,
+    'objects': 0.25,
+    'read_data': 0.25,
+    'analysis': 0.25,
+    'runner': 0.3,
+    'main': 0.3,
+}
+plotting_stack = ('matplotlib', 'scipy', 'pylab')
+
+
+def synthetic_launches(n, seed=0):
+    """ Structured array (read_data.row_dtype) of n random launches, like the rows of
+        projectile_input.csv, a quarter of them of each object type
+    """
+    rng = np.random.default_rng(seed)
+    launches = np.zeros(n, dtype=row_dtype)
+    launches['name'] = ['player%d' % i for i in range(n)]
+    launches['speed'] = rng.uniform(20, 300, n)
+    launches['angle'] = rng.uniform(5, 85, n)
+    launches['Cd'] = rng.uniform(0.04, 1.2, n)
+    launches['diameter'] = rng.uniform(0.05, 0.5, n)
+    launches['area'] = np.pi / 4
+    launches['mass'] = rng.uniform(0.04, 2, n)
+    launches['obj_type'] = rng.integers(0, 4, n)
+    return launches
+
+
+def write_csv(launches, filename):
+    # Writes the launches as a projectile input file
+    with open(filename, 'w') as stream:
+        stream.write('name,initial_speed,initial_angle,drag_coefficent,diameter,ref_area,mass,obj_type\n')
+        for row in launches.tolist():
+            stream.write('%s,%r,%r,%r,%r,%r,%r,%d\n' % row)
+
+
+def _timed(call, items):
+    # Calls call(item) for every item, returns the duration of each call in seconds
+    durations = np.empty(len(items))
+    for i, item in enumerate(items):
+        start = time.perf_counter()
+        call(item)
+        durations[i] = time.perf_counter() - start
+    return durations
+
+
+# Each stage takes the synthetic launches and returns (number of launches, call durations)
+
+def stage_drag(launches):
+    # motion.Drag, one call per launch
+    columns = launch_columns(read_data().parameters(launches)[0])
+    specs = obj.makeSpecs(columns[:, 2], columns[:, 3], columns[:, 5], columns[:, 6], columns[:, 4])
+    mtn = proj.motion()
+    return len(launches), _timed(lambda i: mtn.Drag(specs[i], v0=columns[i, 0], deg=columns[i, 1]), range(len(launches)))
+
+
+def stage_failure(launches):
+    # motion.failure on every step of the Drag trajectories, one call per step
+    columns = launch_columns(read_data().parameters(launches)[0])
+    T, X, Y, landing, outcome = proj.motion().DragBatch(*columns.T, ragged=True)
+    mtn = proj.motion()
+    steps = [(X[i], Y[i], k) for i in range(len(X)) for k in range(1, len(X[i]))]
+    durations = _timed(lambda s: mtn.failure(s[0][s[2]], s[1][s[2]], s[0][s[2] - 1], s[1][s[2] - 1], False, False, False),
+                       steps)
+    return len(launches), durations
+
+
+def stage_drag_batch(launches, chunk=16384):
+    # motion.DragBatch, one call per chunk of launches
+    columns = launch_columns(read_data().parameters(launches)[0])
+    mtn = proj.motion()
+    chunks = [columns[start:start + chunk] for start in range(0, len(columns), chunk)]
+    return len(launches), _timed(lambda c: mtn.DragBatch(*c.T), chunks)
+
+
+def stage_classify(launches, chunk=1 << 20):
+    # motion.classify, one call per chunk of launches
+    columns = launch_columns(read_data().parameters(launches)[0])
+    specs = obj.makeSpecs(columns[:, 2], columns[:, 3], columns[:, 5], columns[:, 6], columns[:, 4])
+    mtn = proj.motion()
+    starts = range(0, len(columns), chunk)
+    return len(launches), _timed(lambda s: mtn.classify(specs[s:s + chunk], columns[s:s + chunk, 0],
+                                                        columns[s:s + chunk, 1]), starts)
+
+
+def stage_velocity(launches):
+    # analysis.motion.velocity with the spline fit, one call per Drag trajectory
+    from analysis import motion as analysis
+    columns = launch_columns(read_data().parameters(launches)[0])
+    T, X, Y, landing, outcome = proj.motion().DragBatch(*columns.T, ragged=True)
+    # the quadratic fit needs a few points
+    items = [i for i in range(len(X)) if len(X[i]) > 4]
+    durations = _timed(lambda i: analysis.velocity(analysis, T[:len(X[i])], X[i], Y[i]), items)
+    return len(items), durations
+
+
+def stage_max_height(launches):
+    # analysis.motion.getMaxHeight with the spline fit and Newton's method, per trajectory
+    from analysis import motion as analysis
+    columns = launch_columns(read_data().parameters(launches)[0])
+    T, X, Y, landing, outcome = proj.motion().DragBatch(*columns.T, ragged=True)
+    items = [i for i in range(len(X)) if len(X[i]) > 8]
+    durations = _timed(lambda i: analysis.getMaxHeight(analysis, T[:len(X[i])], X[i], Y[i]), items)
+    return len(items), durations
+
+
+def stage_apex(launches):
+    # analysis.motion.apex, one vectorized call
+    from analysis import motion as analysis
+    columns = launch_columns(read_data().parameters(launches)[0])
+    return len(launches), _timed(lambda c: analysis.apex(analysis, c[:, 0], c[:, 1], m=c[:, 4], Cd=c[:, 2],
+                                                         A=c[:, 3]), [columns])
+
+
+def stage_read_file(launches):
+    # read_data.read_file of a csv file with the launches (writing it is not timed)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'projectile_input.csv')
+        write_csv(launches, filename)
+        return len(launches), _timed(lambda f: read_data().read_file(f), [filename])
+
+
+def stage_get_x_y(launches):
+    # main.Renderer.get_x_y, every trajectory of the input kept for the chart
+    from main import Renderer
+    param_input, names = read_data().parameters(launches)
+    return len(launches), _timed(lambda r: r.get_x_y(param_input, names), [Renderer(reporter=None)])
+
+
+# name: (function, runs one Python call per launch)
+stages = {
+    'drag': (stage_drag, True),
+    'failure': (stage_failure, True),
+    'drag_batch': (stage_drag_batch, False),
+    'classify': (stage_classify, False),
+    'velocity': (stage_velocity, True),
+    'max_height': (stage_max_height, True),
+    'apex': (stage_apex, False),
+    'read_file': (stage_read_file, False),
+    'get_x_y': (stage_get_x_y, True),
+}
+
+
+def run_stage(name, size, seed=0, memory=True):
+    """ Runs a stage on size synthetic launches, returns a dictionary with the
+        throughput, latency percentiles and peak memory (None without memory)
+    """
+    function = stages[name][0]
+    launches = synthetic_launches(size, seed)
+    function(synthetic_launches(1, seed)) # warm-up
+
+    start = time.perf_counter()
+    count, durations = function(launches)
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function(launches)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    timed = durations.sum()
+    return {
+        'stage': name,
+        'size': size,
+        'launches': count,
+        'calls': len(durations),
+        'seconds': elapsed,
+        'timed_seconds': timed,
+        'throughput': count / timed if timed > 0 else float('inf'),
+        'p50': float(np.percentile(durations, 50)) if len(durations) else None,
+        'p90': float(np.percentile(durations, 90)) if len(durations) else None,
+        'p99': float(np.percentile(durations, 99)) if len(durations) else None,
+        'peak_bytes': peak,
+    }
+
+
+def environment():
+    # Describes the machine and the commit the results belong to
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def import_time(module, repeat=5):
+    """ Time to import module in a fresh interpreter (the best of repeat runs, as reported
+        by python -X importtime), and the packages of the plotting stack it loaded
+    """
+    best = float('inf')
+    code = 'import sys, %s; print(",".join(sorted({name.split(".")[0] for name in sys.modules})))' % module
+    for i in range(repeat):
+        run = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        for line in run.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                best = min(best, int(fields[1]) / 1e6)
+    loaded = run.stdout.strip().split(',')
+    return best, [name for name in plotting_stack if name in loaded]
+
+
+def imports():
+    # Measures every module of import_budget, returns a list of dictionaries
+    results = []
+    print('%-12s %9s %9s  %s' % ('module', 'import s', 'budget s', 'plotting stack loaded'))
+    for module, budget in import_budget.items():
+        seconds, loaded = import_time(module)
+        results.append({'module': module, 'seconds': seconds, 'budget': budget, 'loaded': loaded,
+                        'ok': seconds <= budget and not loaded})
+        print('%-12s %9.3f %9.3f  %s%s' % (module, seconds, budget, ', '.join(loaded) or '-',
+                                          '' if results[-1]['ok'] else '  over budget'))
+    print()
+    return results
+
+
+def compare(results, baseline):
+    # Prints the throughput ratio of each stage and size against a previous run
+    old = {(r['stage'], r['size']): r for r in baseline['results']}
+    print('\n%-12s %9s %14s %14s %8s' % ('stage', 'size', 'old/s', 'new/s', 'ratio'))
+    for r in results:
+        before = old.get((r['stage'], r['size']))
+        if before is None:
+            continue
+        ratio = r['throughput'] / before['throughput'] if before['throughput'] else float('inf')
+        flag = '  slower' if ratio < 0.9 else ''
+        print('%-12s %9d %14.1f %14.1f %7.2fx%s' % (r['stage'], r['size'], before['throughput'], r['throughput'],
+                                                   ratio, flag))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths.')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in default_sizes),
+                        help='comma separated numbers of launches')
+    parser.add_argument('--stages', default=','.join(stages), help='comma separated stages: ' + ', '.join(stages))
+    parser.add_argument('--max-scalar', type=int, default=1000,
+                        help='largest size run by the stages that make one call per launch (0: no limit)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic launches')
+    parser.add_argument('--output', default=None, help='JSON file for the results (not saved without it)')
+    parser.add_argument('--compare', default=None, help='JSON results of a previous run to compare with')
+    parser.add_argument('--check', action='store_true', help='exit with an error if an import is over budget')
+    parser.add_argument('--no-memory', action='store_true', help='skip the run that measures peak memory')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    names = args.stages.split(',')
+    for name in names:
+        if name not in stages:
+            parser.error('unknown stage %s' % name)
+
+    import_results = imports()
+
+    results = []
+    print('%-12s %9s %14s %11s %11s %11s %11s' % ('stage', 'size', 'launches/s', 'p50 ms', 'p90 ms', 'p99 ms',
+                                                   'peak MB'))
+    for name in names:
+        for size in sizes:
+            if stages[name][1] and args.max_scalar and size > args.max_scalar:
+                continue
+            r = run_stage(name, size, args.seed, memory=not args.no_memory)
+            results.append(r)
+            peak = '%11.1f' % (r['peak_bytes'] / 2**20) if r['peak_bytes'] is not None else '%11s' % '-'
+            print('%-12s %9d %14.1f %11.3f %11.3f %11.3f %s' % (name, size, r['throughput'], 1e3 * r['p50'],
+                                                                1e3 * r['p90'], 1e3 * r['p99'], peak))
+            sys.stdout.flush()
+
+    if args.output is not None:
+        with open(args.output, 'w') as stream:
+            json.dump({'environment': environment(), 'imports': import_results, 'results': results}, stream,
+                      indent=1)
+        print('\nResults saved to %s' % args.output)
+
+    if args.compare is not None:
+        with open(args.compare) as stream:
+            compare(results, json.load(stream))
+
+    if args.check and not all(result['ok'] for result in import_results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
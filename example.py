@@ -5,7 +5,7 @@
 import objects as obj
 import projectile as proj
 from analysis import motion as motionAnalysis
-from scipy import pi as pi
+from numpy import pi as pi
 from scipy.interpolate import interp1d
 import pylab as plb
 
@@ -26,8 +26,11 @@ ta1, a1, ax1, ay1 = motionAnalysis.acceleration(motionAnalysis, T=t1, X=x1, Y=y1
 t1max = motionAnalysis.getMaxHeight(motionAnalysis, T=t1, X=x1, Y=y1)
 
 t2, x2, y2, dummy = objmtn.Drag(baskball, v0=initial_speed, deg=initial_angle, dt=0.1, person='Undefined')
-tv2, v2, vx2, vy2 = motionAnalysis.velocity(motionAnalysis, T=t2, X=x2, Y=y2)
-ta2, a2, ax2, ay2 = motionAnalysis.acceleration(motionAnalysis, T=t2, X=x2, Y=y2)
+# launch parameters given, so velocity and acceleration come from the closed form
+tv2, v2, vx2, vy2 = motionAnalysis.velocity(motionAnalysis, T=t2, X=x2, Y=y2,
+                                            obj=baskball, v0=initial_speed, deg=initial_angle)
+ta2, a2, ax2, ay2 = motionAnalysis.acceleration(motionAnalysis, T=t2, X=x2, Y=y2,
+                                                obj=baskball, v0=initial_speed, deg=initial_angle)
 t2max = motionAnalysis.getMaxHeight(motionAnalysis, T=t2, X=x2, Y=y2)
 
 fx = interp1d(t2, x2, kind='quadratic')
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+"""Opt-in instrumentation of the simulation pipeline -
+    Records, while enabled:
+    - calls and wall time of each stage (functions decorated with timed, and span blocks)
+    - counts (rows read, rows skipped, ...) and the number of steps of each trajectory
+    - optionally the memory allocated by each stage (tracemalloc, with enable(memory=True))
+    and exports them as a JSON summary (save_json) or a Chrome trace file (save_trace),
+    which can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+    It is disabled by default: a decorated function then only checks one flag before
+    calling through, and count/steps return at once. Functions called on every step of
+    a trajectory (motion.failure) are not decorated, even that check would cost about
+    15% of a Drag launch; the steps of each trajectory are recorded instead.
+
+    Usage:
+        import instrument
+        instrument.enable()
+        ... run the simulation ...
+        instrument.save_json('profile.json')
+        instrument.save_trace('trace.json')
+
+    main.py and runner.py do this with --profile file and --trace file.
+
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from numpy import asarray
+
+enabled = False
+_memory = False
+_max_events = 0
+_origin = time.perf_counter()
+
+_stats = {}      # stage: [calls, seconds, min, max, allocated bytes, peak bytes]
+_counts = {}     # name: total
+_steps = {}      # name: [trajectories, steps, min, max]
+_events = []     # complete events of the Chrome trace
+_dropped = 0     # events not kept once max_events was reached
+_local = threading.local()
+
+
+def enable(memory=False, max_events=1000000):
+    """ Starts recording
+        - memory also tracks the bytes allocated by each stage with tracemalloc, which
+          makes the simulation several times slower
+        - at most max_events spans are kept for the trace, the summary counts all of them
+    """
+    global enabled, _memory, _max_events
+    _memory = memory
+    _max_events = max_events
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    enabled = True
+
+
+def disable():
+    # Stops recording, what was recorded is kept until reset
+    global enabled
+    enabled = False
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    # Forgets everything recorded so far
+    global _dropped, _origin
+    _stats.clear()
+    _counts.clear()
+    _steps.clear()
+    del _events[:]
+    _dropped = 0
+    _origin = time.perf_counter()
+
+
+def clock():
+    # Time used by record, in seconds
+    return time.perf_counter()
+
+
+def record(name, start, stop=None, allocated=0, peak=0, trace=True, **args):
+    # Adds one call of a stage that ran from start to stop (clock() values)
+    global _dropped
+    if not enabled:
+        return
+    if stop is None:
+        stop = time.perf_counter()
+    seconds = stop - start
+
+    stat = _stats.get(name)
+    if stat is None:
+        _stats[name] = [1, seconds, seconds, seconds, allocated, peak]
+    else:
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] = min(stat[2], seconds)
+        stat[3] = max(stat[3], seconds)
+        stat[4] += allocated
+        stat[5] = max(stat[5], peak)
+
+    if trace:
+        if len(_events) < _max_events:
+            event = {'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'ts': 1e6 * (start - _origin),
+                     'dur': 1e6 * seconds, 'pid': os.getpid(), 'tid': threading.get_ident()}
+            if args:
+                event['args'] = args
+            _events.append(event)
+        else:
+            _dropped += 1
+
+
+def count(name, n=1):
+    # Adds n to a counter
+    if enabled:
+        _counts[name] = _counts.get(name, 0) + int(n)
+
+
+def steps(name, n):
+    # Records the number of steps of one trajectory, or of an array of trajectories
+    if not enabled:
+        return
+    n = asarray(n)
+    if n.size == 0:
+        return
+    entry = _steps.get(name)
+    if entry is None:
+        _steps[name] = [n.size, int(n.sum()), int(n.min()), int(n.max())]
+    else:
+        entry[0] += n.size
+        entry[1] += int(n.sum())
+        entry[2] = min(entry[2], int(n.min()))
+        entry[3] = max(entry[3], int(n.max()))
+
+
+class _Span:
+    # Times a block of code; with memory tracking, nested spans keep their own peak
+    __slots__ = ('name', 'trace', 'args', 'start', 'memory')
+
+    def __init__(self, name, trace, args):
+        self.name = name
+        self.trace = trace
+        self.args = args
+
+    def __enter__(self):
+        self.memory = _memory and tracemalloc.is_tracing()
+        if self.memory:
+            stack = getattr(_local, 'stack', None)
+            if stack is None:
+                stack = _local.stack = []
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            stack.append([current, current])
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stop = time.perf_counter()
+        allocated = peak = 0
+        if self.memory and tracemalloc.is_tracing():
+            stack = _local.stack
+            current, traced_peak = tracemalloc.get_traced_memory()
+            start, running = stack.pop()
+            traced_peak = max(running, traced_peak)
+            if stack:
+                stack[-1][1] = max(stack[-1][1], traced_peak)
+            allocated = max(current - start, 0)
+            peak = traced_peak - start
+        record(self.name, self.start, stop, allocated, peak, self.trace, **self.args)
+        return False
+
+
+class _NoSpan:
+    # Returned by span when disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def span(name, trace=True, **args):
+    """ Context manager that records the block as one call of the stage name
+        - args are shown with the event in the trace
+        - trace=False only adds the call to the summary, for stages called many times
+    """
+    if not enabled:
+        return _no_span
+    return _Span(name, trace, args)
+
+
+def timed(name=None, trace=True):
+    """ Decorator that records every call of a function as a span, named
+        module.qualified_name unless name is given
+    """
+    def decorator(function):
+        module = function.__module__
+        if module == '__main__': # a script, named after its file
+            module = os.path.splitext(os.path.basename(getattr(sys.modules[module], '__file__', module)))[0]
+        label = name or '%s.%s' % (module, function.__qualname__)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _Span(label, trace, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    # Returns what was recorded as a dictionary
+    stages = {}
+    for name, (calls, seconds, shortest, longest, allocated, peak) in sorted(_stats.items()):
+        stages[name] = {'calls': calls, 'seconds': seconds, 'mean': seconds / calls, 'min': shortest,
+                        'max': longest}
+        if _memory:
+            stages[name].update({'allocated_bytes': allocated, 'peak_bytes': peak})
+    steps = {name: {'trajectories': n, 'steps': total, 'mean': total / n, 'min': shortest, 'max': longest}
+             for name, (n, total, shortest, longest) in sorted(_steps.items())}
+    return {'stages': stages, 'counts': dict(sorted(_counts.items())), 'steps': steps,
+            'events': len(_events), 'dropped_events': _dropped}
+
+
+def save_json(path):
+    # Writes the summary as JSON
+    with open(path, 'w') as stream:
+        json.dump(summary(), stream, indent=1)
+
+
+def save_trace(path):
+    # Writes the spans in the Chrome trace event format, with the summary as metadata
+    with open(path, 'w') as stream:
+        json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms', 'otherData': summary()}, stream)
+
+
+def report(stream=None):
+    # Prints the stages by total time, with counts and steps
+    stream = stream or sys.stderr
+    info = summary()
+    print('%-40s %9s %11s %11s' % ('stage', 'calls', 'total s', 'mean ms'), file=stream)
+    for name, stage in sorted(info['stages'].items(), key=lambda item: -item[1]['seconds']):
+        print('%-40s %9d %11.4f %11.4f' % (name, stage['calls'], stage['seconds'], 1e3 * stage['mean']), file=stream)
+    for name, total in info['counts'].items():
+        print('%-40s %9d' % (name, total), file=stream)
+    for name, entry in info['steps'].items():
+        print('%-40s %9d trajectories, %.1f steps on average (%d to %d)' %
+              (name, entry['trajectories'], entry['mean'], entry['min'], entry['max']), file=stream)
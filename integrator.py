@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+"""Numerical integration of many launches at once -
+    Integrates the motion of every launch together with NumPy arrays of states
+    (x, y, vx, vy), with forces that have no closed form:
+    - quadratic drag, 0.5 rho Cd A |v - w| (v - w) / m, or the linear drag of motion.Drag
+    - wind w: constant, or a function of the time and the position
+    - air density rho: constant (p), or a function of the height (exponential_density)
+
+    method 'rk4' takes fixed steps of dt, 'rk45' (Dormand-Prince) adapts the step of
+    each launch to the tolerances rtol and atol. A launch is retired from the arrays as
+    soon as it falls to the ground, where its landing point is found on the cubic
+    between the last two states, so each step only costs as much as the launches still
+    in the air.
+
+    With record=True the points of every trajectory are also returned as
+    (offsets, t, x, y), the layout of storage.py, which level.Level.collide and
+    spatial.SegmentIndex take directly.
+
+    Usage (landing of the launches of an input file, with wind):
+        python integrator.py [input file] [--wind m/s] [--method rk4|rk45] [--linear]
+
+"""
+
+import argparse
+import sys
+from collections import namedtuple
+
+from numpy import arange
+from numpy import argsort
+from numpy import array
+from numpy import asarray
+from numpy import bincount
+from numpy import broadcast_arrays
+from numpy import concatenate
+from numpy import cos
+from numpy import cumsum
+from numpy import deg2rad
+from numpy import errstate
+from numpy import exp
+from numpy import full
+from numpy import isfinite
+from numpy import maximum
+from numpy import minimum
+from numpy import nan
+from numpy import ones
+from numpy import sin
+from numpy import sqrt
+from numpy import where
+from numpy import zeros
+
+import instrument
+from projectile import g, p, basket_bottom
+
+# Landing of each launch, one value per launch
+#   landing_x   - horizontal position where it reached the ground (nan if it did not)
+#   flight_time - time when it reached the ground (or max_time)
+#   vx, vy      - velocity when it reached the ground
+#   landed      - False if it was still in the air at max_time or after max_steps, or
+#                 if its state stopped being finite (then every other value is nan)
+#   steps       - number of accepted steps
+Flight = namedtuple('Flight', ['landing_x', 'flight_time', 'vx', 'vy', 'landed', 'steps'])
+
+# Dormand-Prince coefficients: stages, 5th order solution and error estimate
+_c = (0.0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1.0)
+_a = ((),
+      (1 / 5,),
+      (3 / 40, 9 / 40),
+      (44 / 45, -56 / 15, 32 / 9),
+      (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+      (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656))
+_b = (35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84)
+_e = (71 / 57600, 0.0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40)
+
+
+def exponential_density(scale_height=8500.0, sea_level=p):
+    # Density of an isothermal atmosphere, as a function of the height in meters
+    def density(y):
+        return sea_level * exp(-y / scale_height)
+    return density
+
+
+class Forces:
+    """ Acceleration of the objects
+        - drag is 'quadratic', 'linear' (the model of motion.Drag: |g| / vt (v - w),
+          with vt from the local density) or None
+        - wind is None, a horizontal speed, a pair (wx, wy), or a function (t, x, y)
+          returning wx and wy for arrays of launches
+        - density is None (constant p) or a function of the height
+    """
+    def __init__(self, drag='quadratic', wind=None, density=None):
+        if drag not in ('quadratic', 'linear', None):
+            raise ValueError('Unknown drag: %s' % drag)
+        self.drag = drag
+        self.wind = wind
+        self.density = density
+
+    def wind_at(self, t, x, y):
+        # Wind velocity at the given times and positions
+        if self.wind is None:
+            return 0.0, 0.0
+        if callable(self.wind):
+            return self.wind(t, x, y)
+        if len(asarray(self.wind).shape) == 0:
+            return float(self.wind), 0.0
+        return self.wind[0], self.wind[1]
+
+    def __call__(self, t, state, c):
+        # Derivative of the states (4, n), c is 0.5 Cd A / m of each launch
+        x, y, vx, vy = state
+        if self.drag is None:
+            return array([vx, vy, zeros(len(x)), full(len(x), g)])
+        rho = p if self.density is None else self.density(y)
+        wx, wy = self.wind_at(t, x, y)
+        ux, uy = vx - wx, vy - wy
+        if self.drag == 'quadratic':
+            k = rho * c * sqrt(ux * ux + uy * uy)
+        else:
+            k = sqrt(abs(g) * rho * c)
+        return array([vx, vy, -k * ux, g - k * uy])
+
+
+def _hermite(s, h, a, da, b, db):
+    # Cubic through a (slope da) at s = 0 and b (slope db) at s = 1, over a step h;
+    # returns the value and the derivative in time
+    s2, s3 = s * s, s * s * s
+    value = (2 * s3 - 3 * s2 + 1) * a + (s3 - 2 * s2 + s) * h * da + (3 * s2 - 2 * s3) * b + (s3 - s2) * h * db
+    slope = ((6 * s2 - 6 * s) * a + (3 * s2 - 4 * s + 1) * h * da + (6 * s - 6 * s2) * b + (3 * s2 - 2 * s) * h * db)
+    return value, slope / h
+
+
+def _landing(state, new, f0, f1, h, ground, iterations=60):
+    # Fraction of the step where the cubic of the height crosses the ground (bisection),
+    # and the position and velocity there
+    lo = zeros(h.shape)
+    hi = ones(h.shape)
+    for i in range(iterations):
+        mid = 0.5 * (lo + hi)
+        above = _hermite(mid, h, state[1], f0[1], new[1], f1[1])[0] > ground
+        lo = where(above, mid, lo)
+        hi = where(above, hi, mid)
+    x, vx = _hermite(hi, h, state[0], f0[0], new[0], f1[0])
+    vy = _hermite(hi, h, state[1], f0[1], new[1], f1[1])[1]
+    return hi, x, vx, vy
+
+
+@instrument.timed()
+def integrate(v0, deg, Cd, A, m, x0=0.0, y0=0.0, forces=None, method='rk45', dt=0.01, rtol=1e-6, atol=1e-6,
+              max_step=1.0, max_time=1000.0, max_steps=100000, ground=basket_bottom, record=False):
+    """ Integrates many launches at once until they fall to the ground
+        - every parameter may be a scalar or an array, they are broadcast together as in
+          motion.DragBatch; forces is a Forces (quadratic drag without wind by default)
+        - method 'rk4' takes steps of dt, 'rk45' starts with dt and adapts the step of
+          each launch to rtol and atol, up to max_step
+        - launches still in the air at max_time, or after max_steps steps (accepted or
+          not), are stopped there (landed is False)
+        - a launch whose state or error estimate stops being finite is retired with nan
+          values (landed is False); m must be positive, Cd and A must not be negative
+        - returns a Flight, and with record=True also (offsets, t, x, y) with the points
+          of every trajectory, ending with its landing point
+    """
+    v0, deg, Cd, A, m, x0, y0 = [a.ravel() for a in
+                                 broadcast_arrays(*[asarray(a, dtype=float) for a in (v0, deg, Cd, A, m, x0, y0)])]
+    if method not in ('rk4', 'rk45'):
+        raise ValueError('Unknown method: %s' % method)
+    if (m <= 0).any() or (Cd < 0).any() or (A < 0).any():
+        raise ValueError('The mass must be positive, Cd and A must not be negative')
+    forces = Forces() if forces is None else forces
+    n = v0.size
+
+    theta = deg2rad(deg)
+    state = array([x0, y0, v0 * cos(theta), v0 * sin(theta)]).reshape(4, n)
+    t = zeros(n)
+    h = full(n, float(dt))
+
+    landing_x = full(n, nan)
+    flight_time = full(n, nan)
+    vx_end = full(n, nan)
+    vy_end = full(n, nan)
+    landed = zeros(n, dtype=bool)
+    steps = zeros(n, dtype=int)
+    attempts = zeros(n, dtype=int)
+    points = [(arange(n), t.copy(), x0.copy(), y0.copy())] if record else None
+
+    # the launches still in the air, the arrays below only hold those
+    live = arange(n)
+    c = 0.5 * Cd * A / m
+    while live.size:
+        f0 = forces(t, state, c)
+        if method == 'rk4':
+            k2 = forces(t + 0.5 * h, state + 0.5 * h * f0, c)
+            k3 = forces(t + 0.5 * h, state + 0.5 * h * k2, c)
+            k4 = forces(t + h, state + h * k3, c)
+            new = state + h / 6 * (f0 + 2 * k2 + 2 * k3 + k4)
+            accept = ones(live.size, dtype=bool)
+            h_next = h
+        else:
+            k = [f0]
+            for stage in range(1, 6):
+                increment = sum(a * kj for a, kj in zip(_a[stage], k))
+                k.append(forces(t + _c[stage] * h, state + h * increment, c))
+            new = state + h * sum(b * kj for b, kj in zip(_b, k))
+            k.append(forces(t + h, new, c))
+            error = h * sum(e * kj for e, kj in zip(_e, k))
+            scale = atol + rtol * maximum(abs(state), abs(new))
+            with errstate(divide='ignore', invalid='ignore'):
+                norm = sqrt(((error / scale) ** 2).mean(axis=0))
+            accept = norm <= 1.0
+            with errstate(divide='ignore'):
+                factor = minimum(maximum(0.9 * norm ** -0.2, 0.2), 5.0)
+            h_next = minimum(h * factor, max_step)
+
+        failed = ~isfinite(new).all(axis=0)
+        if method == 'rk45':
+            failed |= ~isfinite(norm)
+        accept &= ~failed
+
+        t_new = t + h
+        down = accept & ~(new[1] > ground)
+        steps[live] += accept
+        attempts += 1
+        # the time and step limits hold even when the step is rejected, so a step size
+        # that keeps shrinking cannot loop forever
+        t_kept = where(accept, t_new, t)
+        timeout = ~down & ~failed & ((t_kept >= max_time) | (attempts >= max_steps))
+
+        if down.any():
+            f1 = k[6][:, down] if method == 'rk45' else forces(t_new[down], new[:, down], c[down])
+            s, x, vx, vy = _landing(state[:, down], new[:, down], f0[:, down], f1, h[down], ground)
+            ids = live[down]
+            landing_x[ids] = x
+            flight_time[ids] = t[down] + s * h[down]
+            vx_end[ids] = vx
+            vy_end[ids] = vy
+            landed[ids] = True
+            if record:
+                points.append((ids, flight_time[ids], x, full(ids.size, float(ground))))
+        if record:
+            moved = accept & ~down
+            points.append((live[moved], t_new[moved], new[0, moved], new[1, moved]))
+
+        # keep the accepted steps, retire the launches that are done
+        state = where(accept, new, state)
+        t = t_kept
+        h = h_next
+        if timeout.any():
+            ids = live[timeout]
+            flight_time[ids] = t[timeout]
+            vx_end[ids] = state[2, timeout]
+            vy_end[ids] = state[3, timeout]
+        keep = ~(down | timeout | failed)
+        live, state, t, h, c = live[keep], state[:, keep], t[keep], h[keep], c[keep]
+        attempts = attempts[keep]
+    instrument.steps('integrator.integrate', steps)
+
+    flight = Flight(landing_x, flight_time, vx_end, vy_end, landed, steps)
+    if not record:
+        return flight
+    ids, t, x, y = [concatenate(column) for column in zip(*points)]
+    order = argsort(ids, kind='stable')
+    offsets = concatenate([[0], cumsum(bincount(ids, minlength=n))])
+    return flight, (offsets, t[order], x[order], y[order])
+
+
+def main(argv=None):
+    from level import basket_level
+    from read_data import read_data, ReadError
+    from runner import launch_columns
+
+    parser = argparse.ArgumentParser(description='Landing of each launch, integrated numerically.')
+    parser.add_argument('input', nargs='?', default='projectile_input.csv', help='projectile input file')
+    parser.add_argument('--wind', type=float, default=0.0, help='horizontal wind speed, m/s')
+    parser.add_argument('--method', choices=('rk4', 'rk45'), default='rk45', help='integration method')
+    parser.add_argument('--linear', action='store_true', help='linear drag, as motion.Drag')
+    parser.add_argument('--altitude', action='store_true', help='air density decreasing with the height')
+    args = parser.parse_args(argv)
+
+    reader = read_data()
+    try:
+        param_input, names = reader.read_file(args.input)
+    except ReadError as error:
+        print(error)
+        sys.exit(1)
+    columns = launch_columns(param_input)
+    forces = Forces('linear' if args.linear else 'quadratic', args.wind or None,
+                    exponential_density() if args.altitude else None)
+    flight, trajectories = integrate(*columns.T, forces=forces, method=args.method, record=True)
+    collisions = basket_level().collide(trajectories)
+    for i, name in enumerate(names):
+        print('%s: %s, lands at x = %.2f m after %.2f s (%d steps)' % (name, collisions.result[i],
+                                                                      flight.landing_x[i], flight.flight_time[i],
+                                                                      flight.steps[i]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+"""Levels made of segments -
+    A Level holds any number of segments (the bars and floor of baskets, walls and
+    obstacles) that stop an object when its trajectory touches them. The collision
+    engine tests whole trajectories, or batches of them, against every segment:
+
+    - broad phase: the segments of the level are put in the cells of a uniform grid,
+      and each step of a trajectory only looks up the cells of its bounding box; the
+      steps outside the bounding box of the level are dropped at once
+    - narrow phase: the remaining (step, segment) pairs whose bounding boxes overlap are
+      tested with the vectorized segment intersection of spatial.intersect
+
+    so the work grows with the number of steps near a segment, not with the number of
+    segments times the number of steps. The first segment touched along each trajectory
+    decides the result: 'Win' if it belongs to a basket (its floor or the inside of its
+    right bar), 'Fail' for walls, obstacles, the outside bar of a basket, or a landing
+    on the ground.
+
+    basket_level() is the level of projectile.py (the basket between left_bar and
+    right_bar), whose results match motion.Drag.
+
+    Usage (results of the launches of an input file on the default level):
+        python level.py [input file]
+
+"""
+
+import sys
+from collections import namedtuple
+
+from numpy import arange
+from numpy import array
+from numpy import asarray
+from numpy import broadcast_arrays
+from numpy import column_stack
+from numpy import concatenate
+from numpy import cumsum
+from numpy import empty_like
+from numpy import floor
+from numpy import full
+from numpy import int64
+from numpy import isfinite
+from numpy import lexsort
+from numpy import maximum
+from numpy import median
+from numpy import minimum
+from numpy import nan
+from numpy import recarray
+from numpy import repeat
+from numpy import searchsorted
+from numpy import unique
+from numpy import where
+from numpy import zeros
+
+import instrument
+import runner
+from projectile import motion, basket_bottom, basket_height, left_bar, right_bar
+from spatial import intersect, _cells, _links, _ranges
+from storage import pack
+
+# First collision of each trajectory, one value per trajectory
+#   result  - 'Win' if the trajectory was stopped by a segment of a basket, 'Fail' otherwise
+#   target  - basket that was scored (-1 if none)
+#   segment - segment of the level that stopped the trajectory (-1 if it hit nothing)
+#   step    - index of the last point of the trajectory before the collision (the last
+#             point of the trajectory if it hit nothing)
+#   t, x, y - time and position of the collision (of the last point if it hit nothing)
+Collisions = namedtuple('Collisions', ['result', 'target', 'segment', 'step', 't', 'x', 'y'])
+
+
+def _cell(v, origin, cell):
+    # Grid column (or row) of the coordinates v
+    return floor((v - origin) / cell).astype(int64)
+
+
+class Level:
+    """ Geometry of a level: segments that stop the objects
+        - add(x1, y1, x2, y2, kind, target) adds a wall or an obstacle (target -1), or
+          a segment of a basket; add_basket adds the bars and the floor of a basket
+        - ground is the height where the trajectories end if they hit nothing
+        - cell is the side of the cells of the broad phase grid, by default the median
+          length of the segments
+        - segments() returns them as a record array with the fields x1, y1, x2, y2,
+          target and kind
+    """
+    def __init__(self, ground=basket_bottom, cell=None):
+        self.ground = ground
+        self.cell = cell
+        self.baskets = 0
+        self._segments = []
+        self._grid = None
+
+    def __len__(self):
+        return len(self._segments)
+
+    def add(self, x1, y1, x2, y2, kind='wall', target=-1):
+        # Adds a segment and returns its index
+        self._segments.append((float(x1), float(y1), float(x2), float(y2), int(target), kind))
+        self._grid = None
+        return len(self._segments) - 1
+
+    def add_basket(self, left, right, height, bottom=None):
+        """ Adds a basket between left and right with bars of the given height and
+            returns its target number
+            - the object scores by falling on the floor or hitting the right bar from
+              inside; hitting the left bar from outside fails, as in motion.Drag
+        """
+        bottom = self.ground if bottom is None else bottom
+        target = self.baskets
+        self.baskets += 1
+        self.add(left, bottom, left, height, 'bar')
+        self.add(left, bottom, right, bottom, 'floor', target)
+        self.add(right, bottom, right, height, 'bar', target)
+        return target
+
+    def segments(self):
+        # Record array of the segments
+        dtype = [('x1', float), ('y1', float), ('x2', float), ('y2', float), ('target', int64), ('kind', 'U8')]
+        return array(self._segments, dtype=dtype).view(recarray)
+
+    def _prepare(self):
+        # Columns of the segments and the broad phase grid, built again after add
+        if self._grid is not None:
+            return self._grid
+        segments = self.segments()
+        x1, y1, x2, y2 = [asarray(segments[name], dtype=float) for name in ('x1', 'y1', 'x2', 'y2')]
+        if len(segments):
+            box = (minimum(x1, x2).min(), minimum(y1, y2).min(), maximum(x1, x2).max(), maximum(y1, y2).max())
+            cell = self.cell or median(maximum(abs(x2 - x1), abs(y2 - y1)))
+        else:
+            box, cell = (0.0, 0.0, 0.0, 0.0), 1.0
+        cell = float(max(cell, 1e-9))
+        ny = int((box[3] - box[1]) // cell) + 1
+
+        owner, key = _cells(_cell(minimum(x1, x2), box[0], cell), _cell(maximum(x1, x2), box[0], cell),
+                            _cell(minimum(y1, y2), box[1], cell), _cell(maximum(y1, y2), box[1], cell), ny)
+        order = key.argsort(kind='stable')
+        self._grid = {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'target': asarray(segments['target']),
+                      'box': box, 'cell': cell, 'nx': int((box[2] - box[0]) // cell) + 1, 'ny': ny,
+                      'keys': key[order], 'owners': owner[order]}
+        return self._grid
+
+    def _hits(self, x1, y1, x2, y2):
+        # Broad and narrow phase for steps of trajectories: returns the step (position in
+        # the arrays), the segment of the level and the fraction s of the step of each hit
+        grid = self._prepare()
+        x_low, y_low, x_high, y_high = grid['box']
+        near = ((maximum(x1, x2) >= x_low) & (minimum(x1, x2) <= x_high) &
+                (maximum(y1, y2) >= y_low) & (minimum(y1, y2) <= y_high))
+        steps = near.nonzero()[0]
+        if not len(steps) or not len(self):
+            return zeros(0, dtype=int64), zeros(0, dtype=int64), zeros(0)
+
+        a, b, c, d = x1[steps], y1[steps], x2[steps], y2[steps]
+        cell = grid['cell']
+        # the cells of the steps, clipped to the grid of the level
+        ix0 = maximum(_cell(minimum(a, c), x_low, cell), 0)
+        ix1 = minimum(_cell(maximum(a, c), x_low, cell), grid['nx'] - 1)
+        iy0 = maximum(_cell(minimum(b, d), y_low, cell), 0)
+        iy1 = minimum(_cell(maximum(b, d), y_low, cell), grid['ny'] - 1)
+        owner, key = _cells(ix0, ix1, iy0, iy1, grid['ny'])
+        starts = searchsorted(grid['keys'], key, side='left')
+        stops = searchsorted(grid['keys'], key, side='right')
+        step = owner[repeat(arange(len(key)), stops - starts)]
+        segment = grid['owners'][_ranges(starts, stops)]
+
+        # keep the pairs whose bounding boxes overlap, then intersect them
+        sx1, sy1, sx2, sy2 = grid['x1'][segment], grid['y1'][segment], grid['x2'][segment], grid['y2'][segment]
+        a, b, c, d = a[step], b[step], c[step], d[step]
+        overlap = ((maximum(a, c) >= minimum(sx1, sx2)) & (minimum(a, c) <= maximum(sx1, sx2)) &
+                   (maximum(b, d) >= minimum(sy1, sy2)) & (minimum(b, d) <= maximum(sy1, sy2)))
+        step, segment = step[overlap], segment[overlap]
+        hit, s = intersect(a[overlap], b[overlap], c[overlap], d[overlap],
+                           sx1[overlap], sy1[overlap], sx2[overlap], sy2[overlap])
+        return steps[step[hit]], segment[hit], s[hit]
+
+    @instrument.timed()
+    def collide(self, trajectories, chunk_size=1 << 20):
+        """ First collision of each trajectory with the level, as Collisions
+            - trajectories is a storage.TrajectoryCollection or a storage.TrajectoryFile
+              (or anything with their arrays() method), or a tuple (offsets, t, x, y)
+            - the steps are tested chunk_size at a time
+            - a trajectory that starts on a segment is not stopped by it at its first point
+        """
+        arrays = trajectories.arrays() if hasattr(trajectories, 'arrays') else trajectories
+        offsets, t, x, y = arrays
+        offsets = asarray(offsets)
+        n = len(offsets) - 1
+        points = len(x)
+        valid = _links(offsets, points)
+
+        found_step, found_segment, found_s = [], [], []
+        for lo in range(0, len(valid), chunk_size):
+            hi = min(lo + chunk_size, len(valid))
+            xs, ys = asarray(x[lo:hi + 1], dtype=float), asarray(y[lo:hi + 1], dtype=float)
+            x1, y1, x2, y2 = xs[:-1], ys[:-1], xs[1:], ys[1:]
+            keep = valid[lo:hi] & isfinite(x1) & isfinite(y1) & isfinite(x2) & isfinite(y2)
+            x1, y1, x2, y2 = [where(keep, v, nan) for v in (x1, y1, x2, y2)]
+            step, segment, s = self._hits(x1, y1, x2, y2)
+            found_step.append(step + lo)
+            found_segment.append(segment)
+            found_s.append(s)
+
+        step = concatenate(found_step) if found_step else zeros(0, dtype=int64)
+        segment = concatenate(found_segment) if found_segment else zeros(0, dtype=int64)
+        s = concatenate(found_s) if found_s else zeros(0)
+        trajectory = searchsorted(offsets, step, side='right') - 1
+        start = (step == offsets[trajectory]) & (s == 0)
+        step, segment, s, trajectory = step[~start], segment[~start], s[~start], trajectory[~start]
+
+        # the first hit of each trajectory: lowest step, then lowest fraction of the step
+        order = lexsort((s, step))
+        trajectory, first = unique(trajectory[order], return_index=True)
+        step, segment, s = step[order][first], segment[order][first], s[order][first]
+
+        # trajectories without hit end at their last point
+        last = offsets[1:] - 1
+        empty = last < offsets[:-1]
+        result_step = where(empty, 0, last - offsets[:-1])
+        if points:
+            index = where(empty, 0, last)
+            result_t, result_x, result_y = [where(empty, nan, asarray(v[index], dtype=float)) for v in (t, x, y)]
+        else:
+            result_t, result_x, result_y = full(n, nan), full(n, nan), full(n, nan)
+        result_segment = full(n, -1, dtype=int64)
+
+        t1, t2 = asarray(t[step], dtype=float), asarray(t[step + 1], dtype=float)
+        x1, x2 = asarray(x[step], dtype=float), asarray(x[step + 1], dtype=float)
+        y1, y2 = asarray(y[step], dtype=float), asarray(y[step + 1], dtype=float)
+        result_step[trajectory] = step - offsets[trajectory]
+        result_segment[trajectory] = segment
+        result_t[trajectory] = t1 + s * (t2 - t1)
+        result_x[trajectory] = x1 + s * (x2 - x1)
+        result_y[trajectory] = y1 + s * (y2 - y1)
+
+        target = where(result_segment >= 0, self._prepare()['target'][maximum(result_segment, 0)], -1)
+        result = where(target >= 0, 'Win', 'Fail')
+        return Collisions(result, target, result_segment, result_step, result_t, result_x, result_y)
+
+    def collide_path(self, t, x, y):
+        # First collision of one trajectory, as Collisions of scalars
+        collisions = self.collide((array([0, len(x)]), asarray(t), asarray(x), asarray(y)))
+        return Collisions(*[value[0] for value in collisions])
+
+    @instrument.timed()
+    def launch(self, v0, deg, Cd, A, m, x0=0.0, y0=0.0, dt=0.1, chunk_size=4096, max_points=1 << 22):
+        """ Launches many objects at once on the level, with the Drag motion
+            - the parameters are broadcast together as in motion.DragBatch
+            - the trajectories are computed by motion.DragBatch until they fall to the
+              ground, then tested with collide; chunk_size launches are kept in memory at
+              a time, split by flight length as in runner._groups (max_points)
+        """
+        launches = column_stack([a.ravel() for a in
+                                 broadcast_arrays(*[asarray(a, dtype=float) for a in (v0, deg, Cd, A, m, x0, y0)])])
+        heights = launches.copy()
+        heights[:, 6] -= self.ground  # the flight ends at the ground instead of basket_bottom
+        parts = []
+        for lo in range(0, len(launches), chunk_size):
+            chunk = launches[lo:lo + chunk_size]
+            groups = runner._groups(heights[lo:lo + chunk_size], dt, max_points)
+            found = []
+            for rows in groups:
+                T, X, Y, landing, outcome = motion().DragBatch(*chunk[rows].T, dt=dt, ground=self.ground)
+                t, x, y, counts = pack(T, X, Y, landing)
+                offsets = concatenate([[0], cumsum(counts)])
+                found.append(self.collide((offsets, t, x, y)))
+            if len(groups) == 1:
+                parts.append(found[0])
+                continue
+            # back to the order of the launches
+            rows = concatenate(groups)
+            inverse = empty_like(rows)
+            inverse[rows] = arange(len(rows))
+            parts.append(Collisions(*[concatenate(values)[inverse] for values in zip(*found)]))
+        if not parts:
+            return Collisions(*[zeros(0) for field in Collisions._fields])
+        return Collisions(*[concatenate(values) for values in zip(*parts)])
+
+
+def basket_level():
+    # The level of projectile.py: one basket between left_bar and right_bar
+    level = Level(ground=basket_bottom)
+    level.add_basket(left_bar, right_bar, basket_height, basket_bottom)
+    return level
+
+
+if __name__ == '__main__':
+    from read_data import read_data, ReadError
+    from runner import launch_columns
+
+    reader = read_data()
+    try:
+        param_input, names = reader.read_file(sys.argv[1] if len(sys.argv) > 1 else 'projectile_input.csv')
+    except ReadError as error:
+        print(error)
+        sys.exit(1)
+    columns = launch_columns(param_input)
+    collisions = basket_level().launch(*columns.T)
+    for i, name in enumerate(names):
+        print('%s: %s, stopped at x = %.2f m after %.2f s' % (name, collisions.result[i], collisions.x[i],
+                                                              collisions.t[i]))
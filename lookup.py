@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+"""Precomputed outcome tables -
+    For each preset object (objects.types, the func_dict of main.py), a dense grid over
+    the launch speed and angle holds the exact results of the closed form of the Drag
+    motion: the height at which the object crosses each bar, where it lands, and what
+    kind of throw it is. Outcome queries are then answered by bilinear interpolation,
+    with an error bound, instead of computing the motion.
+
+    A table is a directory of .npy files (like storage.py), memory-mapped when loaded:
+
+    <directory>/<type>/v0.npy, deg.npy                  axes of the grid
+    <directory>/<type>/y_left.npy, y_right.npy          heights at the bars (nan if not reached)
+    <directory>/<type>/landing_x.npy, kind.npy          landing position and kind of throw
+    <directory>/<type>/bound_*.npy                      interpolation error bound of each cell
+    <directory>/<type>/spec.npy                         the object (objects.spec_dtype)
+
+    A query is answered exactly (by evaluating the closed form) when its cell is near a
+    decision boundary: the corners of the cell are not the same kind of throw, or an
+    interpolated height is within its error bound of the top of a bar. Queries outside
+    the grid are answered exactly too.
+
+    Usage:
+        python lookup.py build directory [--speeds N] [--angles N] [--max-speed v]
+        python lookup.py query directory obj_type v0 deg
+
+"""
+
+import argparse
+import os
+import sys
+from collections import namedtuple
+
+from numpy import asarray
+from numpy import broadcast_arrays
+from numpy import clip
+from numpy import cos
+from numpy import deg2rad
+from numpy import empty
+from numpy import errstate
+from numpy import exp
+from numpy import floor
+from numpy import full
+from numpy import inf
+from numpy import int8
+from numpy import isinf
+from numpy import isnan
+from numpy import load
+from numpy import linspace
+from numpy import log1p
+from numpy import maximum
+from numpy import meshgrid
+from numpy import nan
+from numpy import recarray
+from numpy import save
+from numpy import sin
+from numpy import sqrt
+from numpy import where
+from numpy import zeros
+
+import instrument
+import objects as obj
+import projectile as proj
+from projectile import g, p, basket_height, left_bar, right_bar
+
+# Kinds of throw, in the order the object meets the basket
+LANDS_SHORT = 0  # lands before the left bar
+HITS_LEFT = 1    # hits the outside of the left bar, Fail
+FALLS_IN = 2     # goes over the left bar and lands in the basket, Win
+HITS_RIGHT = 3   # goes over the left bar and hits the inside of the right bar, Win
+GOES_OVER = 4    # goes over both bars, Fail
+
+# Answer of a query, every field is an array with the shape of the query: the result, the
+# heights at the bars (nan if a corner of the cell does not reach the bar), the landing
+# position, the error bound of each of them, and whether it was computed exactly
+Lookup = namedtuple('Lookup', ['result', 'y_left', 'y_right', 'landing_x', 'y_left_error', 'y_right_error',
+                               'landing_error', 'exact'])
+
+_columns = ('y_left', 'y_right', 'landing_x')
+
+
+def _landing_x(spec, v0, deg):
+    # Position where the free flight of the closed form reaches the ground (y = 0)
+    theta = deg2rad(asarray(deg, dtype=float))
+    v0 = asarray(v0, dtype=float)
+    m, A, Cd, x0, y0 = [asarray(a, dtype=float) for a in (spec.m, spec.A, spec.Cd, spec.x0, spec.y0)]
+    with errstate(divide='ignore'):
+        vt = sqrt((2 * m * abs(g)) / (p * A * Cd))
+    vt, v0, theta, x0, y0 = broadcast_arrays(vt, v0, theta, x0, y0)
+    vx = v0 * cos(theta)
+    vy = v0 * sin(theta)
+
+    with errstate(divide='ignore', invalid='ignore'):
+        # vacuum parabola (Cd = 0)
+        t_vacuum = (vy + sqrt(vy * vy + 2 * abs(g) * y0)) / abs(g)
+
+        # with drag, y(t) falls after the apex, bisection between the apex and an upper
+        # bound of the flight time (y <= y0 + cy - vt * t, as in motion.Drag)
+        cy = (vt / abs(g)) * (vy + vt)
+        lo = where(vy > 0, (vt / abs(g)) * log1p(maximum(vy, 0) / vt), 0.0)
+        hi = maximum((y0 + maximum(cy, 0.0)) / vt, lo)
+        for i in range(200):
+            mid = 0.5 * (lo + hi)
+            y = y0 + cy * (1 - exp(g * mid / vt)) - vt * mid
+            lo = where(y > 0, mid, lo)
+            hi = where(y > 0, hi, mid)
+        x_drag = x0 + ((vx * vt) / abs(g)) * (1 - exp(g * hi / vt))
+
+    return where(isinf(vt), x0 + vx * t_vacuum, x_drag)
+
+
+def _kind(y_left, y_right):
+    # Kind of throw from the heights at the bars, with the rules of motion.classify
+    passed_left = y_left > basket_height
+    kind = where(passed_left, where(y_right > basket_height, GOES_OVER, where(y_right >= 0, HITS_RIGHT, FALLS_IN)),
+                 where(y_left >= 0, HITS_LEFT, LANDS_SHORT))
+    return kind.astype(int8)
+
+
+@instrument.timed()
+def exact(spec, v0, deg):
+    """ Exact answer from the closed form: result, heights at the bars, landing position
+        (the bar, if the object hits one) and kind of throw, for arrays of launches
+    """
+    result, y_left, y_right = proj.motion().classify(spec, v0, deg)
+    y_left, y_right = asarray(y_left), asarray(y_right)
+    kind = _kind(y_left, y_right)
+    landing_x = where(kind == HITS_LEFT, left_bar, where(kind == HITS_RIGHT, right_bar, _landing_x(spec, v0, deg)))
+    return asarray(result), y_left, y_right, landing_x, kind
+
+
+def _bound(f):
+    # Interpolation error bound of each cell of a grid, from the second differences of f:
+    # bilinear interpolation is off by at most (h^2 / 8) |f''| along each axis, and twice
+    # that is kept as a margin; inf where a corner is not finite
+    d2 = zeros(f.shape)
+    with errstate(invalid='ignore'):
+        for axis in (0, 1):
+            second = abs(f.take(range(2, f.shape[axis]), axis) - 2 * f.take(range(1, f.shape[axis] - 1), axis)
+                         + f.take(range(0, f.shape[axis] - 2), axis))
+            if axis == 0:
+                d2[1:-1] += second
+                d2[0] += second[0]
+                d2[-1] += second[-1]
+            else:
+                d2[:, 1:-1] += second
+                d2[:, 0] += second[:, 0]
+                d2[:, -1] += second[:, -1]
+    d2 = where(isnan(d2), inf, d2)
+    corners = maximum(maximum(d2[:-1, :-1], d2[1:, :-1]), maximum(d2[:-1, 1:], d2[1:, 1:]))
+    return 2 * corners / 8
+
+
+@instrument.timed()
+def build(spec, directory, speeds=512, angles=512, min_speed=1.0, max_speed=400.0, min_deg=0.0, max_deg=90.0):
+    """ Computes the table of an object (a spec record or an ObjProperties) and writes it
+        to directory, over speeds x angles launches between the given limits
+    """
+    os.makedirs(directory, exist_ok=True)
+    v0 = linspace(min_speed, max_speed, speeds)
+    deg = linspace(min_deg, max_deg, angles)
+    V, D = meshgrid(v0, deg, indexing='ij')
+    spec = obj.makeSpecs(spec.Cd, spec.A, spec.x0, spec.y0, spec.m)
+    result, y_left, y_right, landing_x, kind = exact(spec[0], V, D)
+
+    columns = {'v0': v0, 'deg': deg, 'y_left': y_left, 'y_right': y_right, 'landing_x': landing_x, 'kind': kind,
+               'spec': spec}
+    for name in _columns:
+        columns['bound_' + name] = _bound(columns[name])
+    for name, values in columns.items():
+        save(os.path.join(directory, name + '.npy'), values)
+
+
+def build_presets(directory, types=None, **grid):
+    # Builds the table of every preset object type (by default all of objects.types)
+    for obj_type in (obj.types if types is None else types):
+        build(obj.types[obj_type](), os.path.join(directory, str(obj_type)), **grid)
+
+
+class OutcomeTable:
+    """ Memory-mapped table of one object, see build
+        - query(v0, deg) answers arrays of launches at once, returning a Lookup
+    """
+    def __init__(self, directory, mmap_mode='r'):
+        def column(name):
+            return load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+        self.v0 = load(os.path.join(directory, 'v0.npy'))
+        self.deg = load(os.path.join(directory, 'deg.npy'))
+        self.spec = load(os.path.join(directory, 'spec.npy')).view(recarray)[0]
+        self.columns = {name: column(name) for name in _columns}
+        self.bounds = {name: column('bound_' + name) for name in _columns}
+        self.kind = column('kind')
+
+    @instrument.timed()
+    def query(self, v0, deg):
+        v0, deg = broadcast_arrays(asarray(v0, dtype=float), asarray(deg, dtype=float))
+        shape = v0.shape
+        v0, deg = v0.ravel(), deg.ravel()
+
+        # cell of each launch and position inside it
+        dv = (self.v0[-1] - self.v0[0]) / (len(self.v0) - 1)
+        da = (self.deg[-1] - self.deg[0]) / (len(self.deg) - 1)
+        u = (v0 - self.v0[0]) / dv
+        w = (deg - self.deg[0]) / da
+        inside = (u >= 0) & (u <= len(self.v0) - 1) & (w >= 0) & (w <= len(self.deg) - 1)
+        i = clip(floor(u).astype(int), 0, len(self.v0) - 2)
+        j = clip(floor(w).astype(int), 0, len(self.deg) - 2)
+        u = u - i
+        w = w - j
+
+        values = {}
+        errors = {}
+        for name in _columns:
+            f = self.columns[name]
+            values[name] = ((1 - u) * (1 - w) * f[i, j] + u * (1 - w) * f[i + 1, j] + (1 - u) * w * f[i, j + 1]
+                            + u * w * f[i + 1, j + 1])
+            errors[name] = self.bounds[name][i, j]
+
+        kinds = self.kind[i, j], self.kind[i + 1, j], self.kind[i, j + 1], self.kind[i + 1, j + 1]
+        kind = kinds[0]
+        same = (kinds[0] == kinds[1]) & (kinds[0] == kinds[2]) & (kinds[0] == kinds[3])
+        # a height far from the top of the bar, or a bar the whole cell never reaches
+        with errstate(invalid='ignore'):
+            clear_left = (abs(values['y_left'] - basket_height) > errors['y_left']) | (kind == LANDS_SHORT)
+            clear_right = ((abs(values['y_right'] - basket_height) > errors['y_right'])
+                           | (kind == LANDS_SHORT) | (kind == HITS_LEFT) | (kind == FALLS_IN))
+        certain = inside & same & clear_left & clear_right
+
+        # the position of the bar an object hits is exact
+        hits = (kind == HITS_LEFT) | (kind == HITS_RIGHT)
+        landing_x = where(kind == HITS_LEFT, left_bar, where(kind == HITS_RIGHT, right_bar, values['landing_x']))
+        landing_error = where(hits, 0.0, errors['landing_x'])
+        y_left, y_right = values['y_left'], values['y_right']
+        y_left_error, y_right_error = errors['y_left'], errors['y_right']
+        result = where((kind == FALLS_IN) | (kind == HITS_RIGHT), 'Win', 'Fail')
+
+        uncertain = ~certain
+        instrument.count('lookup.exact', uncertain.sum())
+        if uncertain.any():
+            r, yl, yr, lx, k = exact(self.spec, v0[uncertain], deg[uncertain])
+            result[uncertain] = r
+            y_left[uncertain] = yl
+            y_right[uncertain] = yr
+            landing_x[uncertain] = lx
+            for error in (y_left_error, y_right_error, landing_error):
+                error[uncertain] = 0.0
+
+        return Lookup(*[a.reshape(shape)[()] for a in (result, y_left, y_right, landing_x, y_left_error,
+                                                       y_right_error, landing_error, uncertain)])
+
+
+class OutcomeTables:
+    """ Tables of the preset objects written by build_presets
+        - query(obj_type, v0, deg) answers launches of any type at once; types without
+          a table are answered exactly with their preset object
+    """
+    def __init__(self, directory, mmap_mode='r'):
+        self.tables = {}
+        for obj_type in obj.types:
+            path = os.path.join(directory, str(obj_type))
+            if os.path.isdir(path):
+                self.tables[obj_type] = OutcomeTable(path, mmap_mode)
+
+    def query(self, obj_type, v0, deg):
+        obj_type, v0, deg = broadcast_arrays(asarray(obj_type), asarray(v0, dtype=float), asarray(deg, dtype=float))
+        fields = [empty(obj_type.shape, dtype='<U4')] + [full(obj_type.shape, nan) for i in range(6)] + \
+                 [zeros(obj_type.shape, dtype=bool)]
+        for kind in set(obj_type.ravel().tolist()):
+            rows = obj_type == kind
+            if kind in self.tables:
+                answer = self.tables[kind].query(v0[rows], deg[rows])
+            else:
+                r, yl, yr, lx, k = exact(obj.types[kind](), v0[rows], deg[rows])
+                answer = (r, yl, yr, lx, 0.0, 0.0, 0.0, True)
+            for field, values in zip(fields, answer):
+                field[rows] = values
+        return Lookup(*[field[()] for field in fields])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precomputed outcome tables of the preset objects.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    builder = commands.add_parser('build', help='compute the tables of every preset object')
+    builder.add_argument('directory')
+    builder.add_argument('--speeds', type=int, default=512, help='points of the grid along the speed')
+    builder.add_argument('--angles', type=int, default=512, help='points of the grid along the angle')
+    builder.add_argument('--max-speed', type=float, default=400.0, help='highest speed of the grid, m/s')
+    asker = commands.add_parser('query', help='answer one launch')
+    asker.add_argument('directory')
+    asker.add_argument('obj_type', type=int)
+    asker.add_argument('v0', type=float)
+    asker.add_argument('deg', type=float)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_presets(args.directory, speeds=args.speeds, angles=args.angles, max_speed=args.max_speed)
+    else:
+        if args.obj_type not in obj.types:
+            print('Object type given is invalid')
+            sys.exit(1)
+        answer = OutcomeTables(args.directory).query(args.obj_type, args.v0, args.deg)
+        print('%s, crosses the bars at %.3f (+- %.3g) and %.3f (+- %.3g) m, lands at %.3f (+- %.3g) m%s' %
+              (answer.result, answer.y_left, answer.y_left_error, answer.y_right, answer.y_right_error,
+               answer.landing_x, answer.landing_error, ' (exact)' if answer.exact else ''))
@@ -16,14 +16,17 @@
 
 """
 
+import instrument
 import objects as obj
 import projectile as proj
 from projectile import basket_height, left_bar, right_bar, basket_bottom
-from read_data import read_data
+from read_data import read_data, ReadError
+from storage import TrajectoryCollection
 
+import argparse
+import os
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 
 # Defining dictionary for possible objects to be used.
 name_dict = {
@@ -33,12 +36,7 @@ name_dict = {
     3: "StreamlinedBody",  # Mass: 0.04kg      Area: 0.04m2    Drag Coefficient: 0.04
 }
 
-func_dict = {
-    0: obj.Custom,
-    1: obj.Sphere,
-    2: obj.Cube,
-    3: obj.StreamlinedBody
-}
+func_dict = obj.types
 
 
 class Renderer:
@@ -49,53 +47,48 @@ class Renderer:
         - Identifies the winner
     """
 
-    def __init__(self):
+    def __init__(self, reporter=proj.print_reporter):
         # Initialize all variables
+        # reporter receives (person, outcome) for each launch, None keeps it quiet
         self.vacuum_simulation = False  # Vacuum simulation false for better game experience
+        self.blit = True  # Redraw only the trajectory lines in each frame of plot()
         self.graph = None
+        self.decimated = []  # x, y and original indices of the points drawn for each trajectory
+        self.shown = []  # number of decimated points currently drawn for each trajectory
         self.line_num = 1
         self.label_array = list([])
-        self.x_array = []
-        self.y_array = []
+        self.trajectories = TrajectoryCollection()  # Drag and Vacuum trajectory of each row, in turn
         self.x_max = 0
         self.y_max = 0
-        self.mtn = proj.motion()
+        self.mtn = proj.motion(reporter=reporter)
         self.reader = read_data()
         self.left_boundary = left_bar
         self.right_boundary = right_bar
 
+    @instrument.timed()
     def get_x_y(self, arr, arr1):
         """ Get all values need to plot:
-            - x_array: contain an array with all x values
-            - y_array: contain an array with all y values
-            - x_max: max value of x_array, to define plot's x axis limit
-            - y_max: max value of x_array, to define plot's y axis limit
+            - trajectories: collection with the t, x and y values of every trajectory
+            - x_max: max x value of all trajectories, to define plot's x axis limit
+            - y_max: max y value of all trajectories, to define plot's y axis limit
             - label_array: Labels for each array, to use in plot legend
         """
-        for row in arr:
+        # Objects of every row, built and checked at once
+        specs = obj.specsFromTypes(arr[:, 6].astype(int), Cd=arr[:, 2], A=arr[:, 4] * arr[:, 3] * arr[:, 3],
+                                   mass=arr[:, 5])
+
+        for row, selected in zip(arr, specs):
             # Set projectile parameters from input array, per row
             person_name = arr1[self.line_num - 1]
             initial_speed = row[0]
             initial_angle = row[1]
-            drag_coefficient = row[2]
-            diameter = row[3]
-            ref_area = row[4] * diameter * diameter
-            mass = row[5]
-            objType = row[6]
-            result = ''
-
-            # Based on object type, it calls the customized or preset object
-            if objType >= len(func_dict):
-                raise Exception('Object type given is invalid')
-            elif objType == 0:
-                selected = func_dict[objType](Cd=drag_coefficient, A=ref_area, mass=mass)
-            else:
-                selected = func_dict[objType]()
+            objType = int(row[6])
 
             # Based on parameters and object, it calculates its trajectory
             # Get trajectory and set labels only for Drag trajectory:
-            t1, x1, y1, result = self.mtn.Drag(selected, v0=initial_speed, deg=initial_angle, person=person_name)
-            x2, y2 = np.array([0., 0.]), np.array([0., 0.])
+            t1, x1, y1, outcome = self.mtn.Drag(selected, v0=initial_speed, deg=initial_angle, person=person_name)
+            result = outcome.result
+            t2, x2, y2 = np.array([0., 0.]), np.array([0., 0.]), np.array([0., 0.])
 
 
 
@@ -114,46 +107,44 @@ class Renderer:
                                          + str(initial_speed) + ' Angle: ' + str(initial_angle) + ' Drag ' + str(result)])
                 self.label_array.append([''])
 
-            # Append Vacuum and Drag trajectory values to final arrays
-            self.x_array = np.append(self.x_array, np.array([x1, x2], dtype=object))
-            self.y_array = np.append(self.y_array, np.array([y1, y2], dtype=object))
-
-            # Defines chart boundaries based on max values
-            # Set the axis X max value by getting the max value of x1 or x2
-            if max(x1) > max(x2) and max(x1) > self.x_max:
-                self.x_max = max(x1)
-            elif max(x2) > max(x1) and max(x2) > self.x_max:
-                self.x_max = max(x2)
-            # Set the axis Y max value by  getting the max value of y1 or y2
-            if max(y1) > max(y2) and max(y1) > self.y_max:
-                self.y_max = max(y1)
-            elif max(y2) > max(y1) and max(y2) > self.y_max:
-                self.y_max = max(y2)
+            # Append Drag and Vacuum trajectory values to the collection, which also
+            # keeps the max values that define the chart boundaries
+            self.trajectories.append(t1, x1, y1)
+            self.trajectories.append(t2, x2, y2)
 
             # iterate the line_num
             self.line_num += 1
 
+        self.x_max = max(self.x_max, self.trajectories.x_max)
+        self.y_max = max(self.y_max, self.trajectories.y_max)
+
         # Return all need values to plot
-        return self.label_array, self.x_array, self.y_array, self.x_max, self.y_max
+        return self.label_array, self.trajectories, self.x_max, self.y_max
 
     def init(self):
         """Initialize each plot line for chart
         """
         for line in self.graph:
             line.set_data([], [])
+        self.shown = [0] * len(self.graph)
         return self.graph
 
+    @instrument.timed()
     def animate(self, i):
         """Function to plot all projectile paths
+            Frame i shows the points of each trajectory before index i, decimated to
+            the screen resolution; only the lines that got new points are updated.
         """
         item = 0
 
-        # For each item in x_array (y_array could also be used)
-        while item < len(self.x_array):
-            # Add to the each graph the data to plot x and y points
-            self.graph[item].set_data(self.x_array[item][:i], self.y_array[item][:i])
-            # Add legend for each plot line
-            self.graph[item].set_label('%s ' % self.label_array[item][0])
+        # For each trajectory
+        while item < len(self.trajectories):
+            x, y, index = self.decimated[item]
+            shown = np.searchsorted(index, i)  # decimated points before index i
+            if shown != self.shown[item]:
+                # views of the decimated arrays, nothing is copied
+                self.graph[item].set_data(x[:shown], y[:shown])
+                self.shown[item] = shown
 
             # Iterator value depends on vacuum simulation flag
             if self.vacuum_simulation == True:
@@ -161,42 +152,81 @@ class Renderer:
             else:
                 item += 2
 
-        # Plots the basket
-        self.graph[item].set_data([left_bar, left_bar], [basket_bottom, basket_height])
-        self.graph[item].set_color("black")
-        self.graph[item + 1].set_data([left_bar, right_bar], [basket_bottom, basket_bottom])
-        self.graph[item + 1].set_color("black")
-        self.graph[item + 2].set_data([right_bar, right_bar], [basket_bottom, basket_height])
-        self.graph[item + 2].set_color("black")
-
-        # Set legend position
-        legend = plt.legend(loc='upper left')
-        return self.graph + [legend]
-
-    def plot(self):
-        """ Function that:
-            - Gets the names and parameters from the file
-            - Gets the trajectory of each projectile
-            - Draw the trajectory with animation in a chart
+        return self.graph
+
+    @instrument.timed()
+    def decimate(self, ax):
+        """ Keeps, for each trajectory, only the points that fall in a different pixel
+            than the point before them (and the last point), with their indices
+        """
+        x_min, x_max = ax.get_xlim()
+        y_min, y_max = ax.get_ylim()
+        x_pixel = (x_max - x_min) / max(ax.bbox.width, 1)
+        y_pixel = (y_max - y_min) / max(ax.bbox.height, 1)
+
+        self.decimated = []
+        for item in range(len(self.trajectories)):
+            t, x, y = self.trajectories[item]
+            column = np.floor((x - x_min) / x_pixel)
+            row = np.floor((y - y_min) / y_pixel)
+            keep = np.ones(len(x), dtype=bool)
+            keep[1:] = (column[1:] != column[:-1]) | (row[1:] != row[:-1])
+            keep[-1:] = True
+            self.decimated.append((x[keep], y[keep], np.flatnonzero(keep)))
+
+    @instrument.timed()
+    def load(self, filename='projectile_input.csv'):
+        """ Gets the names and parameters from the file, and the trajectory of each
+            projectile
         """
         # Read parameters from csv
-        param_input, names = self.reader.read_file()
+        try:
+            param_input, names = self.reader.read_file(filename)
+        except ReadError as error:
+            print(error)
+            sys.exit(1)
+        for line, message in self.reader.errors:
+            print('Line %d of the input file skipped: %s' % (line, message))
 
         # Get all data that will be used as parameters to create plot
-        label_array, x_array, y_array, x_max, y_max = self.get_x_y(param_input, names)
-        # Transform the labels list in an array
-        label_array = np.asarray(label_array)
+        return self.get_x_y(param_input, names)
+
+    @instrument.timed()
+    def figure(self, filename='projectile_input.csv', blit=True):
+        """ Creates the chart and the lines of every trajectory, returns the figure
+            and the number of frames needed to draw the longest trajectory
+            - The basket and the legend never change, they are drawn once
+            - With blit, the trajectory lines are animated artists, drawn over a
+              cached background by FuncAnimation
+        """
+        import matplotlib.pyplot as plt # the plotting stack is only loaded to draw
+
+        label_array, trajectories, x_max, y_max = self.load(filename)
 
         # Plot definition
         fig = plt.figure(figsize=(6 * 3.13, 4 * 3.13))
         # Define different axes with limits defined by x_max and y_max
         ax = plt.axes(xlim=(0, x_max + 100), ylim=(0, y_max + 100))
         # Define plot line type
-        self.graph = ax.plot(*([[], []] * (len(x_array) + 3)), marker=",")
+        self.graph = ax.plot(*([[], []] * len(trajectories)), marker=",", animated=blit)
 
-        # Call animation function that will plot projectile lines in the chart
-        # If blit = True, it produces a weird black horizontal and vertical banner
-        ani = FuncAnimation(fig, self.animate, init_func=self.init, frames=1000, interval=1, blit=False, repeat=False)
+        # Add legend for each plot line that has a label
+        item = 0
+        while item < len(trajectories):
+            self.graph[item].set_label('%s ' % label_array[item][0])
+            if self.vacuum_simulation == True:
+                self.graph[item + 1].set_label('%s ' % label_array[item + 1][0])
+            item += 2
+
+        # Plots the basket
+        ax.plot([left_bar, left_bar], [basket_bottom, basket_height], color="black")
+        ax.plot([left_bar, right_bar], [basket_bottom, basket_bottom], color="black")
+        ax.plot([right_bar, right_bar], [basket_bottom, basket_height], color="black")
+
+        # Set legend position, static so it is part of the blit background; building
+        # a new legend every frame is what produced black banners with blit = True
+        if len(trajectories):
+            ax.legend(loc='upper left')
 
         # Add title, axis labels and grid
         plt.grid(False)
@@ -204,8 +234,110 @@ class Renderer:
         plt.ylabel('vertical position y / m')
         plt.xlabel('horizontal position x / m')
 
-        plt.show()
+        self.decimate(ax)
+
+        # frame i draws the first i points, so the last frame shows every point
+        longest = max([len(trajectories[item][0]) for item in range(len(trajectories))], default=0)
+        return fig, longest + 1
+
+    def plot(self, filename='projectile_input.csv'):
+        """ Function that:
+            - Gets the names and parameters from the file
+            - Gets the trajectory of each projectile
+            - Draw the trajectory with animation in a chart
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+
+        fig, frames = self.figure(filename, blit=self.blit)
 
+        # Call animation function that will plot projectile lines in the chart
+        ani = FuncAnimation(fig, self.animate, init_func=self.init, frames=frames, interval=1, blit=self.blit,
+                            repeat=False)
+
+        plt.show()
 
-renderer = Renderer()
-renderer.plot()
+    @instrument.timed()
+    def render(self, output, filename='projectile_input.csv', backend='Agg', fps=30, dpi=None):
+        """ Draws the animation without a display and saves it to output:
+            - a png file name with a frame number pattern (e.g. frames/frame_%04d.png)
+              or a directory, for one png per frame
+            - a .gif file, written with Pillow
+            - a .mp4 file, written with the local ffmpeg
+            Only the frames needed to draw the longest trajectory are rendered.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation, FFMpegWriter, PillowWriter
+
+        # the writer is chosen before anything is drawn, so a bad output fails at once
+        frames_only = os.path.isdir(output) or (output.lower().endswith('.png') and '%' in output)
+        if frames_only:
+            writer = None
+        elif output.lower().endswith('.gif'):
+            writer = PillowWriter(fps=fps)
+        elif output.lower().endswith('.mp4'):
+            if not FFMpegWriter.isAvailable():
+                raise ValueError('A .mp4 output needs ffmpeg, which was not found (use a .gif or png frames)')
+            writer = FFMpegWriter(fps=fps)
+        else:
+            raise ValueError('Output must be a png pattern, a directory, a .gif or a .mp4 file')
+
+        plt.switch_backend(backend)
+        # every saved frame is drawn in full, so there is nothing to blit
+        fig, frames = self.figure(filename, blit=False)
+
+        if frames_only:
+            pattern = os.path.join(output, 'frame_%05d.png') if os.path.isdir(output) else output
+            self.init()
+            for i in range(frames):
+                self.animate(i)
+                with instrument.span('main.Renderer.savefig', frame=i):
+                    fig.savefig(pattern % i, dpi=dpi)
+        else:
+            ani = FuncAnimation(fig, self.animate, init_func=self.init, frames=frames, blit=False, repeat=False)
+            with instrument.span('main.Renderer.save', frames=frames):
+                ani.save(output, writer=writer, dpi=dpi)
+        plt.close(fig)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Angry Projectiles')
+    parser.add_argument('input', nargs='?', default='projectile_input.csv', help='projectile input file')
+    parser.add_argument('--output', default=None,
+                        help='render without a display to a png pattern, directory, .gif or .mp4 file')
+    parser.add_argument('--backend', default='Agg', help='matplotlib backend used with --output')
+    parser.add_argument('--fps', type=int, default=30, help='frames per second of a .gif or .mp4 output')
+    parser.add_argument('--score', action='store_true',
+                        help='only print the outcome of every launch as csv, without loading the plotting stack')
+    parser.add_argument('--profile', default=None, help='JSON file for a summary of the time spent in each stage')
+    parser.add_argument('--trace', default=None, help='Chrome trace file of every stage')
+    parser.add_argument('--profile-memory', action='store_true', help='also track allocations (slower)')
+    args = parser.parse_args()
+
+    if args.profile or args.trace:
+        instrument.enable(memory=args.profile_memory)
+
+    if args.score:
+        import runner
+        try:
+            errors = runner.score_file(args.input, sys.stdout, workers=1)
+        except ReadError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+        for line, message in errors:
+            print('Line %d of the input file skipped: %s' % (line, message), file=sys.stderr)
+    else:
+        renderer = Renderer()
+        if args.output is None:
+            renderer.plot(args.input)
+        else:
+            try:
+                renderer.render(args.output, filename=args.input, backend=args.backend, fps=args.fps)
+            except ValueError as error:
+                print(error, file=sys.stderr)
+                sys.exit(1)
+
+    if args.profile:
+        instrument.save_json(args.profile)
+    if args.trace:
+        instrument.save_trace(args.trace)
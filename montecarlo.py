@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""Monte Carlo uncertainty of launches -
+    Draws many samples of each launch with noise on the speed, angle, drag coefficient,
+    area and mass, and estimates for each launch:
+    - the win probability, with a Wilson confidence interval
+    - the distribution of the landing position (mean, standard deviation, confidence
+      interval of the mean, histogram and quantiles)
+
+    The samples are evaluated in vectorized chunks with the closed form of the Drag
+    motion (lookup.exact, like motion.classify), or with motion.DragBatch (method='drag'),
+    optionally by a pool of processes. Only sums and histograms are kept, so memory is
+    bounded by the chunk size, whatever the number of samples. Each chunk has its own
+    random stream, so the results only depend on the seed, not on the number of processes.
+
+    Usage:
+        python montecarlo.py [input file] [--samples N] [--speed-sd v] [--angle-sd deg]
+                             [--cd-sd fraction] [--mass-sd fraction] [--workers N] [--seed N]
+
+"""
+
+import argparse
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+import instrument
+import objects as obj
+import projectile as proj
+from lookup import exact
+from read_data import read_data, ReadError
+
+# Noise added to a parameter: a normal with standard deviation scale, or a uniform
+# between -scale and +scale; relative scales are fractions of the parameter
+Noise = namedtuple('Noise', ['kind', 'scale', 'relative'])
+
+_parameters = ('v0', 'deg', 'Cd', 'A', 'm')
+
+
+def normal(sd, relative=False):
+    return Noise('normal', sd, relative)
+
+
+def uniform(half_width, relative=False):
+    return Noise('uniform', half_width, relative)
+
+
+def _draw(rng, noise, center):
+    # Samples of a parameter around center (one value per sample)
+    if noise is None or noise.scale == 0:
+        return center
+    scale = noise.scale * abs(center) if noise.relative else noise.scale
+    if noise.kind == 'normal':
+        return center + scale * rng.standard_normal(len(center))
+    if noise.kind == 'uniform':
+        return center + scale * rng.uniform(-1.0, 1.0, len(center))
+    raise ValueError('Unknown kind of noise: %s' % noise.kind)
+
+
+def _run_chunk(columns, first, samples, start, stop, noise, seed, method, dt, edges):
+    # Evaluates the samples start:stop (sample r belongs to launch r // samples) and returns
+    # the sums of each launch of the chunk: samples, wins, landing x, landing x^2, histogram
+    launch = np.arange(start, stop) // samples
+    local = launch - first
+    size = local[-1] + 1
+    rows = columns[local]
+    rng = np.random.default_rng(seed)
+
+    v0, deg, Cd, A, m = [_draw(rng, noise.get(name), rows[:, k]) for k, name in enumerate(_parameters)]
+    # physical limits of the properties, as checked by objects.makeSpecs
+    Cd = np.maximum(Cd, 0.0)
+    A = np.maximum(A, 1e-12)
+    m = np.maximum(m, 0.0)
+    x0, y0 = rows[:, 5], rows[:, 6]
+
+    if method == 'exact':
+        result, y_left, y_right, landing_x, kind = exact(obj.makeSpecs(Cd, A, x0, y0, m), v0, deg)
+    elif method == 'drag':
+        T, X, Y, landing, outcome = proj.motion().DragBatch(v0, deg, Cd, A, m, x0, y0, dt=dt)
+        result, landing_x = outcome.result, outcome.landing_x
+    else:
+        raise ValueError('Unknown method: %s' % method)
+
+    win = result == 'Win'
+    # bin 0 and the last bin count the samples below and above the edges
+    bins = np.searchsorted(edges, landing_x, side='right')
+    histogram = np.bincount(local * (len(edges) + 1) + bins, minlength=size * (len(edges) + 1))
+    return (first, np.bincount(local, minlength=size), np.bincount(local, weights=win, minlength=size),
+            np.bincount(local, weights=landing_x, minlength=size),
+            np.bincount(local, weights=landing_x * landing_x, minlength=size),
+            histogram.reshape(size, len(edges) + 1))
+
+
+class Estimate:
+    """ Monte Carlo estimate of every launch, each attribute has one value per launch
+        - p: win probability, low and high: its Wilson interval at the given confidence
+        - landing_mean, landing_std, and landing_low and landing_high: the interval of
+          the mean landing position
+        - histogram: number of samples landing between each pair of edges, the first and
+          the last column count the samples below and above the edges
+        - quantile(q): landing position below which a fraction q of the samples land,
+          interpolated in the histogram
+    """
+    def __init__(self, count, wins, sum_x, sum_x2, histogram, edges, confidence=0.95):
+        self.count = count
+        self.wins = wins
+        self.histogram = histogram
+        self.edges = edges
+        self.confidence = confidence
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.p = wins / count
+            center = (self.p + z * z / (2 * count)) / (1 + z * z / count)
+            half = z / (1 + z * z / count) * np.sqrt(self.p * (1 - self.p) / count + z * z / (4 * count * count))
+            self.low = np.maximum(center - half, 0.0)
+            self.high = np.minimum(center + half, 1.0)
+
+            self.landing_mean = sum_x / count
+            self.landing_std = np.sqrt(np.maximum(sum_x2 / count - self.landing_mean ** 2, 0.0) * count / (count - 1))
+            error = z * self.landing_std / np.sqrt(count)
+            self.landing_low = self.landing_mean - error
+            self.landing_high = self.landing_mean + error
+
+    def quantile(self, q):
+        # Quantile q of the landing position of each launch, -inf/inf outside the edges
+        cumulative = np.cumsum(self.histogram, axis=-1) / self.count[..., None]
+        k = np.argmax(cumulative >= q, axis=-1) # first bin reaching q
+        below = np.take_along_axis(cumulative, np.maximum(k - 1, 0)[..., None], axis=-1)[..., 0]
+        below = np.where(k > 0, below, 0.0)
+        inside = np.take_along_axis(self.histogram, k[..., None], axis=-1)[..., 0] / self.count
+        edges = np.append(self.edges, self.edges[-1])
+        left = edges[np.clip(k - 1, 0, len(self.edges) - 1)]
+        width = edges[np.clip(k, 0, len(self.edges))] - left
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x = left + width * np.where(inside > 0, (q - below) / inside, 0.0)
+        return np.where(k == 0, -np.inf, np.where(k > len(self.edges) - 1, np.inf, x))
+
+
+@instrument.timed()
+def simulate(spec, v0, deg, samples=10000, noise=None, seed=None, chunk_size=65536, workers=1, method='exact',
+             dt=0.1, edges=None, confidence=0.95):
+    """ Monte Carlo estimate (an Estimate) for one launch or arrays of launches
+        - spec is an object or a record array of objects (objects.makeSpecs), broadcast
+          with v0 and deg
+        - noise maps 'v0', 'deg', 'Cd', 'A' and 'm' to a Noise (normal or uniform), the
+          parameters without noise keep their value
+        - samples are drawn for each launch and evaluated chunk_size at a time, by workers
+          processes (1 runs inline, None uses every core)
+        - method 'exact' uses the closed form of the motion, 'drag' uses motion.DragBatch
+          with the time step dt
+        - edges of the landing histogram, 0 to 1000 m by 5 m by default
+    """
+    noise = {} if noise is None else dict(noise)
+    for name in noise:
+        if name not in _parameters:
+            raise ValueError('Unknown parameter: %s' % name)
+    edges = np.linspace(0.0, 1000.0, 201) if edges is None else np.asarray(edges, dtype=float)
+    columns = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in
+                                    (v0, deg, spec.Cd, spec.A, spec.m, spec.x0, spec.y0)])
+    shape = columns[0].shape
+    columns = np.stack([column.ravel() for column in columns], axis=1)
+
+    total = len(columns) * samples
+    chunks = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    def tasks():
+        for (start, stop), chunk_seed in zip(chunks, seeds):
+            first, last = start // samples, (stop - 1) // samples
+            yield columns[first:last + 1], first, samples, start, stop, noise, chunk_seed, method, dt, edges
+
+    count = np.zeros(len(columns))
+    wins = np.zeros(len(columns))
+    sum_x = np.zeros(len(columns))
+    sum_x2 = np.zeros(len(columns))
+    histogram = np.zeros((len(columns), len(edges) + 1))
+
+    def merge(part):
+        first, n, w, x, x2, h = part
+        rows = slice(first, first + len(n))
+        count[rows] += n
+        wins[rows] += w
+        sum_x[rows] += x
+        sum_x2[rows] += x2
+        histogram[rows] += h
+
+    if workers == 1 or len(chunks) <= 1:
+        for task in tasks():
+            merge(_run_chunk(*task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_run_chunk, *zip(*tasks())):
+                merge(part)
+
+    return Estimate(count.reshape(shape), wins.reshape(shape), sum_x.reshape(shape), sum_x2.reshape(shape),
+                    histogram.reshape(shape + (len(edges) + 1,)), edges, confidence)
+
+
+def main(argv=None):
+    from runner import launch_columns
+
+    parser = argparse.ArgumentParser(description='Win probability of each launch under noise.')
+    parser.add_argument('input', nargs='?', default='projectile_input.csv', help='projectile input file')
+    parser.add_argument('--samples', type=int, default=10000, help='samples per launch')
+    parser.add_argument('--speed-sd', type=float, default=2.0, help='standard deviation of the speed, m/s')
+    parser.add_argument('--angle-sd', type=float, default=1.0, help='standard deviation of the angle, degrees')
+    parser.add_argument('--cd-sd', type=float, default=0.05, help='relative standard deviation of Cd')
+    parser.add_argument('--mass-sd', type=float, default=0.02, help='relative standard deviation of the mass')
+    parser.add_argument('--method', choices=('exact', 'drag'), default='exact', help='model of the motion')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes (0: all cores)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random samples')
+    args = parser.parse_args(argv)
+
+    reader = read_data()
+    try:
+        param_input, names = reader.read_file(args.input)
+    except ReadError as error:
+        print(error)
+        sys.exit(1)
+    columns = launch_columns(param_input)
+    specs = obj.makeSpecs(columns[:, 2], columns[:, 3], columns[:, 5], columns[:, 6], columns[:, 4])
+    noise = {'v0': normal(args.speed_sd), 'deg': normal(args.angle_sd), 'Cd': normal(args.cd_sd, relative=True),
+             'm': normal(args.mass_sd, relative=True)}
+    estimate = simulate(specs, columns[:, 0], columns[:, 1], samples=args.samples, noise=noise, seed=args.seed,
+                        workers=args.workers or None, method=args.method)
+
+    median = estimate.quantile(0.5)
+    for i, name in enumerate(names):
+        print('%s: wins %.1f%% of the time (95%% interval %.1f%% to %.1f%%), lands at %.1f +- %.1f m '
+              '(median %.1f m)' % (name, 100 * estimate.p[i], 100 * estimate.low[i], 100 * estimate.high[i],
+                                   estimate.landing_mean[i], estimate.landing_std[i], median[i]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,13 @@
+from numpy import any as any_of
+from numpy import argmax
+from numpy import asarray
+from numpy import broadcast_arrays
+from numpy import dtype
+from numpy import float64
+from numpy import rec
+
+import instrument
+
 class ObjProperties:
     # Class that defines the projectile (object) properties
 
@@ -54,3 +64,48 @@ class StreamlinedBody(ObjProperties):
     def __init__(self, A=0.04, x0=0.0, y0=0.0, mass=1.0):
         self.setDragProperties(0.04, A)
         self.setProperties(x0, y0, mass)
+
+
+# Object types of the input file
+types = {
+    0: Custom,
+    1: Sphere,
+    2: Cube,
+    3: StreamlinedBody
+}
+
+# Compact representation of many objects: one record per object with the same properties
+# as ObjProperties, read like an object (specs.m is the column, specs[i].m one value)
+spec_dtype = dtype([('Cd', float64), ('A', float64), ('x0', float64), ('y0', float64), ('m', float64)])
+
+def _check(bad, message):
+    # Raises the same exception as ObjProperties for the first row that fails a check
+    if any_of(bad):
+        raise Exception('%s (row %d)' % (message, argmax(bad)))
+
+@instrument.timed()
+def makeSpecs(Cd=1.0, A=0.05, x0=0.0, y0=0.0, mass=1.0):
+    # Record array of objects from columns (or scalars) of properties, checked all at once
+    # with the rules of setProperties and setDragProperties
+    Cd, A, x0, y0, mass = [column.ravel() for column in broadcast_arrays(*[asarray(column, dtype=float64)
+                                                                         for column in (Cd, A, x0, y0, mass)])]
+    _check(y0 < 0, 'The initial y-position (y0) must be greater or equal to 0.')
+    _check(mass < 0, 'The mass of object must be greater or equal to 0.')
+    _check(Cd < 0, 'The drag coefficient (Cd) must be greater or equal to 0.')
+    _check(A <= 0, 'The reference area (A) must be greater than 0.')
+    return rec.fromarrays([Cd, A, x0, y0, mass], dtype=spec_dtype)
+
+@instrument.timed()
+def specsFromTypes(obj_type, Cd=1.0, A=0.05, x0=0.0, y0=0.0, mass=1.0):
+    # Record array of objects from the object type column of the input file: type 0 takes
+    # the given properties, the preset types take the properties of their class
+    obj_type = asarray(obj_type).ravel()
+    _check((obj_type < 0) | (obj_type >= len(types)), 'Object type given is invalid')
+    columns = broadcast_arrays(obj_type, Cd, A, x0, y0, mass)
+    Cd, A, x0, y0, mass = [column.astype(float64) for column in columns[1:]] # writable copies
+    for kind in range(1, len(types)):
+        rows = obj_type == kind
+        if any_of(rows):
+            preset = types[kind]()
+            Cd[rows], A[rows], x0[rows], y0[rows], mass[rows] = preset.Cd, preset.A, preset.x0, preset.y0, preset.m
+    return makeSpecs(Cd, A, x0, y0, mass)
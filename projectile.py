@@ -1,9 +1,34 @@
+import os
+from collections import namedtuple
+from collections import OrderedDict
 from numpy import cos as cos
 from numpy import sin as sin
 from numpy import deg2rad as deg2rad
 from numpy import sqrt as sqrt
 from numpy import exp as exp
 from numpy import array as array
+from numpy import arange as arange
+from numpy import asarray as asarray
+from numpy import broadcast_arrays as broadcast_arrays
+from numpy import ceil as ceil
+from numpy import concatenate as concatenate
+from numpy import cumsum as cumsum
+from numpy import empty as empty
+from numpy import errstate as errstate
+from numpy import flatnonzero as flatnonzero
+from numpy import full as full
+from numpy import isfinite as isfinite
+from numpy import isinf as isinf
+from numpy import load as load
+from numpy import log as log
+from numpy import maximum as maximum
+from numpy import nan as nan
+from numpy import rec as rec
+from numpy import savez as savez
+from numpy import where as where
+from numpy import zeros as zeros
+
+import instrument
 
 g = -9.81 # gravitational acceleration, m/s^2
 p = 1.225 # density of the air, kg/m^3
@@ -12,43 +37,274 @@ basket_bottom = 0
 left_bar = 400
 right_bar = 500
 
+def _height_at(x, x0, y0, v0, theta, vt):
+    # Height of the Drag motion when it reaches the horizontal position x, found by
+    # inverting x(t); nan if the object never gets there (x(t) tends to x0 + v0*cos*vt/|g|)
+    vx = v0 * cos(theta)
+    vy = v0 * sin(theta)
+    with errstate(divide='ignore', invalid='ignore'):
+        e = 1 - (x - x0) * abs(g) / (vx * vt) # value of exp(g * t / vt) at that point
+        t = vt * log(e) / g
+        y = y0 + (vt / abs(g)) * (vy + vt) * (1 - e) - vt * t
+        # Cd = 0 has no terminal velocity, use the vacuum parabola instead
+        tv = (x - x0) / vx
+        yv = y0 + vy * tv + 0.5 * g * tv * tv
+    y = where(isinf(vt), where(tv >= 0, yv, nan), where((e > 0) & (e <= 1), y, nan))
+    return y
+
+def _find_root(f, a, b, fa=None, fb=None, tol=1e-12, maxiter=100):
+    # Root of f in [a, b] where f changes sign, by the Illinois (modified regula falsi)
+    # method; stops when the bracket is narrower than tol or after maxiter iterations
+    fa = f(a) if fa is None else fa
+    fb = f(b) if fb is None else fb
+    if fb == 0:
+        return b
+    side = 0
+    for i in range(maxiter):
+        if abs(b - a) <= tol * max(1.0, abs(b)):
+            break
+        c = (a * fb - b * fa) / (fb - fa)
+        if not a < c < b and not b < c < a:
+            c = 0.5 * (a + b) # secant left the bracket, bisect instead
+        fc = f(c)
+        if fc == 0:
+            return c
+        if (fc > 0) == (fb > 0):
+            b, fb = c, fc
+            if side == -1:
+                fa *= 0.5
+            side = -1
+        else:
+            a, fa = c, fc
+            if side == 1:
+                fb *= 0.5
+            side = 1
+    return b
+
+def _closed_form(obj, v0, deg, drag):
+    # Returns a function of t giving position, velocity and acceleration of the object,
+    # with the same formulas as Drag, or the exact parabola in vacuum (or if Cd = 0)
+    theta = deg2rad(deg)
+    x0, y0 = obj.x0, obj.y0
+    vx0, vy0 = v0 * cos(theta), v0 * sin(theta)
+
+    if drag and obj.Cd > 0:
+        vt = sqrt((2 * obj.m * abs(g)) / (p * obj.A * obj.Cd))
+        k = abs(g) / vt
+        def state(t):
+            e  = exp(g * t / vt)
+            x  = x0 + ((v0 * vt) / abs(g)) * cos(theta) * (1 - e)
+            y  = y0 + (vt / abs(g)) * (vy0 + vt) * (1 - e) - vt * t
+            vx = vx0 * e
+            vy = (vy0 + vt) * e - vt
+            return x, y, vx, vy, -k * vx, g - k * vy
+    else:
+        def state(t):
+            return x0 + vx0 * t, y0 + vy0 * t + 0.5 * g * t * t, vx0, vy0 + g * t, 0.0, g
+    return state
+
+def _flight_bound(v0, deg, Cd, A, m, y0):
+    # Upper bound of the flight time of the Drag motion, y(t) <= y0 + cy - vt * t (arrays)
+    theta = deg2rad(deg)
+    vt = sqrt((2 * m * abs(g)) / (p * A * Cd))
+    cy = (vt / abs(g)) * (v0 * sin(theta) + vt)
+    return (y0 + maximum(cy, 0.0)) / vt
+
+def _vacuum_steps(vy, y0, dt):
+    # Number of steps of Vacuum until the ground: the height after k steps is
+    # y0 + vy*k*dt + g*dt^2*k*(k+1)/2, plus two steps for the rounding of the sums
+    a = abs(g) * dt * dt / 2
+    b = a - vy * dt
+    k = (-b + sqrt(max(b * b + 4 * a * y0, 0.0))) / (2 * a)
+    return max(int(ceil(k)), 1) + 2
+
+def _buffer(out, n):
+    # out when it has room for n points, otherwise a new (3, n) float64 buffer
+    return out if out is not None and out.shape[1] >= n else empty((3, n))
+
+def _ground(Y, n):
+    # Index of the last step of Vacuum and Drag: the first one (after the start) that
+    # is not above the ground, or n if there is none
+    below = ~(Y[1:n + 1] > 0.0)
+    return int(below.argmax()) + 1 if below.any() else n
+
+# Outcome of a Drag launch, returned instead of printing it
+#   result      - 'Win' or 'Fail'
+#   cross_x/y   - last point where the object crossed the line of a bar (nan if never)
+#   landing_x   - horizontal position where the object stopped (ground or bar)
+#   flight_time - time of the last point of the trajectory
+#   bar         - 'left' or 'right' if the object was stopped by that bar, '' otherwise
+Outcome = namedtuple('Outcome', ['result', 'cross_x', 'cross_y', 'landing_x', 'flight_time', 'bar'])
+
+def print_reporter(person, outcome):
+    # Reporter that prints the outcome of each launch, as the command line game does
+    if outcome.result == 'Win':
+        print("%s - Success" %person)
+    elif outcome.result == 'Fail':
+        print("%s - Failure" %person)
+
+# Counters of a TrajectoryCache, like functools.lru_cache's cache_info()
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class TrajectoryCache:
+    """ Least recently used cache of the trajectories computed by motion
+        - entries are keyed on the method and the launch parameters (v0, deg, Cd, A,
+          m, x0, y0, dt), so objects with the same properties share their entries,
+          whatever their class (a Sphere, a Custom object or a makeSpecs record)
+        - at most maxsize entries are kept, the least recently used goes first
+        - the cached arrays are read-only, so callers cannot change them
+        - with a path, the entries are loaded from it if the file exists, and
+          save() writes them back (a NumPy .npz file)
+    """
+    def __init__(self, maxsize=1024, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def key(self, method, obj, v0, deg, dt):
+        return (method, float(v0), float(deg), float(obj.Cd), float(obj.A), float(obj.m), float(obj.x0),
+                float(obj.y0), float(dt))
+
+    def get(self, key):
+        # Returns the cached entry and marks it as recently used, or None
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        # Stores read-only copies of the arrays of the entry and returns the stored entry
+        arrays = []
+        for value in entry:
+            if not isinstance(value, Outcome):
+                value = array(value, dtype=float)
+                value.setflags(write=False)
+            arrays.append(value)
+        entry = tuple(arrays)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, path=None):
+        # Writes the entries to path (or the path given when created), oldest first
+        path = self.path if path is None else path
+        keys = list(self.entries)
+        entries = list(self.entries.values())
+        counts = [len(entry[0]) for entry in entries]
+        points = [concatenate([entry[i] for entry in entries]) if entries else zeros(0) for i in range(3)]
+        outcomes = [entry[3] if len(entry) > 3 else Outcome('', nan, nan, nan, nan, '') for entry in entries]
+        savez(path,
+              names=array([key[:1] for key in keys], dtype=str).reshape(-1, 1),
+              params=array([key[1:] for key in keys], dtype=float).reshape(-1, 8),
+              drag=array([len(entry) > 3 for entry in entries], dtype=bool),
+              counts=array(counts, dtype=int), t=points[0], x=points[1], y=points[2],
+              results=array([(o.result, o.bar) for o in outcomes], dtype=str).reshape(-1, 2),
+              outcomes=array([o[1:5] for o in outcomes], dtype=float).reshape(-1, 4))
+
+    def load(self, path):
+        # Adds the entries written by save to the cache
+        with load(path) as data:
+            ends = cumsum(data['counts'])
+            starts = ends - data['counts']
+            for i in range(len(starts)):
+                # the method is the first name (files of older versions also have the class)
+                key = (str(data['names'][i][0]),) + tuple(float(v) for v in data['params'][i])
+                entry = [data[name][starts[i]:ends[i]] for name in ('t', 'x', 'y')]
+                if data['drag'][i]:
+                    result, bar = [str(value) for value in data['results'][i]]
+                    entry.append(Outcome(result, *[float(value) for value in data['outcomes'][i]], bar))
+                self.put(key, entry)
+
 class motion:
     """ Class that calculates and returns the trajectory of the object based on:
         - Object type (mass, area)
         - Initial speed and angle
         - Drag or Vacuum
+        Objects may be ObjProperties instances or records of objects.makeSpecs; classify
+        and DragSpecs take a whole record array of them.
+        The optional reporter is called with (person, outcome) after each Drag launch,
+        e.g. print_reporter; by default nothing is printed.
+        With a TrajectoryCache, Vacuum and Drag reuse the result of launches they
+        have already computed (except when an out buffer is given), and return
+        read-only arrays.
     """
-    def Vacuum(self, obj, v0=100, deg=45, dt=0.1):
+    def __init__(self, reporter=None, cache=None):
+        self.reporter = reporter
+        self.cache = cache
+
+    @instrument.timed()
+    def Vacuum(self, obj, v0=100, deg=45, dt=0.1, out=None):
         # Returns the trajectory on the vacuum
+        # out is an optional (3, n) float64 buffer that T, X, Y are computed in and
+        # returned as views of, so batch jobs can reuse the same memory for every launch;
+        # it is used when n is at least the bound on the number of steps plus one
+        key = None
+        if self.cache is not None and out is None:
+            key = self.cache.key('Vacuum', obj, v0, deg, dt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
         theta = deg2rad(deg)
         vx = v0 * cos(theta) # velocity in x-direction
         vy = v0 * sin(theta) # velocity in y-direction
 
-        t = 0.0
-        x = obj.x0
-        y = obj.y0
+        # every step adds the same increments as t += dt, x += vx*dt, vy += g*dt and
+        # y += vy*dt, so the running sums (cumsum) give the points of the loop
+        n = _vacuum_steps(vy, obj.y0, dt)
+        buf = _buffer(out, n + 1)
+        T, X, Y = buf[0, :n + 1], buf[1, :n + 1], buf[2, :n + 1]
+        T.fill(dt)
+        T[0] = 0.0
+        cumsum(T, out=T)
+        X.fill(vx * dt)
+        X[0] = obj.x0
+        cumsum(X, out=X)
+        Y.fill(g * dt)
+        Y[0] = vy
+        cumsum(Y, out=Y) # vertical velocity after each step
+        Y *= dt
+        Y[0] = obj.y0
+        cumsum(Y, out=Y)
 
-        T = [t]
-        X = [x]
-        Y = [y]
-
-        while t==0.0 or y>0.0:
-            t  += dt
-            x  += vx * dt
-            vy += g * dt
-            y  += vy * dt
-            T.append(t)
-            X.append(x)
-            Y.append(y)
-
-        T = array(T)
-        X = array(X)
-        Y = array(Y)
+        k = _ground(Y, n)
+        T, X, Y = T[:k + 1], X[:k + 1], Y[:k + 1]
+        instrument.steps('projectile.motion.Vacuum', k)
 
+        if key is not None:
+            return self.cache.put(key, (T, X, Y))
         return T, X, Y
 
-    def Drag(self, obj, v0=100, deg=45, dt=0.1, person='Undefined'):
+    @instrument.timed()
+    def Drag(self, obj, v0=100, deg=45, dt=0.1, person='Undefined', out=None):
         # Returns the trajectory when there is air resistance
+        # out is an optional (3, n) float64 buffer, as in Vacuum
+        key = None
+        if self.cache is not None and out is None:
+            key = self.cache.key('Drag', obj, v0, deg, dt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if self.reporter is not None:
+                    self.reporter(person, cached[3])
+                return cached
+
         theta = deg2rad(deg)
 
         m  = obj.m
@@ -56,54 +312,332 @@ class motion:
         A  = obj.A
         vt = sqrt((2 * m * abs(g)) / (p * A * Cd))
 
-        t  = 0.0
-        x0 = obj.x0
-        y0 = obj.y0
-        y  = y0
-
-        T = [t]
-        X = [x0]
-        Y = [y0]
+        # closed form on the whole time grid, with the operation order of DragBatch,
+        # up to the bound of the flight time
+        cx = ((v0 * vt) / abs(g)) * cos(theta)
+        cy = (vt / abs(g)) * (v0 * sin(theta) + vt)
+        n = int(ceil(_flight_bound(v0, deg, Cd, A, m, obj.y0) / dt)) + 2
+        buf = _buffer(out, n + 1)
+        T, X, Y = buf[0, :n + 1], buf[1, :n + 1], buf[2, :n + 1]
+        T.fill(dt)
+        T[0] = 0.0
+        cumsum(T, out=T) # accumulated the same way as t += dt
+        decay = 1 - exp(g * T / vt)
+        X[:] = obj.x0 + cx * decay
+        Y[:] = obj.y0 + cy * decay - vt * T
+        end = _ground(Y, n)
 
         passed_left = False  # two flags, for last time point, not the current one
         passed_right = False
         flag = False # indicate whether the object should stop moving
         result = ''
+        cross_x, cross_y = nan, nan # last point where the object crossed the line of a bar
+
+        # failure() only does something at the last step, on the line of a bar, or past a
+        # bar not passed yet: it is called at those steps, and the steps are found again
+        # each time a bar is passed
+        k = 0
+        while not flag and k < end:
+            ahead = X[k + 1:end]
+            active = (ahead == left_bar) | (ahead == right_bar)
+            if not passed_left:
+                active |= ahead > left_bar
+            if not passed_right:
+                active |= ahead > right_bar
+            passed = passed_left, passed_right
+            for k in list(flatnonzero(active) + k + 1) + [end]:
+                x, y, passed_left, passed_right, flag, result, crossing = self.failure(X[k], Y[k], X[k - 1], Y[k - 1],
+                                                                                       passed_left, passed_right, flag)
+                if crossing is not None:
+                    cross_x, cross_y = crossing
+                if flag or (passed_left, passed_right) != passed:
+                    break
+        X[k], Y[k] = x, y
+        x, t = float(x), float(T[k])
+        T, X, Y = T[:k + 1], X[:k + 1], Y[:k + 1]
+        instrument.steps('projectile.motion.Drag', k)
 
-        while t==0.0 or y>0.0:
-            t += dt
-            x  = x0 + ((v0 * vt) / abs(g)) * cos(theta) * (1 - exp(g * t/vt))
-            y  = y0 + (vt / abs(g)) * (v0 * sin(theta) + vt) * (1 - exp(g * t/vt)) - vt * t
+        # a stopped object was moved onto the bar it hit
+        bar = 'left' if flag and x == left_bar else 'right' if flag and x == right_bar else ''
+        outcome = Outcome(result, cross_x, cross_y, x, t, bar)
+        if self.reporter is not None:
+            self.reporter(person, outcome)
 
-            x, y, passed_left, passed_right, flag, result = self.failure(x, y, X, Y, passed_left, passed_right, flag, person)
+        if key is not None:
+            return self.cache.put(key, (T, X, Y, outcome))
+        return T, X, Y, outcome
+
+    @instrument.timed()
+    def Adaptive(self, obj, v0=100, deg=45, drag=True, rtol=1e-3, atol=1e-2, person='Undefined', max_steps=100000):
+        """ Returns the trajectory with an adaptive time step and exact events
+            - points are taken from the closed form of the motion (drag or vacuum), spaced
+              so that the straight line between two points stays within atol + rtol * |r|
+              meters of the real path (r is the position)
+            - ground impact and the crossing of each bar are found by root finding and
+              added as points, instead of interpolating between the fixed steps of Drag
+            - returns T, X, Y and an Outcome, reported like in Drag
+        """
+        state = _closed_form(obj, v0, deg, drag)
+
+        t = 0.0
+        x, y, vx, vy, ax, ay = state(t)
+        T = [t]
+        X = [x]
+        Y = [y]
+
+        passed_left = False
+        passed_right = False
+        stop = False
+        result = ''
+        bar = ''
+        cross_x, cross_y = nan, nan
+
+        for i in range(max_steps):
+            # the chord of an arc of length h deviates at most |a| * h^2 / 8 from it
+            tol = atol + rtol * sqrt(x * x + y * y)
+            h = sqrt(8 * tol / max(sqrt(ax * ax + ay * ay), 1e-12))
+            t1 = t + h
+            x1, y1 = state(t1)[:2]
+
+            # events that happen inside this step, as (function that is 0 there, kind)
+            events = []
+            if y > basket_bottom and y1 <= basket_bottom:
+                events.append((lambda s: state(s)[1] - basket_bottom, 'ground'))
+            if not passed_left and x < left_bar <= x1:
+                events.append((lambda s: state(s)[0] - left_bar, 'left'))
+            elif passed_left and not passed_right and x < right_bar <= x1:
+                events.append((lambda s: state(s)[0] - right_bar, 'right'))
+
+            kind = None
+            for f, event in events:
+                te = _find_root(f, t, t1, fa=f(t), fb=f(t1))
+                if kind is None or te < t1:
+                    kind, t1 = event, te
+
+            t = t1
+            x, y, vx, vy, ax, ay = state(t)
+            if kind == 'ground':
+                y = basket_bottom
+                result = 'Win' if passed_left and not passed_right else 'Fail'
+                stop = True
+            elif kind == 'left':
+                x = left_bar
+                cross_x, cross_y = x, y
+                if y <= basket_height:
+                    result, bar, stop = 'Fail', 'left', True
+                else:
+                    passed_left = True
+            elif kind == 'right':
+                x = right_bar
+                cross_x, cross_y = x, y
+                if y <= basket_height:
+                    result, bar, stop = 'Win', 'right', True
+                else:
+                    passed_right = True
 
             T.append(t)
             X.append(x)
             Y.append(y)
-            if flag:
+            if stop:
                 break
 
         T = array(T)
         X = array(X)
         Y = array(Y)
+        instrument.steps('projectile.motion.Adaptive', len(T) - 1)
+
+        outcome = Outcome(result, cross_x, cross_y, x, t, bar)
+        if self.reporter is not None:
+            self.reporter(person, outcome)
+
+        return T, X, Y, outcome
+
+    @instrument.timed()
+    def DragBatch(self, v0, deg, Cd, A, m, x0=0.0, y0=0.0, dt=0.1, ragged=False, person=None, ground=None):
+        """ Returns the trajectories of many launches at once when there is air resistance
+            - Every parameter may be a scalar or an array, they are broadcast together
+            - All launches share the same time grid T
+            - X and Y are padded with nan after the last point of each launch, whose
+              index is given by landing; with ragged=True they are lists of arrays
+            - outcome is a record array with the fields of Outcome, one per launch
+            - person is an optional sequence of names given to the reporter
+            - with ground, there is no basket: each launch flies until its first point
+              that is not above that height (the result and bar of its outcome are '')
+            Points and outcomes are identical to calling Drag once per launch.
+        """
+        v0, deg, Cd, A, m, x0, y0 = [a.ravel() for a in
+                                     broadcast_arrays(*[asarray(a, dtype=float) for a in (v0, deg, Cd, A, m, x0, y0)])]
+        n = v0.size
+
+        theta = deg2rad(deg)
+        vt = sqrt((2 * m * abs(g)) / (p * A * Cd))
+        cx = ((v0 * vt) / abs(g)) * cos(theta)  # same operation order as in Drag
+        cy = (vt / abs(g)) * (v0 * sin(theta) + vt)
+
+        bottom = 0.0 if ground is None else float(ground)
+        t_bound = _flight_bound(v0, deg, Cd, A, m, y0 - bottom)
+        steps = int(ceil(t_bound[isfinite(t_bound)].max(initial=0.0) / dt)) + 2
+
+        # shared time grid, accumulated the same way as t += dt
+        T = full(steps + 1, dt)
+        T[0] = 0.0
+        T = cumsum(T)
+
+        X = full((n, steps + 1), nan)
+        Y = full((n, steps + 1), nan)
+        X[:, 0] = x0
+        Y[:, 0] = y0
+        landing = zeros(n, dtype=int)
+        result = full(n, '', dtype='<U4')
+        cross_x = full(n, nan)
+        cross_y = full(n, nan)
+        stopped = zeros(n, dtype=bool)
+        passed_left = zeros(n, dtype=bool)
+        passed_right = zeros(n, dtype=bool)
+
+        # indices of launches still in the air, shrinks as they land or hit a bar
+        live = arange(n)
+        k = 0
+        while live.size and k < steps:
+            k += 1
+            t = T[k]
+            e = exp(g * t / vt[live])
+            x = x0[live] + cx[live] * (1 - e)
+            y = y0[live] + cy[live] * (1 - e) - vt[live] * t
+            Xp = X[live, k - 1]
+            Yp = Y[live, k - 1]
+            pl = passed_left[live]
+            pr = passed_right[live]
+            flag = zeros(live.size, dtype=bool)
+            res = full(live.size, '', dtype='<U4')
+            cx_k = cross_x[live]
+            cy_k = cross_y[live]
+
+            if ground is None:
+                # vectorized version of the branches in failure()
+                land = (y <= basket_bottom) & (x > 0) & (y - Yp < 0)
+                res[land] = 'Fail'
+                res[land & pl & ~pr] = 'Win'
+
+                rest = ~land
+                on_left = rest & (x == left_bar)
+                flag |= on_left & (y <= basket_height)
+                pl = pl | (on_left & (y > basket_height))
+                res[on_left] = 'Fail'
+                cx_k[on_left] = x[on_left]
+                cy_k[on_left] = y[on_left]
+
+                rest &= ~on_left
+                cross_left = rest & (x > left_bar) & ~passed_left[live]
+                with errstate(divide='ignore', invalid='ignore'):
+                    y_at_left = (y - Yp) / (x - Xp) * (left_bar - Xp) + Yp
+                hit = cross_left & (y_at_left <= basket_height)
+                x[hit] = left_bar
+                y[hit] = y_at_left[hit]
+                flag |= hit
+                pl = pl | (cross_left & ~hit)
+                res[cross_left] = 'Fail'
+                cx_k[cross_left] = left_bar
+                cy_k[cross_left] = y_at_left[cross_left]
+
+                rest &= ~cross_left
+                on_right = rest & (x == right_bar)
+                hit = on_right & (y < basket_height)
+                flag |= hit
+                res[hit] = 'Win'
+                cx_k[on_right] = x[on_right]
+                cy_k[on_right] = y[on_right]
+
+                rest &= ~on_right
+                cross_right = rest & (x > right_bar) & ~pr
+                with errstate(divide='ignore', invalid='ignore'):
+                    y_at_right = (y - Yp) / (x - Xp) * (right_bar - Xp) + Yp
+                hit = cross_right & ~(y_at_right > basket_height)
+                x[hit] = right_bar
+                y[hit] = y_at_right[hit]
+                flag |= hit
+                pr = pr | (cross_right & ~hit)
+                res[cross_right & ~hit] = 'Fail'
+                res[hit] = 'Win'
+                cx_k[cross_right] = right_bar
+                cy_k[cross_right] = y_at_right[cross_right]
+
+            X[live, k] = x
+            Y[live, k] = y
+            passed_left[live] = pl
+            passed_right[live] = pr
+            cross_x[live] = cx_k
+            cross_y[live] = cy_k
+
+            done = flag | ~(y > bottom)
+            finished = live[done]
+            landing[finished] = k
+            result[finished] = res[done]
+            stopped[finished] = flag[done]
+            live = live[~done]
+        landing[live] = k
+        instrument.steps('projectile.motion.DragBatch', landing)
+
+        rows = arange(n)
+        landing_x = X[rows, landing]
+        bar = where(stopped & (landing_x == left_bar), 'left', where(stopped & (landing_x == right_bar), 'right', ''))
+        outcome = rec.fromarrays([result, cross_x, cross_y, landing_x, T[landing], bar], names=Outcome._fields)
+        if self.reporter is not None and person is not None:
+            for name, out in zip(person, outcome):
+                self.reporter(name, Outcome(*out.tolist()))
+
+        if ragged:
+            X = [X[i, :landing[i] + 1] for i in range(n)]
+            Y = [Y[i, :landing[i] + 1] for i in range(n)]
+
+        return T, X, Y, landing, outcome
+
+    def DragSpecs(self, obj, v0=100, deg=45, dt=0.1, ragged=False, person=None):
+        # DragBatch for a record array of objects (objects.makeSpecs), one launch per record
+        return self.DragBatch(v0, deg, obj.Cd, obj.A, obj.m, obj.x0, obj.y0, dt=dt, ragged=ragged, person=person)
+
+    @instrument.timed()
+    def classify(self, obj, v0=100, deg=45):
+        """ Decides 'Win' or 'Fail' with the closed form of the Drag motion, without
+            generating the trajectory
+            - the object properties, v0 and deg may also be arrays of launches
+            - returns the result, and the heights at which the object crosses the
+              left and the right bar (nan when it never reaches them)
+            The crossings are exact, so launches that graze a bar may differ from
+            the linear interpolation between the points of Drag.
+        """
+        theta = deg2rad(asarray(deg, dtype=float))
+        m, A, Cd = [asarray(a, dtype=float) for a in (obj.m, obj.A, obj.Cd)]
+        with errstate(divide='ignore'):
+            vt = sqrt((2 * m * abs(g)) / (p * A * Cd))
+
+        y_left = _height_at(left_bar, obj.x0, obj.y0, v0, theta, vt)
+        y_right = _height_at(right_bar, obj.x0, obj.y0, v0, theta, vt)
+
+        # the object goes over the left bar, and then either falls into the basket
+        # before reaching the right bar or hits it from the inside
+        passed_left = y_left > basket_height
+        win = passed_left & ~(y_right > basket_height)
+        result = where(win, 'Win', 'Fail')
 
-        return T, X, Y, result
+        return result[()], y_left[()], y_right[()]
 
-    def failure(self, x, y, X, Y, passed_left, passed_right, flag, person):
+    def failure(self, x, y, x_prev, y_prev, passed_left, passed_right, flag):
         # Function that tests each trajectory to check if reached the target, only works for Drag conditions
+        # x_prev and y_prev are the previous point of the trajectory
+        # Also returns the point where the object crossed the line of a bar in this step, or None
         result = ''
-        if y <= basket_bottom and x > 0 and y - Y[-1] < 0:
+        crossing = None
+        if y <= basket_bottom and x > 0 and y - y_prev < 0:
             if passed_left and not passed_right:
-                print("%s - Success" %person)
                 result = 'Win'
             else:
-                print("%s - Failure" %person)
                 result = 'Fail'
         else:
             # x happens to be at exactly 400
             if x == left_bar:
+                crossing = (x, y)
                 if y <= basket_height:
-                    print("%s - Failure" %person)
                     flag = True
                     result = 'Fail'
                 else:
@@ -111,9 +645,9 @@ class motion:
                     result = 'Fail'
             # more common case since Xs are discrete points
             elif x > left_bar and not passed_left:
-                y_at_400 = (y - Y[-1]) / (x - X[-1]) * (left_bar - X[-1]) + Y[-1]
+                y_at_400 = (y - y_prev) / (x - x_prev) * (left_bar - x_prev) + y_prev
+                crossing = (left_bar, y_at_400)
                 if y_at_400 <= basket_height:
-                    print("%s - Failure" %person)
                     x = left_bar
                     y = y_at_400
                     flag = True
@@ -123,20 +657,20 @@ class motion:
                     result = 'Fail'
             # x happens to be at exactly 600
             elif x == right_bar:
+                crossing = (x, y)
                 if y < basket_height:
-                    print("%s - Success" %person)
                     result = 'Win'
                     flag = True
             # more common case
             elif x > right_bar and not passed_right:
-                y_at_600 = (y - Y[-1]) / (x - X[-1]) * (right_bar - X[-1]) + Y[-1]
+                y_at_600 = (y - y_prev) / (x - x_prev) * (right_bar - x_prev) + y_prev
+                crossing = (right_bar, y_at_600)
                 if y_at_600 > basket_height:
                     passed_right = True
                     result = 'Fail'
                 else:
-                    print("%s - Success" %person)
                     x = right_bar
                     y = y_at_600
                     flag = True
                     result = 'Win'
-        return x, y, passed_left, passed_right, flag, result
+        return x, y, passed_left, passed_right, flag, result, crossing
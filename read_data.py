@@ -1,19 +1,132 @@
-import sys
-from numpy import genfromtxt
+import csv
+import math
+import os
+from numpy import array
+from numpy import concatenate
+from numpy import dtype
+from numpy import empty
+from numpy import float64
+from numpy import stack
+
+import instrument
+import objects
+
+# Type of one row of the parameter file, in the order of its columns
+# (names are Python strings, so they may have any length)
+row_dtype = dtype([('name', object), ('speed', float64), ('angle', float64), ('Cd', float64),
+                   ('diameter', float64), ('area', float64), ('mass', float64), ('obj_type', 'i8')])
+
+
+class ReadError(Exception):
+    # Raised when the parameter file cannot be opened or does not have the expected columns
+    pass
+
+
+def check_row(row):
+    """ Returns why a parsed row (name, speed, angle, Cd, diameter, area, mass, obj_type)
+        cannot be simulated, or None if it can: the values must be finite, the type one of
+        objects.types and, for a custom object (type 0), Cd, diameter, area and mass
+        greater than 0 (the preset types do not use them)
+    """
+    if not all(math.isfinite(value) for value in row[1:7]):
+        return 'values must be finite numbers'
+    if row[7] not in objects.types:
+        return 'Object type given is invalid: %d' % row[7]
+    if row[7] == 0:
+        for value, label in zip(row[3:7], ('drag coefficient (Cd)', 'diameter', 'reference area', 'mass')):
+            if not value > 0:
+                return 'The %s of a custom object must be greater than 0.' % label
+    return None
 
 
 class read_data:
     # Class that reads the parameter file
-    def read_file(self):
+    def __init__(self):
+        # Rows that could not be parsed by the last read, as (line number, message)
+        self.errors = []
+
+    def read_chunks(self, filename='projectile_input.csv', chunk_size=65536, on_error=None):
+        """ Reads the parameter file in one pass and yields it in pieces
+            - Each piece is a structured array (row_dtype) of at most chunk_size rows
+            - Only one piece is held in memory at a time
+            - Rows that cannot be parsed or simulated (see check_row) are skipped and
+              passed to on_error(line, message), by default they are kept in self.errors
+            - filename may also be the directory of a binary store (see storage.py)
+        """
+        self.errors = []
+        if os.path.isdir(filename):
+            from storage import launch_chunks # storage imports this module
+            yield from launch_chunks(filename, chunk_size)
+            return
+        if on_error is None:
+            on_error = lambda line, message: self.errors.append((line, message))
+        report = on_error
+        def on_error(line, message):
+            instrument.count('read_data.skipped')
+            report(line, message)
+
+        try:
+            stream = open(filename, newline='')
+        except OSError as error:
+            raise ReadError('File %s not available: %s' % (filename, error.strerror))
+
+        with stream:
+            reader = csv.reader(stream)
+            header = next(reader, None)
+            if header is None or len(header) != len(row_dtype.names):
+                raise ReadError('File %s does not have the expected %d columns' % (filename, len(row_dtype.names)))
+
+            rows = []
+            start = instrument.clock()
+            for row in reader:
+                if not row or not ''.join(row).strip():
+                    continue # blank line
+                if len(row) != len(row_dtype.names):
+                    on_error(reader.line_num, 'expected %d columns, found %d' % (len(row_dtype.names), len(row)))
+                    continue
+                try:
+                    obj_type = float(row[7])
+                    if not obj_type.is_integer():
+                        raise ValueError('object type must be an integer: %r' % row[7].strip())
+                    parsed = (row[0].strip(),) + tuple(float(value) for value in row[1:7]) + (int(obj_type),)
+                except ValueError as error:
+                    on_error(reader.line_num, str(error))
+                    continue
+                message = check_row(parsed)
+                if message is not None:
+                    on_error(reader.line_num, message)
+                    continue
+                rows.append(parsed)
+
+                if len(rows) == chunk_size:
+                    chunk = array(rows, dtype=row_dtype)
+                    instrument.record('read_data.read_chunks', start, rows=len(chunk))
+                    instrument.count('read_data.rows', len(chunk))
+                    yield chunk
+                    rows = []
+                    start = instrument.clock()
+            if rows:
+                chunk = array(rows, dtype=row_dtype)
+                instrument.record('read_data.read_chunks', start, rows=len(chunk))
+                instrument.count('read_data.rows', len(chunk))
+                yield chunk
+
+    @instrument.timed()
+    def parameters(self, chunk):
+        """ Splits a structured chunk into the parameter array used by main.Renderer,
+            with columns speed, angle, Cd, diameter, area, mass and obj_type, and the names
+        """
+        columns = [chunk[name].astype(float64) for name in row_dtype.names[1:]]
+        return stack(columns, axis=1), chunk['name']
+
+    @instrument.timed()
+    def read_file(self, filename='projectile_input.csv'):
         """ Class that reads the parameter file
             - Reads the player names
             - Reads the parameters for each player
+            Rows that cannot be parsed are skipped and listed in self.errors.
         """
-        try:
-            projectile_input = genfromtxt('projectile_input.csv', delimiter=',', skip_header=True)[:, 1:]
-            names = genfromtxt('projectile_input.csv', delimiter=',', usecols=0, skip_header=True, dtype=str)
-
-            return projectile_input, names
-        except:
-            print('File not available or format is not the expected')
-            sys.exit(1)
+        chunks = list(self.read_chunks(filename))
+        if not chunks:
+            return self.parameters(empty(0, dtype=row_dtype))
+        return self.parameters(concatenate(chunks))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+"""Headless tournament runner -
+    Scores every launch of a projectile input file without plotting anything:
+    - The input file is streamed in batches of rows, so its size is not bounded by memory
+    - The parameters of a batch are copied into a shared memory array
+    - The launches are split in chunks, scored by a pool of processes with
+      motion.DragBatch, and merged back in the order of the input file; inside a chunk,
+      launches with long flights are scored in separate DragBatch calls, so the padded
+      arrays of a call stay bounded whatever the input (_groups)
+    - The outcome of each launch is written as csv, and optionally the trajectories
+      to a binary store (see storage.py)
+    - The input may be a csv file or a binary store directory
+
+    Usage:
+        python runner.py [input file] [--workers N] [--chunk-size N] [--batch-size N] [--output file]
+                         [--trajectories directory] [--profile file] [--trace file]
+
+    Only the stages that run in this process are profiled, use --workers 1 to include
+    the scoring itself.
+
+"""
+
+import argparse
+import csv
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import instrument
+import objects as obj
+import projectile as proj
+from read_data import read_data, ReadError
+from storage import TrajectoryWriter, pack
+
+def launch_columns(param_input):
+    """ Converts the rows given by read_data.read_file into an (n, 7) float64 array
+        with the columns v0, deg, Cd, A, m, x0, y0 (the arguments of DragBatch), using
+        the preset properties for objects of type 1 to 3 in the same way as main.Renderer
+    """
+    param_input = np.atleast_2d(param_input)
+    specs = obj.specsFromTypes(param_input[:, 6].astype(int), Cd=param_input[:, 2],
+                               A=param_input[:, 4] * param_input[:, 3] * param_input[:, 3], mass=param_input[:, 5])
+    return np.column_stack([param_input[:, 0], param_input[:, 1], specs.Cd, specs.A, specs.m, specs.x0, specs.y0])
+
+
+def _groups(launches, dt, max_points):
+    """ Splits the launches into groups of rows whose DragBatch grid (rows times the
+        steps of the longest flight) has at most max_points points, so one launch with a
+        very long flight does not make the arrays of a whole chunk huge; a launch longer
+        than max_points is alone in its group
+    """
+    v0, deg, Cd, A, m, x0, y0 = launches.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_bound = proj._flight_bound(v0, deg, Cd, A, m, y0)
+    steps = np.where(np.isfinite(t_bound), np.ceil(t_bound / dt), 0) + 3
+    if len(launches) * steps.max(initial=0) <= max_points:
+        return [np.arange(len(launches))]
+
+    order = np.argsort(steps, kind='stable')
+    groups = []
+    start = 0
+    for i, row in enumerate(order): # the steps grow along order, row sets the size of the group
+        if (i + 1 - start) * steps[row] > max_points and i > start:
+            groups.append(order[start:i])
+            start = i
+    groups.append(order[start:])
+    return groups
+
+
+def _score(launches, dt, keep, max_points=1 << 22):
+    # Scores the launches, returns the outcome and the packed trajectories if kept
+    outcomes, packed = [], []
+    groups = _groups(launches, dt, max_points)
+    for rows in groups:
+        T, X, Y, landing, outcome = proj.motion().DragBatch(*launches[rows].T, dt=dt)
+        outcomes.append(outcome)
+        if keep:
+            packed.append(pack(T, X, Y, landing))
+    if len(groups) == 1:
+        return outcomes[0], packed[0] if keep else None
+
+    # back to the order of the launches
+    rows = np.concatenate(groups)
+    inverse = np.empty_like(rows)
+    inverse[rows] = np.arange(len(rows))
+    outcome = np.concatenate(outcomes)[inverse].view(np.recarray)
+    if not keep:
+        return outcome, None
+    t, x, y, counts = [np.concatenate(column) for column in zip(*packed)]
+    starts = (np.cumsum(counts) - counts)[inverse]
+    counts = counts[inverse]
+    points = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    return outcome, (t[points], x[points], y[points], counts)
+
+
+def _score_chunk(shm_name, shape, start, stop, dt, keep):
+    # Worker: attaches to the shared launch array and scores the rows start:stop
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        launches = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)[start:stop]
+        scored = _score(launches, dt, keep)
+        del launches # the view must be released before closing the shared memory
+    finally:
+        shm.close()
+    return scored
+
+
+@instrument.timed()
+def run(launches, workers=None, chunk_size=4096, dt=0.1, trajectories=None):
+    """ Scores an (n, 7) launch array, returns the outcome record array of DragBatch
+        in the same order as the launches
+        - workers is the number of processes (None uses every core, 1 runs inline)
+        - chunk_size is the number of launches sent to a worker at once
+        - trajectories is an optional storage.TrajectoryWriter the trajectories are
+          appended to, in the same order
+    """
+    keep = trajectories is not None
+    launches = np.ascontiguousarray(launches, dtype=np.float64)
+    chunks = [(start, min(start + chunk_size, len(launches))) for start in range(0, len(launches), chunk_size)]
+
+    if workers == 1 or len(chunks) <= 1:
+        parts = [_score(launches[start:stop], dt, keep) for start, stop in chunks]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=launches.nbytes)
+        try:
+            shared = np.ndarray(launches.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = launches
+            del shared
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_score_chunk, shm.name, launches.shape, start, stop, dt, keep)
+                           for start, stop in chunks]
+                parts = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    if keep:
+        for outcome, packed in parts:
+            trajectories.append(*packed)
+    if not parts:
+        return proj.motion().DragBatch([], [], [], [], [])[4]
+    return np.concatenate([outcome for outcome, packed in parts]).view(np.recarray)
+
+
+@instrument.timed()
+def write_outcome(writer, names, outcome):
+    # Writes one csv line per launch with its name and outcome
+    for name, row in zip(names, outcome.tolist()):
+        writer.writerow((name,) + row)
+
+
+def score_file(filename, stream, workers=None, chunk_size=4096, batch_size=1 << 20, dt=0.1, trajectories=None):
+    """ Scores the input file batch by batch and writes the outcomes as csv to stream
+        - trajectories is an optional TrajectoryWriter, as in run
+        Returns the list of (line, message) of the rows that could not be read.
+    """
+    reader = read_data()
+    chunks = reader.read_chunks(filename, chunk_size=batch_size)
+    first = next(chunks, None) # opens the file, so a ReadError comes before any output
+
+    writer = csv.writer(stream)
+    writer.writerow(('name',) + proj.Outcome._fields)
+    for chunk in chain([] if first is None else [first], chunks):
+        param_input, names = reader.parameters(chunk)
+        outcome = run(launch_columns(param_input), workers=workers, chunk_size=chunk_size, dt=dt,
+                      trajectories=trajectories)
+        write_outcome(writer, names, outcome)
+    return reader.errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a projectile input file without plotting.')
+    parser.add_argument('input', nargs='?', default='projectile_input.csv', help='projectile input file')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='launches per worker task')
+    parser.add_argument('--batch-size', type=int, default=1 << 20, help='rows read from the input file at once')
+    parser.add_argument('--dt', type=float, default=0.1, help='time step of the trajectories')
+    parser.add_argument('--output', default=None, help='csv file for the outcomes (default: stdout)')
+    parser.add_argument('--trajectories', default=None, help='store directory to write the trajectories to')
+    parser.add_argument('--profile', default=None, help='JSON file for a summary of the time spent in each stage')
+    parser.add_argument('--trace', default=None, help='Chrome trace file of every stage')
+    parser.add_argument('--profile-memory', action='store_true', help='also track allocations (slower)')
+    args = parser.parse_args(argv)
+
+    if args.profile or args.trace:
+        instrument.enable(memory=args.profile_memory)
+
+    options = dict(workers=args.workers, chunk_size=args.chunk_size, batch_size=args.batch_size, dt=args.dt)
+    if args.trajectories is not None:
+        options['trajectories'] = TrajectoryWriter(args.trajectories)
+    try:
+        if args.output is None:
+            errors = score_file(args.input, sys.stdout, **options)
+        else:
+            with open(args.output, 'w', newline='') as stream:
+                errors = score_file(args.input, stream, **options)
+    except ReadError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.trajectories is not None:
+            options['trajectories'].close()
+
+    for line, message in errors:
+        print('Line %d of the input file skipped: %s' % (line, message), file=sys.stderr)
+
+    if args.profile:
+        instrument.save_json(args.profile)
+    if args.trace:
+        instrument.save_trace(args.trace)
+
+
+if __name__ == '__main__':
+    main()
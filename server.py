@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+
+"""Scoring server -
+    Answers launch requests over a local TCP socket with asyncio, grouping the requests
+    that arrive together into one motion.DragBatch call (the same outcomes as motion.Drag),
+    run in an executor so the event loop keeps accepting requests:
+    - a request waits at most max_delay seconds for others to join its batch, and a batch
+      has at most max_batch launches
+    - at most max_queue requests wait for a batch; more are rejected at once ("overloaded",
+      HTTP 503), and each connection has at most max_in_flight requests being answered, so
+      a client that sends faster than the server scores is slowed down by TCP
+    - latency, queue wait, batch size and compute time are kept for the last requests and
+      reported by the metrics request
+
+    Two protocols are accepted on the same port:
+    - JSON lines: one request per line, e.g. {"id": 1, "v0": 200, "deg": 40, "obj_type": 1},
+      answered by one line with the same id and the fields of projectile.Outcome (the
+      answers of pipelined requests may come in any order); {"metrics": true} returns
+      the metrics
+    - HTTP: POST /score with one request or a list of them, GET /metrics
+
+    A request has the launch speed v0 and angle deg, and optionally the object type
+    (obj_type, as in the input file) and, for type 0, Cd, A, mass, x0 and y0. Launches
+    that Drag cannot score (Cd or mass not greater than 0) or out of the limits
+    (max_speed, max_position, max_mass, and a flight of at most max_flight seconds) are
+    rejected as errors (HTTP 400). HTTP bodies longer than max_body bytes are rejected
+    (HTTP 413).
+
+    Usage:
+        python server.py serve [--port 8765] [--max-batch N] [--max-delay s] [--max-queue N]
+        python server.py client [--port 8765] [--requests N] [--concurrency N]
+        python server.py demo [--requests N] [--concurrency N]  (both in one process)
+
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import instrument
+import objects as obj
+import projectile as proj
+
+
+# Limits of a request: DragBatch sizes the time grid of a whole batch by its longest
+# flight, so one launch out of range would make every launch of its batch slow and big
+max_speed = 1000.0    # m/s
+max_position = 1000.0 # m, for x0 and y0
+max_mass = 1000.0     # kg
+max_flight = 600.0    # s, upper bound of the flight time
+max_body = 1 << 20    # bytes, of an HTTP request
+
+
+class Overloaded(Exception):
+    # Raised by Batcher.submit when max_queue requests are already waiting
+    pass
+
+
+def launch_row(request):
+    """ Converts a launch request into the columns v0, deg, Cd, A, m, x0, y0 of
+        runner.launch_columns; raises ValueError when it is not valid
+    """
+    try:
+        v0 = float(request['v0'])
+        deg = float(request['deg'])
+        obj_type = float(request.get('obj_type', 0))
+        if not obj_type.is_integer():
+            raise ValueError('obj_type must be an integer')
+        spec = obj.specsFromTypes(int(obj_type), Cd=float(request.get('Cd', 1.0)),
+                                  A=float(request.get('A', 0.05)), x0=float(request.get('x0', 0.0)),
+                                  y0=float(request.get('y0', 0.0)), mass=float(request.get('mass', 1.0)))[0]
+    except KeyError as error:
+        raise ValueError('Missing %s' % error)
+    except (TypeError, AttributeError):
+        raise ValueError('A request must be a JSON object of numbers')
+    except Exception as error: # the checks of objects.makeSpecs
+        raise ValueError(str(error))
+    if not (math.isfinite(v0) and math.isfinite(deg)):
+        raise ValueError('v0 and deg must be finite')
+    if not abs(v0) <= max_speed:
+        raise ValueError('v0 must be at most %g m/s' % max_speed)
+    if not (abs(spec.x0) <= max_position and abs(spec.y0) <= max_position):
+        raise ValueError('x0 and y0 must be at most %g m' % max_position)
+    # Drag has no terminal velocity without drag or mass
+    if not spec.Cd > 0:
+        raise ValueError('The drag coefficient (Cd) must be greater than 0')
+    if not 0 < spec.m <= max_mass:
+        raise ValueError('mass must be greater than 0 and at most %g kg' % max_mass)
+
+    # the bound of the flight time used by DragBatch, y(t) <= y0 + cy - vt * t
+    vt = math.sqrt((2 * spec.m * abs(proj.g)) / (proj.p * spec.A * spec.Cd))
+    t_bound = (max(spec.y0, 0.0) + max((vt / abs(proj.g)) * (v0 * math.sin(math.radians(deg)) + vt), 0.0)) / vt
+    if not t_bound <= max_flight:
+        raise ValueError('The flight of this launch may last %.0f s, at most %g s are scored' % (t_bound, max_flight))
+    return (v0, deg, spec.Cd, spec.A, spec.m, spec.x0, spec.y0)
+
+
+def _score(columns, dt):
+    # Executor job: the outcome of each launch of the batch, as tuples
+    T, X, Y, landing, outcome = proj.motion().DragBatch(*columns.T, dt=dt)
+    return outcome.tolist()
+
+
+def _answer(outcome):
+    # JSON fields of an outcome, nan as null
+    return {name: (None if isinstance(value, float) and math.isnan(value) else value)
+            for name, value in zip(proj.Outcome._fields, outcome)}
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None}
+    p50, p90, p99 = np.percentile(np.array(values), [50, 90, 99]) * 1e3
+    return {'p50': p50, 'p90': p90, 'p99': p99}
+
+
+class Batcher:
+    """ Groups the launches submitted by concurrent requests into DragBatch calls
+        - submit(row) returns a future of the outcome tuple, or raises Overloaded
+        - start() and stop() must be called from the running event loop
+        - metrics() summarizes the last window requests (times in milliseconds)
+    """
+    def __init__(self, max_batch=1024, max_delay=0.002, max_queue=8192, dt=0.1, executor=None, window=10000):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.dt = dt
+        self.executor = executor
+        self.queue = None
+        self.task = None
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.latency = deque(maxlen=window)     # from submit to outcome, seconds
+        self.wait = deque(maxlen=window)        # from submit to the start of its batch
+        self.compute = deque(maxlen=window)     # of each batch
+        self.batch_sizes = deque(maxlen=window)
+
+    def start(self):
+        self.queue = asyncio.Queue(self.max_queue)
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((row, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise Overloaded('Server overloaded, %d requests waiting' % self.max_queue)
+        self.requests += 1
+        return future
+
+    async def _collect(self):
+        # Waits for a request, then for others until the batch is full or max_delay passed
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            start = time.perf_counter()
+            columns = np.array([row for row, future, submitted in batch], dtype=float)
+            try:
+                outcomes = await loop.run_in_executor(self.executor, _score, columns, self.dt)
+            except Exception as error:
+                for row, future, submitted in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            stop = time.perf_counter()
+
+            for (row, future, submitted), outcome in zip(batch, outcomes):
+                if not future.done(): # the client may have gone
+                    future.set_result(outcome)
+                self.latency.append(stop - submitted)
+                self.wait.append(start - submitted)
+            self.batches += 1
+            self.batch_sizes.append(len(batch))
+            self.compute.append(stop - start)
+            instrument.record('server.batch', start, stop, launches=len(batch))
+
+    def metrics(self):
+        return {
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'mean_batch': float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+            'latency_ms': _percentiles(self.latency),
+            'wait_ms': _percentiles(self.wait),
+            'compute_ms': _percentiles(self.compute),
+        }
+
+
+class ScoringServer:
+    """ asyncio server answering launch requests with a Batcher, see the module docstring
+        - start(host, port) listens (port 0 picks a free port, kept in self.port)
+    """
+    def __init__(self, batcher=None, max_in_flight=1024):
+        self.batcher = batcher or Batcher()
+        self.max_in_flight = max_in_flight
+        self.server = None
+        self.port = None
+
+    async def start(self, host='127.0.0.1', port=8765):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._connection, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def score(self, request):
+        # Answer to one request, as a dictionary with its id
+        answer = {'id': request.get('id')} if isinstance(request, dict) else {}
+        try:
+            answer.update(_answer(await self.batcher.submit(launch_row(request))))
+        except (ValueError, Overloaded) as error:
+            answer['error'] = str(error)
+            answer['overloaded'] = isinstance(error, Overloaded)
+        return answer
+
+    async def _connection(self, reader, writer):
+        try:
+            first = await reader.readline()
+            if first.split(b' ', 1)[0] in (b'GET', b'POST'):
+                await self._http(first, reader, writer)
+            else:
+                await self._lines(first, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _lines(self, line, reader, writer):
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+
+        async def answer(line):
+            try:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {'error': 'Not valid JSON'}
+                else:
+                    if isinstance(request, dict) and request.get('metrics'):
+                        response = self.batcher.metrics()
+                    else:
+                        response = await self.score(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+            finally:
+                slots.release()
+
+        while line:
+            if line.strip():
+                await slots.acquire() # stops reading while max_in_flight are being answered
+                task = asyncio.get_running_loop().create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            line = await reader.readline()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _respond(self, writer, status, response):
+        content = json.dumps(response).encode()
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Content Too Large',
+                  503: 'Service Unavailable'}[status]
+        writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                     % (status, reason.encode(), len(content)) + content)
+        await writer.drain()
+
+    async def _http(self, line, reader, writer):
+        while line:
+            words = line.decode('latin-1').split()
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = header.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                length = -1
+            if len(words) < 2 or length < 0:
+                # the end of this request is unknown, so the connection is closed
+                await self._respond(writer, 400, {'error': 'Malformed HTTP request'})
+                break
+            if length > max_body:
+                # the body is not read, so the connection is closed too
+                await self._respond(writer, 413, {'error': 'Request body over %d bytes' % max_body})
+                break
+            method, path = words[:2]
+            body = await reader.readexactly(length)
+
+            status = 200
+            if method == 'GET' and path == '/metrics':
+                response = self.batcher.metrics()
+            elif method == 'POST' and path == '/score':
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    status, response = 400, {'error': 'Not valid JSON'}
+                else:
+                    if isinstance(request, list):
+                        response = list(await asyncio.gather(*[self.score(item) for item in request]))
+                        answers = response
+                    else:
+                        response = await self.score(request)
+                        answers = [response]
+                    if any(answer.get('overloaded') for answer in answers):
+                        status = 503
+                    elif any('error' in answer for answer in answers):
+                        status = 400
+            else:
+                status, response = 404, {'error': 'Not found'}
+
+            await self._respond(writer, status, response)
+            if headers.get('connection', '').lower() == 'close':
+                break
+            line = await reader.readline()
+
+
+class ScoringClient:
+    """ Stand-in client of the JSON lines protocol, over one connection
+        - score(**launch) sends a request and returns the answer, requests may be
+          pipelined by awaiting several of them at once
+    """
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.pending = {}
+        self.next_id = 0
+        self.task = None
+
+    async def connect(self, host='127.0.0.1', port=8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.task = asyncio.get_running_loop().create_task(self._receive())
+
+    async def _receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            answer = json.loads(line)
+            future = self.pending.pop(answer.get('id', 'metrics'), None)
+            if future is not None and not future.done():
+                future.set_result(answer)
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('Connection closed by the server'))
+
+    async def _send(self, key, request):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        self.writer.write(json.dumps(request).encode() + b'\n')
+        await self.writer.drain()
+        return await future
+
+    async def score(self, **launch):
+        self.next_id += 1
+        return await self._send(self.next_id, dict(launch, id=self.next_id))
+
+    async def metrics(self):
+        return await self._send('metrics', {'metrics': True})
+
+    async def close(self):
+        self.writer.close()
+        await self.task
+
+
+async def load_test(host, port, requests=10000, concurrency=100, connections=4, seed=0):
+    """ Sends requests random launches from concurrency concurrent callers over a few
+        connections, returns the answers, the latency of each request in seconds and the
+        elapsed time
+    """
+    rng = np.random.default_rng(seed)
+    launches = [{'v0': v0, 'deg': deg, 'obj_type': obj_type} for v0, deg, obj_type in
+                zip(rng.uniform(20, 300, requests).tolist(), rng.uniform(5, 85, requests).tolist(),
+                    rng.integers(0, 4, requests).tolist())]
+    clients = [ScoringClient() for i in range(connections)]
+    for client in clients:
+        await client.connect(host, port)
+
+    answers = [None] * requests
+    latencies = np.zeros(requests)
+
+    async def caller(k):
+        for i in range(k, requests, concurrency):
+            start = time.perf_counter()
+            answers[i] = await clients[i % connections].score(**launches[i])
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*[caller(k) for k in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    metrics = await clients[0].metrics()
+    for client in clients:
+        await client.close()
+    return answers, latencies, elapsed, metrics
+
+
+def _report(answers, latencies, elapsed, metrics):
+    errors = sum('error' in answer for answer in answers)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    print('%d requests in %.2f s: %.0f requests/s, %d errors' % (len(answers), elapsed, len(answers) / elapsed, errors))
+    print('client latency: p50 %.2f ms, p90 %.2f ms, p99 %.2f ms' % (p50, p90, p99))
+    print('server: %s' % json.dumps(metrics))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scoring server of projectile launches.')
+    parser.add_argument('command', choices=('serve', 'client', 'demo'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch', type=int, default=1024, help='launches scored at once')
+    parser.add_argument('--max-delay', type=float, default=0.002, help='seconds a request waits for others')
+    parser.add_argument('--max-queue', type=int, default=8192, help='requests waiting before rejecting more')
+    parser.add_argument('--threads', type=int, default=1, help='batches scored at the same time')
+    parser.add_argument('--dt', type=float, default=0.1, help='time step of the trajectories')
+    parser.add_argument('--requests', type=int, default=10000, help='requests sent by the client')
+    parser.add_argument('--concurrency', type=int, default=100, help='concurrent requests of the client')
+    args = parser.parse_args(argv)
+
+    async def serve(port):
+        batcher = Batcher(max_batch=args.max_batch, max_delay=args.max_delay, max_queue=args.max_queue,
+                          dt=args.dt, executor=ThreadPoolExecutor(args.threads))
+        server = ScoringServer(batcher)
+        await server.start(args.host, port)
+        return server
+
+    async def run():
+        if args.command == 'serve':
+            server = await serve(args.port)
+            print('Listening on %s:%d' % (args.host, server.port))
+            await server.server.serve_forever()
+        elif args.command == 'client':
+            _report(*await load_test(args.host, args.port, args.requests, args.concurrency))
+        else:
+            server = await serve(0)
+            _report(*await load_test(args.host, server.port, args.requests, args.concurrency))
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    except ConnectionError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+"""Inverse solver -
+    Finds the launches that land in the basket from the closed form of the Drag motion
+    (the same one motion.classify uses), for one object or for a record array of objects
+    (objects.makeSpecs) at once:
+    - speed_window: the winning speeds at given angles
+    - feasible_region: the winning speeds over a grid of angles
+    - min_speed: the lowest winning speed, and its angle
+    - hint: a winning speed at the angle each player chose, or another angle if none wins
+
+    At a given angle, the height of the object when it reaches a bar only grows with the
+    speed, so a launch wins exactly when v_min < v0 <= v_max: at v_min the object touches
+    the top of the left bar and at v_max the top of the right bar. Both are found by
+    bisection on the speed, for every launch at once.
+
+    Usage (hints for the players of an input file):
+        python solver.py [input file]
+
+"""
+
+import sys
+
+from numpy import argmin
+from numpy import asarray
+from numpy import broadcast_arrays
+from numpy import clip
+from numpy import cos
+from numpy import deg2rad
+from numpy import errstate
+from numpy import full
+from numpy import inf
+from numpy import isfinite
+from numpy import linspace
+from numpy import nan
+from numpy import sqrt
+from numpy import take_along_axis
+from numpy import tan
+from numpy import where
+from numpy import zeros
+
+import instrument
+import objects as obj
+from projectile import _height_at, g, p, basket_height, left_bar, right_bar
+from read_data import read_data, ReadError
+
+golden = (sqrt(5) - 1) / 2
+
+
+def _columns(spec):
+    # Terminal velocity and initial position of the objects (inf terminal velocity if Cd = 0)
+    m, A, Cd, x0, y0 = [asarray(a, dtype=float) for a in (spec.m, spec.A, spec.Cd, spec.x0, spec.y0)]
+    with errstate(divide='ignore'):
+        vt = sqrt((2 * m * abs(g)) / (p * A * Cd))
+    return vt, x0, y0
+
+
+def _speed_for_height(vt, x0, y0, theta, x, height, rtol=1e-12, maxiter=200):
+    # Bisection of the lowest speed at which the object is above height at the position x
+    vt, x0, y0, theta = broadcast_arrays(vt, x0, y0, theta)
+
+    def above(v):
+        with errstate(invalid='ignore'):
+            return _height_at(x, x0, y0, v, theta, vt) > height
+
+    # the faster the launch, the closer the path is to the straight line of the launch
+    # direction, so no speed is enough if that line does not pass above height
+    with errstate(invalid='ignore'):
+        reachable = (x > x0) & (cos(theta) > 0) & (y0 + tan(theta) * (x - x0) > height)
+
+    lo = zeros(theta.shape)
+    hi = full(theta.shape, 1.0)
+    for i in range(1100): # the highest finite float is below 2^1024
+        grow = reachable & ~above(hi)
+        if not grow.any():
+            break
+        lo = where(grow, hi, lo)
+        hi = where(grow, 2 * hi, hi)
+
+    for i in range(maxiter):
+        mid = 0.5 * (lo + hi)
+        up = above(mid)
+        hi = where(up, mid, hi)
+        lo = where(up, lo, mid)
+        if ((hi - lo) <= rtol * hi).all():
+            break
+    return where(reachable & isfinite(hi), hi, inf)
+
+
+def speed_for_height(spec, deg, x, height=basket_height, rtol=1e-12):
+    """ Lowest speed at which the object launched at deg degrees is above height when it
+        reaches the horizontal position x; inf if no speed is enough
+        - the object properties and deg may be arrays, they are broadcast together
+    """
+    vt, x0, y0 = _columns(spec)
+    return _speed_for_height(vt, x0, y0, deg2rad(asarray(deg, dtype=float)), x, height, rtol)[()]
+
+
+@instrument.timed()
+def speed_window(spec, deg, rtol=1e-12):
+    """ Returns v_min and v_max: the launch at deg degrees wins when v_min < v0 <= v_max,
+        and no speed wins when v_min >= v_max (both are inf when the object cannot get
+        over the left bar at that angle)
+        - the object properties and deg may be arrays, they are broadcast together
+    """
+    vt, x0, y0 = _columns(spec)
+    theta = deg2rad(asarray(deg, dtype=float))
+    v_min = _speed_for_height(vt, x0, y0, theta, left_bar, basket_height, rtol)
+    v_max = _speed_for_height(vt, x0, y0, theta, right_bar, basket_height, rtol)
+    return v_min[()], v_max[()]
+
+
+@instrument.timed()
+def feasible_region(spec, angles=None, rtol=1e-12):
+    """ Winning speeds of each object over a grid of angles (1 to 89 degrees by default)
+        - returns the angles, and v_min and v_max with one row per object and one column
+          per angle, as in speed_window
+    """
+    angles = linspace(1, 89, 89) if angles is None else asarray(angles, dtype=float)
+    vt, x0, y0 = [column[..., None] for column in _columns(spec)]
+    theta = deg2rad(angles)
+    v_min = _speed_for_height(vt, x0, y0, theta, left_bar, basket_height, rtol)
+    v_max = _speed_for_height(vt, x0, y0, theta, right_bar, basket_height, rtol)
+    return angles, v_min, v_max
+
+
+@instrument.timed()
+def min_speed(spec, angles=None, iterations=40, rtol=1e-12):
+    """ Lowest speed that wins, and the angle to throw at, for each object
+        - the best angle of the grid (feasible_region) is refined by golden section
+          search between its neighbours
+        - the launch wins for any speed just above the returned one; both are inf and
+          nan when no angle of the grid wins
+    """
+    angles, v_min, v_max = feasible_region(spec, angles, rtol)
+    candidates = where(v_min < v_max, v_min, inf)
+    best = argmin(candidates, axis=-1)[..., None]
+    speed = take_along_axis(candidates, best, axis=-1)[..., 0]
+    deg = where(isfinite(speed), angles[best[..., 0]], nan)
+
+    # the speed needed to get over the left bar has a single minimum in the angle
+    vt, x0, y0 = _columns(spec)
+    a = angles[clip(best[..., 0] - 1, 0, len(angles) - 1)]
+    b = angles[clip(best[..., 0] + 1, 0, len(angles) - 1)]
+    c = b - golden * (b - a)
+    d = a + golden * (b - a)
+    fc = _speed_for_height(vt, x0, y0, deg2rad(c), left_bar, basket_height, rtol)
+    fd = _speed_for_height(vt, x0, y0, deg2rad(d), left_bar, basket_height, rtol)
+    for i in range(iterations):
+        left = fc < fd
+        a, b = where(left, a, c), where(left, d, b)
+        # one inner point is kept, the other one is new
+        new = where(left, b - golden * (b - a), a + golden * (b - a))
+        f = _speed_for_height(vt, x0, y0, deg2rad(new), left_bar, basket_height, rtol)
+        c, d = where(left, new, d), where(left, c, new)
+        fc, fd = where(left, f, fd), where(left, fc, f)
+
+    # keep the refined angle only if it is better and still wins
+    refined = 0.5 * (a + b)
+    v_low, v_high = speed_window(spec, refined, rtol)
+    better = isfinite(speed) & (v_low < v_high) & (v_low < speed)
+    return where(better, v_low, speed)[()], where(better, refined, deg)[()]
+
+
+@instrument.timed()
+def hint(spec, deg, angles=None):
+    """ Suggests a launch that wins for each object: the middle of the winning speeds at
+        the chosen angle, or at the angle of min_speed when no speed wins at that angle
+        - returns the speed and the angle, inf and nan if no angle wins
+    """
+    v_min, v_max = speed_window(spec, deg)
+    wins = v_min < v_max
+    speed, best = min_speed(spec, angles)
+    deg = where(wins, deg, best)
+    v_low, v_high = speed_window(spec, deg)
+    found = wins | isfinite(speed)
+    with errstate(invalid='ignore'):
+        return where(found, 0.5 * (v_low + v_high), inf)[()], where(found, deg, nan)[()]
+
+
+if __name__ == '__main__':
+    from runner import launch_columns
+
+    reader = read_data()
+    try:
+        param_input, names = reader.read_file(sys.argv[1] if len(sys.argv) > 1 else 'projectile_input.csv')
+    except ReadError as error:
+        print(error)
+        sys.exit(1)
+    columns = launch_columns(param_input)
+    specs = obj.makeSpecs(columns[:, 2], columns[:, 3], columns[:, 5], columns[:, 6], columns[:, 4])
+
+    v_min, v_max = speed_window(specs, columns[:, 1])
+    speed, deg = hint(specs, columns[:, 1])
+    lowest, lowest_deg = min_speed(specs)
+    for i, name in enumerate(names):
+        print('%s (speed %g m/s, angle %g degrees):' % (name, columns[i, 0], columns[i, 1]))
+        if v_min[i] < v_max[i]:
+            print('    wins at this angle with speeds above %.2f and up to %.2f m/s, try %.2f m/s'
+                  % (v_min[i], v_max[i], speed[i]))
+        elif isfinite(speed[i]):
+            print('    no speed wins at this angle, try %.2f m/s at %.2f degrees' % (speed[i], deg[i]))
+        else:
+            print('    this object cannot land in the basket')
+        if isfinite(lowest[i]):
+            print('    the slowest winning throw is just above %.2f m/s at %.2f degrees' % (lowest[i], lowest_deg[i]))
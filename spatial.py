@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+"""Spatial index of trajectories -
+    Finds the trajectories that pass through a region without scanning every point:
+    - box: the trajectories with a segment inside a rectangle
+    - radius: the trajectories that pass within a distance of a point
+    - segment and crossings: the trajectories that cross a segment (a window, a bar)
+
+    The segments between consecutive points of every trajectory are put in the cells of
+    a uniform grid that their bounding box overlaps, and the (cell, segment) pairs are
+    sorted by cell. The cells of one column of the grid are contiguous, so a query finds
+    the segments of each column it overlaps with two binary searches and only tests
+    those exactly: its cost grows with the number of segments near the region, not with
+    the number of trajectories.
+
+    intersect is the vectorized segment intersection test used by the queries.
+
+    Usage (throws of a store that passed within 5 m of the top of the left bar):
+        python spatial.py directory 400 50 5
+
+"""
+
+import sys
+
+from numpy import arange
+from numpy import argsort
+from numpy import asarray
+from numpy import concatenate
+from numpy import cumsum
+from numpy import errstate
+from numpy import floor
+from numpy import full
+from numpy import int64
+from numpy import isfinite
+from numpy import maximum
+from numpy import median
+from numpy import minimum
+from numpy import nan
+from numpy import ones
+from numpy import repeat
+from numpy import searchsorted
+from numpy import sqrt
+from numpy import unique
+from numpy import where
+from numpy import zeros
+
+import instrument
+
+
+def intersect(ax, ay, bx, by, cx, cy, dx, dy):
+    """ Intersection of the segments (a, b) and (c, d), all arrays are broadcast together
+        - returns hit, and s: the fraction of (a, b) where it first touches (c, d)
+          (nan without hit)
+        - collinear segments that overlap hit at the start of the overlap, and a segment
+          of length 0 hits if its point is on the other segment
+    """
+    ax, ay, bx, by, cx, cy, dx, dy = [asarray(v, dtype=float) for v in (ax, ay, bx, by, cx, cy, dx, dy)]
+    rx, ry = bx - ax, by - ay
+    ux, uy = dx - cx, dy - cy
+    qx, qy = cx - ax, cy - ay
+    denom = rx * uy - ry * ux
+    cross_r = qx * ry - qy * rx
+    cross_u = qx * uy - qy * ux
+    with errstate(invalid='ignore', divide='ignore'):
+        s = cross_u / denom
+        u = cross_r / denom
+        hit = (denom != 0) & (s >= 0) & (s <= 1) & (u >= 0) & (u <= 1)
+
+        # parallel segments only touch when they are on the same line
+        rr = rx * rx + ry * ry
+        uu = ux * ux + uy * uy
+        collinear = (denom == 0) & (cross_r == 0) & (cross_u == 0)
+        s0 = (qx * rx + qy * ry) / rr
+        s1 = ((dx - ax) * rx + (dy - ay) * ry) / rr
+        low = maximum(minimum(s0, s1), 0.0)
+        overlap = collinear & (rr > 0) & (low <= minimum(maximum(s0, s1), 1.0))
+        # (a, b) is a point: on (c, d), or equal to it if (c, d) is a point too
+        on = -(qx * ux + qy * uy) / uu
+        point = collinear & (rr == 0) & where(uu > 0, (on >= 0) & (on <= 1), (qx == 0) & (qy == 0))
+
+    s = where(hit, s, where(overlap, low, where(point, 0.0, nan)))
+    return hit | overlap | point, s
+
+
+def _in_box(x1, y1, x2, y2, x_min, y_min, x_max, y_max):
+    # Whether the segments have a part inside the rectangle (Liang-Barsky clipping)
+    dx, dy = x2 - x1, y2 - y1
+    low = zeros(dx.shape)
+    high = ones(dx.shape)
+    outside = zeros(dx.shape, dtype=bool)
+    for p, q in ((-dx, x1 - x_min), (dx, x_max - x1), (-dy, y1 - y_min), (dy, y_max - y1)):
+        with errstate(invalid='ignore', divide='ignore'):
+            r = q / p
+        outside |= (p == 0) & (q < 0)
+        low = where(p < 0, maximum(low, r), low)
+        high = where(p > 0, minimum(high, r), high)
+    return ~outside & (low <= high)
+
+
+def _distance(x1, y1, x2, y2, px, py):
+    # Distance from the point p to the segments
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    with errstate(invalid='ignore', divide='ignore'):
+        f = where(length > 0, ((px - x1) * dx + (py - y1) * dy) / length, 0.0)
+    f = minimum(maximum(f, 0.0), 1.0)
+    return sqrt((x1 + f * dx - px) ** 2 + (y1 + f * dy - py) ** 2)
+
+
+def _ranges(starts, stops):
+    # Concatenation of arange(start, stop) for each pair
+    lengths = maximum(stops - starts, 0)
+    total = lengths.sum()
+    if total == 0:
+        return zeros(0, dtype=int64)
+    first = cumsum(lengths) - lengths
+    return repeat(starts - first, lengths) + arange(total)
+
+
+def _links(offsets, points):
+    # Whether segment k, from point k to k + 1, is inside a trajectory (k + 1 does not
+    # start the next one)
+    valid = ones(max(points - 1, 0), dtype=bool)
+    starts = asarray(offsets[1:-1])
+    valid[starts[(starts > 0) & (starts < points)] - 1] = False
+    return valid
+
+
+def _cells(ix0, ix1, iy0, iy1, ny):
+    # One (owner, key) pair per grid cell of each bounding box, the cells ix0..ix1 by
+    # iy0..iy1 of box i have owner i and key ix * ny + iy
+    rows = iy1 - iy0 + 1
+    cells = (ix1 - ix0 + 1) * rows
+    owner = repeat(arange(len(cells)), cells)
+    local = arange(cells.sum()) - repeat(cumsum(cells) - cells, cells)
+    return owner, (ix0[owner] + local // rows[owner]) * ny + iy0[owner] + local % rows[owner]
+
+
+class SegmentIndex:
+    """ Uniform grid over the segments of trajectories
+        - trajectories is a storage.TrajectoryCollection or a storage.TrajectoryFile (or
+          anything with their arrays() method), or a tuple (offsets, t, x, y)
+        - cell is the side of the grid cells in meters, by default about the typical
+          length of a segment, and bigger if the grid would have more cells than segments
+        - the points are read chunk_size segments at a time, so a memory-mapped store
+          is not loaded at once; the index keeps two int64 per (cell, segment) pair
+        - the queries return the sorted indices of the trajectories; trajectories of a
+          single point have no segment and are never found
+    """
+    @instrument.timed()
+    def __init__(self, trajectories, cell=None, chunk_size=1 << 20):
+        arrays = trajectories.arrays() if hasattr(trajectories, 'arrays') else trajectories
+        self.offsets, self.t, self.x, self.y = arrays
+        points = len(self.x)
+        self.size = max(points - 1, 0)
+        self.valid = _links(self.offsets, points)
+
+        x_low = y_low = float('inf')
+        x_high = y_high = -float('inf')
+        lengths = []
+        for lo in range(0, self.size, chunk_size):
+            x1, y1, x2, y2, keep = self._chunk(lo, min(lo + chunk_size, self.size))
+            if keep.any():
+                x_low = min(x_low, minimum(x1, x2)[keep].min())
+                x_high = max(x_high, maximum(x1, x2)[keep].max())
+                y_low = min(y_low, minimum(y1, y2)[keep].min())
+                y_high = max(y_high, maximum(y1, y2)[keep].max())
+                lengths.append(maximum(abs(x2 - x1), abs(y2 - y1))[keep][:65536])
+        self.valid_count = int(self.valid.sum())
+
+        if not lengths: # nothing to index
+            x_low = y_low = 0.0
+            x_high = y_high = 1.0
+        if cell is None:
+            cell = median(concatenate(lengths)) if lengths else 1.0
+            cell = max(cell, sqrt((x_high - x_low) * (y_high - y_low) / max(self.valid_count, 1)), 1e-9)
+        self.cell = float(cell)
+        self.x0, self.y0 = x_low, y_low
+        self.nx = int((x_high - x_low) // self.cell) + 1
+        self.ny = int((y_high - y_low) // self.cell) + 1
+
+        keys, segments = [], []
+        for lo in range(0, self.size, chunk_size):
+            x1, y1, x2, y2, keep = self._chunk(lo, min(lo + chunk_size, self.size))
+            segment = arange(lo, lo + len(x1))[keep]
+            x1, y1, x2, y2 = x1[keep], y1[keep], x2[keep], y2[keep]
+            ix0, ix1 = self._column(minimum(x1, x2)), self._column(maximum(x1, x2))
+            iy0, iy1 = self._row(minimum(y1, y2)), self._row(maximum(y1, y2))
+            owner, key = _cells(ix0, ix1, iy0, iy1, self.ny)
+            keys.append(key)
+            segments.append(segment[owner])
+
+        keys = concatenate(keys) if keys else zeros(0, dtype=int64)
+        segments = concatenate(segments) if segments else zeros(0, dtype=int64)
+        order = argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.segments = segments[order]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _chunk(self, lo, hi):
+        # Ends of the segments lo:hi, and which of them are indexed
+        x = asarray(self.x[lo:hi + 1], dtype=float)
+        y = asarray(self.y[lo:hi + 1], dtype=float)
+        x1, y1, x2, y2 = x[:-1], y[:-1], x[1:], y[1:]
+        keep = self.valid[lo:hi] & isfinite(x1) & isfinite(y1) & isfinite(x2) & isfinite(y2)
+        return x1, y1, x2, y2, keep
+
+    def _column(self, x):
+        return floor((asarray(x) - self.x0) / self.cell).astype(int64)
+
+    def _row(self, y):
+        return floor((asarray(y) - self.y0) / self.cell).astype(int64)
+
+    def _ends(self, segments):
+        # Ends of the given segments
+        x1, y1 = asarray(self.x[segments], dtype=float), asarray(self.y[segments], dtype=float)
+        x2, y2 = asarray(self.x[segments + 1], dtype=float), asarray(self.y[segments + 1], dtype=float)
+        return x1, y1, x2, y2
+
+    def _candidates(self, columns, row_low, row_high):
+        # Segments in the rows row_low to row_high of each column (clipped to the grid)
+        keep = (columns >= 0) & (columns < self.nx)
+        columns = columns[keep]
+        row_low = minimum(maximum(row_low[keep], 0), self.ny - 1)
+        row_high = minimum(maximum(row_high[keep], 0), self.ny - 1)
+        starts = searchsorted(self.keys, columns * self.ny + row_low, side='left')
+        stops = searchsorted(self.keys, columns * self.ny + row_high, side='right')
+        return unique(self.segments[_ranges(starts, stops)])
+
+    def _box_candidates(self, x_min, y_min, x_max, y_max):
+        if x_max < self.x0 or y_max < self.y0 or x_min > self.x0 + self.nx * self.cell or \
+                y_min > self.y0 + self.ny * self.cell:
+            return zeros(0, dtype=int64)
+        columns = arange(max(self._column(x_min), 0), min(self._column(x_max), self.nx - 1) + 1)
+        return self._candidates(columns, full(len(columns), self._row(y_min)), full(len(columns), self._row(y_max)))
+
+    def trajectory(self, segments):
+        # Index of the trajectory of each segment
+        return searchsorted(self.offsets, segments, side='right') - 1
+
+    @instrument.timed()
+    def box(self, x_min, y_min, x_max, y_max):
+        # Trajectories with a segment that has a part inside the rectangle
+        segments = self._box_candidates(x_min, y_min, x_max, y_max)
+        inside = _in_box(*self._ends(segments), x_min, y_min, x_max, y_max)
+        return unique(self.trajectory(segments[inside]))
+
+    @instrument.timed()
+    def radius(self, x, y, r):
+        # Trajectories that pass within r of the point (x, y)
+        segments = self._box_candidates(x - r, y - r, x + r, y + r)
+        near = _distance(*self._ends(segments), x, y) <= r
+        return unique(self.trajectory(segments[near]))
+
+    @instrument.timed()
+    def crossings(self, x1, y1, x2, y2):
+        """ Every crossing of the segment from (x1, y1) to (x2, y2) by a trajectory
+            - returns the trajectory, t, x and y of each crossing, a trajectory that
+              crosses several times appears several times
+            - only the cells along the segment are read, not its whole bounding box
+        """
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        columns = arange(max(self._column(x1), 0), min(self._column(x2), self.nx - 1) + 1)
+        # heights of the segment where it enters and leaves each column
+        left = maximum(self.x0 + columns * self.cell, x1)
+        right = minimum(self.x0 + (columns + 1) * self.cell, x2)
+        if x2 > x1:
+            y_left = y1 + (y2 - y1) * (left - x1) / (x2 - x1)
+            y_right = y1 + (y2 - y1) * (right - x1) / (x2 - x1)
+        else:
+            y_left, y_right = full(len(columns), y1), full(len(columns), y2)
+        segments = self._candidates(columns, self._row(minimum(y_left, y_right)),
+                                    self._row(maximum(y_left, y_right)))
+
+        hit, s = intersect(*self._ends(segments), x1, y1, x2, y2)
+        segments, s = segments[hit], s[hit]
+        t1, t2 = asarray(self.t[segments], dtype=float), asarray(self.t[segments + 1], dtype=float)
+        x_1, y_1, x_2, y_2 = self._ends(segments)
+        return (self.trajectory(segments), t1 + s * (t2 - t1), x_1 + s * (x_2 - x_1), y_1 + s * (y_2 - y_1))
+
+    def segment(self, x1, y1, x2, y2):
+        # Trajectories that cross the segment from (x1, y1) to (x2, y2)
+        return unique(self.crossings(x1, y1, x2, y2)[0])
+
+
+if __name__ == '__main__':
+    from storage import TrajectoryFile
+
+    if len(sys.argv) != 5:
+        print('Usage: python spatial.py directory x y distance')
+        sys.exit(1)
+    index = SegmentIndex(TrajectoryFile(sys.argv[1]))
+    x, y, r = [float(a) for a in sys.argv[2:]]
+    found = index.radius(x, y, r)
+    print('%d of %d trajectories pass within %g m of (%g, %g)' % (len(found), len(index), r, x, y))
+    for i in found:
+        print(i)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+"""Binary columnar storage for launch parameters and trajectories -
+    A store is a directory of NumPy .npy files, one per column, that are
+    memory-mapped when read, so nothing has to be parsed:
+
+    <directory>/launches/<field>.npy      one file per field of read_data.row_dtype, the
+                                          names as their UTF-8 bytes one after the other,
+    <directory>/launches/name_offsets.npy and the offsets of each name in them (int64)
+    <directory>/trajectories/offsets.npy  int64, number of trajectories + 1 entries
+    <directory>/trajectories/t.npy        float64, the points of all trajectories one
+    <directory>/trajectories/x.npy        after the other, trajectory i is the slice
+    <directory>/trajectories/y.npy        offsets[i]:offsets[i + 1]
+
+    The files are written in pieces, so a store can be bigger than memory.
+
+    Usage (converts a csv input file to a store):
+        python storage.py input.csv directory
+
+"""
+
+import os
+import shutil
+import sys
+
+from numpy import arange
+from numpy import ascontiguousarray
+from numpy import broadcast_to
+from numpy import cumsum
+from numpy import diff
+from numpy import dtype
+from numpy import empty
+from numpy import int64
+from numpy import float64
+from numpy import frombuffer
+from numpy import inf
+from numpy import load
+from numpy import uint8
+from numpy import zeros
+from numpy.lib import format as npy_format
+
+from read_data import read_data, row_dtype, ReadError
+
+
+class _ColumnWriter:
+    # Appends arrays of one type to a raw file, which becomes a .npy file on close
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self.size = 0
+        self.stream = open(path + '.part', 'wb')
+
+    def append(self, values):
+        values = ascontiguousarray(values, dtype=self.dtype)
+        values.tofile(self.stream)
+        self.size += values.size
+
+    def close(self):
+        self.stream.close()
+        header = {'descr': npy_format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (self.size,)}
+        with open(self.path, 'wb') as out, open(self.path + '.part', 'rb') as raw:
+            npy_format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 1 << 24)
+        os.remove(self.path + '.part')
+
+
+class LaunchWriter:
+    """ Writes launch parameters (structured arrays of read_data.row_dtype) to
+        <directory>/launches, one column per file (two for the names)
+    """
+    def __init__(self, directory):
+        path = os.path.join(directory, 'launches')
+        os.makedirs(path, exist_ok=True)
+        self.columns = {name: _ColumnWriter(os.path.join(path, name + '.npy'), row_dtype[name])
+                        for name in row_dtype.names[1:]}
+        self.names = _ColumnWriter(os.path.join(path, 'name.npy'), dtype(uint8))
+        self.name_offsets = _ColumnWriter(os.path.join(path, 'name_offsets.npy'), dtype(int64))
+        self.name_offsets.append([0])
+        self.total = 0
+
+    def append(self, chunk):
+        encoded = [name.encode('utf-8') for name in chunk['name']]
+        self.names.append(frombuffer(b''.join(encoded), dtype=uint8))
+        ends = self.total + cumsum([len(name) for name in encoded], dtype=int64)
+        self.name_offsets.append(ends)
+        if ends.size:
+            self.total = int(ends[-1])
+        for name, column in self.columns.items():
+            column.append(chunk[name])
+
+    def close(self):
+        self.names.close()
+        self.name_offsets.close()
+        for column in self.columns.values():
+            column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryWriter:
+    """ Writes ragged trajectories to <directory>/trajectories
+        - append takes the points of several trajectories one after the other, and
+          the number of points of each of them (see pack)
+    """
+    def __init__(self, directory):
+        path = os.path.join(directory, 'trajectories')
+        os.makedirs(path, exist_ok=True)
+        self.offsets = _ColumnWriter(os.path.join(path, 'offsets.npy'), dtype(int64))
+        self.columns = [_ColumnWriter(os.path.join(path, name + '.npy'), dtype(float64)) for name in ('t', 'x', 'y')]
+        self.total = 0
+        self.offsets.append([0])
+
+    def append(self, t, x, y, counts):
+        for column, values in zip(self.columns, (t, x, y)):
+            column.append(values)
+        ends = self.total + cumsum(counts, dtype=int64)
+        self.offsets.append(ends)
+        if ends.size:
+            self.total = int(ends[-1])
+
+    def close(self):
+        self.offsets.close()
+        for column in self.columns:
+            column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryFile:
+    """ Memory-mapped trajectories of a store
+        - len() is the number of trajectories
+        - [i] returns the (t, x, y) arrays of trajectory i, read from disk only when used
+    """
+    def __init__(self, directory, mmap_mode='r'):
+        path = os.path.join(directory, 'trajectories')
+        self.offsets = load(os.path.join(path, 'offsets.npy'), mmap_mode=mmap_mode)
+        self.t = load(os.path.join(path, 't.npy'), mmap_mode=mmap_mode)
+        self.x = load(os.path.join(path, 'x.npy'), mmap_mode=mmap_mode)
+        self.y = load(os.path.join(path, 'y.npy'), mmap_mode=mmap_mode)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('trajectory index out of range')
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.t[start:stop], self.x[start:stop], self.y[start:stop]
+
+    def arrays(self):
+        # offsets, t, x and y of all trajectories, as laid out in the store
+        return self.offsets, self.t, self.x, self.y
+
+
+class TrajectoryCollection:
+    """ Growable in-memory trajectories, with the same layout as a store
+        - append adds one trajectory in amortized constant time, the storage doubles
+          when it is full
+        - x_max and y_max are updated as trajectories are added (-inf when empty)
+        - [i] returns the (t, x, y) views of trajectory i
+    """
+    def __init__(self, capacity=1024):
+        self.points = empty((3, capacity))
+        self.offsets = zeros(64, dtype=int64)
+        self.count = 0
+        self.x_max = -inf
+        self.y_max = -inf
+
+    def append(self, t, x, y):
+        n = len(x)
+        start = self.offsets[self.count]
+        if start + n > self.points.shape[1]:
+            points = empty((3, max(2 * self.points.shape[1], start + n)))
+            points[:, :start] = self.points[:, :start]
+            self.points = points
+        if self.count + 2 > len(self.offsets):
+            offsets = zeros(2 * len(self.offsets), dtype=int64)
+            offsets[:self.count + 1] = self.offsets[:self.count + 1]
+            self.offsets = offsets
+
+        self.points[0, start:start + n] = t
+        self.points[1, start:start + n] = x
+        self.points[2, start:start + n] = y
+        self.count += 1
+        self.offsets[self.count] = start + n
+        if n:
+            self.x_max = max(self.x_max, self.points[1, start:start + n].max())
+            self.y_max = max(self.y_max, self.points[2, start:start + n].max())
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('trajectory index out of range')
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.points[0, start:stop], self.points[1, start:stop], self.points[2, start:stop]
+
+    def arrays(self):
+        # offsets, t, x and y of all trajectories (views), with the layout of a store
+        end = self.offsets[self.count]
+        return self.offsets[:self.count + 1], self.points[0, :end], self.points[1, :end], self.points[2, :end]
+
+    def save(self, directory):
+        # Writes the trajectories to a store
+        end = self.offsets[self.count]
+        with TrajectoryWriter(directory) as writer:
+            writer.append(self.points[0, :end], self.points[1, :end], self.points[2, :end],
+                          diff(self.offsets[:self.count + 1]))
+
+
+def pack(T, X, Y, landing):
+    """ Converts the padded output of motion.DragBatch into the points of all
+        trajectories one after the other, returns t, x, y and the number of points
+        of each trajectory, as taken by TrajectoryWriter.append
+    """
+    counts = landing + 1
+    keep = arange(X.shape[1]) < counts[:, None]
+    t = broadcast_to(T, X.shape)[keep]
+    return t, X[keep], Y[keep], counts
+
+
+def read_launches(directory, mmap_mode='r'):
+    """ Returns a dictionary with the memory-mapped columns of the launch parameters,
+        'name' holds the UTF-8 bytes of the names and 'name_offsets' their offsets
+        (stores written before names had any length have no offsets, and a fixed
+        width unicode 'name' column)
+    """
+    path = os.path.join(directory, 'launches')
+    if not os.path.isdir(path):
+        raise ReadError('Directory %s has no launch parameters' % directory)
+    columns = {name: load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in row_dtype.names}
+    if os.path.exists(os.path.join(path, 'name_offsets.npy')):
+        columns['name_offsets'] = load(os.path.join(path, 'name_offsets.npy'), mmap_mode=mmap_mode)
+    return columns
+
+
+def _names(columns, start, stop):
+    # Names of the rows start:stop of the launch columns
+    if 'name_offsets' not in columns:
+        return columns['name'][start:stop].tolist()
+    offsets = columns['name_offsets'][start:stop + 1]
+    raw = columns['name'][offsets[0]:offsets[-1]].tobytes()
+    ends = offsets - offsets[0]
+    return [raw[ends[i]:ends[i + 1]].decode('utf-8') for i in range(stop - start)]
+
+
+def launch_chunks(directory, chunk_size=65536):
+    # Yields the launch parameters of a store as structured arrays of at most chunk_size rows
+    columns = read_launches(directory)
+    size = len(columns[row_dtype.names[1]])
+    for start in range(0, size, chunk_size):
+        stop = min(start + chunk_size, size)
+        chunk = empty(stop - start, dtype=row_dtype)
+        chunk['name'] = _names(columns, start, stop)
+        for name in row_dtype.names[1:]:
+            chunk[name] = columns[name][start:stop]
+        yield chunk
+
+
+def convert(filename, directory, chunk_size=65536):
+    """ Converts a csv parameter file into the launches of a store, returns the list
+        of (line, message) of the rows that could not be read
+    """
+    reader = read_data()
+    with LaunchWriter(directory) as writer:
+        for chunk in reader.read_chunks(filename, chunk_size=chunk_size):
+            writer.append(chunk)
+    return reader.errors
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python storage.py input.csv directory')
+        sys.exit(1)
+    try:
+        errors = convert(sys.argv[1], sys.argv[2])
+    except ReadError as error:
+        print(error)
+        sys.exit(1)
+    for line, message in errors:
+        print('Line %d of the input file skipped: %s' % (line, message))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import integrator
+from projectile import g, p
+
+
+@pytest.mark.parametrize('method', ['rk4', 'rk45'])
+def test_vacuum_lands_on_the_parabola(method):
+    v0, deg = np.array([50.0, 120.0, 20.0]), np.array([60.0, 30.0, 80.0])
+    flight = integrator.integrate(v0, deg, 0.5, 0.05, 1.0, forces=integrator.Forces(drag=None), method=method)
+    theta = np.deg2rad(deg)
+    time = 2 * v0 * np.sin(theta) / abs(g)
+    np.testing.assert_allclose(flight.flight_time, time, rtol=1e-9)
+    np.testing.assert_allclose(flight.landing_x, v0 * np.cos(theta) * time, rtol=1e-9)
+    assert flight.landed.all()
+
+
+@pytest.mark.parametrize('method', ['rk4', 'rk45'])
+def test_linear_drag_follows_the_closed_form(method):
+    v0, deg, Cd, A, m, y0 = 100.0, 45.0, np.array([0.47, 1.05, 0.04]), 0.0314, np.array([0.5, 2.0, 5.0]), 10.0
+    flight = integrator.integrate(v0, deg, Cd, A, m, y0=y0, forces=integrator.Forces(drag='linear'), method=method,
+                                  rtol=1e-9, atol=1e-9)
+    # closed form of motion.Drag at the flight time found by the integrator
+    vt = np.sqrt((2 * m * abs(g)) / (p * A * Cd))
+    theta = np.deg2rad(deg)
+    e = np.exp(g * flight.flight_time / vt)
+    x = ((v0 * vt) / abs(g)) * np.cos(theta) * (1 - e)
+    y = y0 + (vt / abs(g)) * (v0 * np.sin(theta) + vt) * (1 - e) - vt * flight.flight_time
+    np.testing.assert_allclose(flight.landing_x, x, rtol=1e-6)
+    np.testing.assert_allclose(y, 0.0, atol=1e-5)
+
+
+def test_zero_mass_is_rejected():
+    with pytest.raises(ValueError):
+        integrator.integrate(100, 45, 0.5, 0.05, 0.0)
+    with pytest.raises(ValueError):
+        integrator.integrate(100, 45, -0.5, 0.05, 1.0)
+
+
+def test_launches_that_stop_being_finite_are_retired():
+    flight = integrator.integrate([100.0, np.nan], 45, 0.5, 0.05, 1.0)
+    assert flight.landed.tolist() == [True, False]
+    assert np.isnan([flight.landing_x[1], flight.flight_time[1], flight.vx[1], flight.vy[1]]).all()
+    # no tolerance at all: every error estimate is nan, the launch must still end
+    flight = integrator.integrate(100, 45, 0.5, 0.05, 1.0, rtol=0.0, atol=0.0)
+    assert not flight.landed[0]
+
+
+def test_step_and_time_limits():
+    flight = integrator.integrate([100.0, 100.0], 45, 0.5, 0.05, 1.0, max_steps=10)
+    assert not flight.landed.any()
+    assert (flight.steps <= 10).all()
+    flight = integrator.integrate(100, 45, 0.5, 0.05, 1.0, max_time=2.0)
+    assert not flight.landed[0] and flight.flight_time[0] >= 2.0
+
+
+def test_record_ends_each_trajectory_on_the_ground():
+    flight, (offsets, t, x, y) = integrator.integrate([30.0, 80.0], [40.0, 60.0], 0.5, 0.05, 1.0, record=True)
+    assert offsets[0] == 0 and offsets[-1] == len(t) == len(x) == len(y)
+    for i in range(2):
+        last = offsets[i + 1] - 1
+        assert offsets[i + 1] - offsets[i] == flight.steps[i] + 1
+        assert (t[last], x[last], y[last]) == (flight.flight_time[i], flight.landing_x[i], 0.0)
@@ -0,0 +1,34 @@
+import numpy as np
+
+import objects as obj
+import projectile as proj
+from level import basket_level
+
+
+LAUNCHES = [(100, 45, 0.47, 0.0314, 0.5, 0.0, 0.0), (210, 15, 0.47, 0.0314, 0.5, 0.0, 0.0),
+            (80, 70, 1.05, 0.01, 0.2, 0.0, 2.0), (300, 40, 0.04, 0.05, 3.0, 0.0, 10.0),
+            (60, 30, 0.47, 0.0314, 0.5, 450.0, 30.0)]
+
+
+def test_basket_level_matches_drag():
+    collisions = basket_level().launch(*np.array(LAUNCHES).T)
+    specs = obj.makeSpecs(*np.array(LAUNCHES)[:, [2, 3, 5, 6, 4]].T)
+    for i, launch in enumerate(LAUNCHES):
+        T, X, Y, outcome = proj.motion().Drag(specs[i], launch[0], launch[1])
+        assert collisions.result[i] == outcome.result
+
+
+def test_launch_split_by_flight_length_keeps_the_order():
+    rng = np.random.default_rng(3)
+    n = 300
+    launches = [rng.uniform(20, 280, n), rng.uniform(5, 85, n), rng.uniform(0.05, 1.2, n), rng.uniform(0.01, 0.1, n),
+                rng.uniform(0.1, 5.0, n), np.zeros(n), rng.uniform(0, 20, n)]
+    level = basket_level()
+    expected = level.launch(*launches)
+    split = level.launch(*launches, chunk_size=70, max_points=5000)
+    for field, a, b in zip(expected._fields, expected, split):
+        np.testing.assert_array_equal(a, b, err_msg=field)
+
+
+def test_launch_without_launches():
+    assert len(basket_level().launch([], [], [], [], []).result) == 0
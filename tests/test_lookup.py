@@ -0,0 +1,39 @@
+import numpy as np
+
+import lookup
+import objects as obj
+
+
+def test_interpolated_answers_are_within_their_error_bound(tmp_path):
+    lookup.build(obj.Sphere(), str(tmp_path), speeds=128, angles=128, max_speed=300.0)
+    table = lookup.OutcomeTable(str(tmp_path))
+    rng = np.random.default_rng(0)
+    v0 = rng.uniform(1, 300, 20000)
+    deg = rng.uniform(0, 90, 20000)
+
+    answer = table.query(v0, deg)
+    result, y_left, y_right, landing_x, kind = lookup.exact(obj.Sphere(), v0, deg)
+    assert (answer.result == result).all()
+    assert (~answer.exact).mean() > 0.9 # most queries come from the table
+    for value, expected, error in ((answer.y_left, y_left, answer.y_left_error),
+                                   (answer.y_right, y_right, answer.y_right_error),
+                                   (answer.landing_x, landing_x, answer.landing_error)):
+        finite = np.isfinite(expected) & np.isfinite(value)
+        assert (abs(value[finite] - expected[finite]) <= error[finite] + 1e-9).all()
+    np.testing.assert_array_equal(answer.y_left[answer.exact], y_left[answer.exact])
+
+
+def test_queries_outside_the_grid_are_exact(tmp_path):
+    lookup.build(obj.Sphere(), str(tmp_path), speeds=32, angles=32, max_speed=200.0)
+    answer = lookup.OutcomeTable(str(tmp_path)).query([250.0, 100.0], 45)
+    assert answer.exact.tolist() == [True, False]
+    result, y_left, y_right, landing_x, kind = lookup.exact(obj.Sphere(), 250.0, 45)
+    assert answer.result[0] == result and answer.landing_x[0] == landing_x
+
+
+def test_tables_answer_types_without_a_table_exactly(tmp_path):
+    lookup.build_presets(str(tmp_path), types=[1], speeds=32, angles=32)
+    tables = lookup.OutcomeTables(str(tmp_path))
+    answer = tables.query([1, 2], [150.0, 150.0], 40)
+    assert answer.exact.tolist() == [False, True]
+    assert answer.result[1] == lookup.exact(obj.Cube(), 150.0, 40)[0]
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import objects as obj
+import projectile as proj
+
+
+def launches():
+    # objects and throws that cover every outcome: the ground, over the basket, into it,
+    # and stopped by each bar
+    items = [obj.Sphere(), obj.Cube(), obj.StreamlinedBody(), obj.Custom(0.5, 0.01, mass=0.145),
+             obj.Custom(0.3, 0.02, x0=10.0, y0=5.0, mass=2.0)]
+    cases = [(item, v0, deg) for item in items for v0 in (20, 90, 180, 260) for deg in (10, 30, 45, 60, 80)]
+    return cases + [(obj.Sphere(), 210, 15), (obj.StreamlinedBody(), 100, 30)]
+
+
+@pytest.mark.parametrize('dt', [0.1, 0.01])
+def test_drag_batch_matches_drag(dt):
+    mtn = proj.motion()
+    cases = launches()
+    T, X, Y, landing, outcome = mtn.DragBatch([v0 for item, v0, deg in cases], [deg for item, v0, deg in cases],
+                                              [item.Cd for item, v0, deg in cases], [item.A for item, v0, deg in cases],
+                                              [item.m for item, v0, deg in cases], [item.x0 for item, v0, deg in cases],
+                                              [item.y0 for item, v0, deg in cases], dt=dt)
+    results = set()
+    for i, (item, v0, deg) in enumerate(cases):
+        t, x, y, expected = mtn.Drag(item, v0, deg, dt=dt)
+        n = landing[i] + 1
+        np.testing.assert_array_equal(T[:n], t)
+        np.testing.assert_array_equal(X[i, :n], x)
+        np.testing.assert_array_equal(Y[i, :n], y)
+        assert np.isnan(X[i, n:]).all()
+        np.testing.assert_equal(tuple(outcome[i].tolist()), tuple(expected))
+        results.add((expected.result, expected.bar))
+    assert {('Win', ''), ('Fail', ''), ('Fail', 'left'), ('Win', 'right')} <= results
+
+
+def test_drag_batch_ragged_and_specs():
+    mtn = proj.motion()
+    specs = obj.makeSpecs(Cd=[0.47, 1.05], A=0.05, mass=[1.0, 2.0])
+    T, X, Y, landing, outcome = mtn.DragSpecs(specs, 150, 40, ragged=True)
+    for i in range(2):
+        assert len(X[i]) == len(Y[i]) == landing[i] + 1
+        t, x, y, expected = mtn.Drag(specs[i], 150, 40)
+        np.testing.assert_array_equal(X[i], x)
+        assert outcome.result[i] == expected.result
+
+
+def test_classify_matches_drag_away_from_the_bars():
+    mtn = proj.motion()
+    checked = 0
+    for item, v0, deg in launches():
+        result, y_left, y_right = mtn.classify(item, v0, deg)
+        expected = mtn.Drag(item, v0, deg, dt=0.001)[3]
+        # grazing launches may differ from the interpolation between the points of Drag
+        if any(abs(h - proj.basket_height) < 1.0 for h in (y_left, y_right) if not np.isnan(h)):
+            continue
+        assert result == expected.result
+        checked += 1
+    assert checked > 50
+
+
+def test_classify_heights_are_on_the_trajectory():
+    mtn = proj.motion()
+    item = obj.Sphere()
+    result, y_left, y_right = mtn.classify(item, 210, 15)
+    state = proj._closed_form(item, 210, 15, True)
+    assert result == 'Win'
+    for bar, height in ((proj.left_bar, y_left), (proj.right_bar, y_right)):
+        t = proj._find_root(lambda s: state(s)[0] - bar, 0.0, 100.0)
+        assert height == pytest.approx(state(t)[1], abs=1e-6)
+    # an object that never reaches the bars
+    assert np.isnan(mtn.classify(item, 20, 45)[1:]).all()
+
+
+def test_classify_arrays_of_launches():
+    mtn = proj.motion()
+    specs = obj.makeSpecs(Cd=[0.47, 1.05, 0.04, 0.0], A=0.05, mass=1.0)
+    v0 = np.array([260.0, 250.0, 100.0, 70.0])
+    result, y_left, y_right = mtn.classify(specs, v0, 45)
+    assert result.shape == y_left.shape == y_right.shape == (4,)
+    for i in range(3):
+        assert result[i] == mtn.classify(specs[i], v0[i], 45)[0]
+    # Cd = 0 is the vacuum parabola
+    theta = np.deg2rad(45)
+    t = proj.left_bar / (70 * np.cos(theta))
+    assert y_left[3] == pytest.approx(70 * np.sin(theta) * t + 0.5 * proj.g * t * t)
+
+
+def test_cache_is_keyed_on_the_physical_values(tmp_path):
+    cache = proj.TrajectoryCache(maxsize=2)
+    mtn = proj.motion(cache=cache)
+    first = mtn.Drag(obj.Sphere(), 100, 45)
+    assert mtn.Drag(obj.Custom(0.47, 0.05), 100, 45) is first
+    assert mtn.Drag(obj.makeSpecs(0.47, 0.05)[0], 100, 45) is first
+    assert cache.info() == proj.CacheInfo(2, 1, 2, 1)
+    assert not first[0].flags.writeable
+    np.testing.assert_array_equal(first[1], proj.motion().Drag(obj.Sphere(), 100, 45)[1])
+
+    mtn.Vacuum(obj.Cube(), 50, 30)
+    mtn.Vacuum(obj.Cube(), 60, 30) # evicts the least recently used entry
+    assert cache.get(cache.key('Drag', obj.Sphere(), 100, 45, 0.1)) is None
+
+    cache.save(str(tmp_path / 'cache.npz'))
+    loaded = proj.TrajectoryCache(path=str(tmp_path / 'cache.npz'))
+    assert list(loaded.entries) == list(cache.entries)
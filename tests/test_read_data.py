@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from read_data import read_data, row_dtype, ReadError
+
+header = 'name,initial_speed,initial_angle,drag_coefficent,diameter,ref_area,mass,obj_type\n'
+
+
+def write(tmp_path, rows):
+    path = tmp_path / 'input.csv'
+    path.write_text(header + ''.join(row + '\n' for row in rows), encoding='utf-8')
+    return str(path)
+
+
+def test_read_file_columns_and_names(tmp_path):
+    reader = read_data()
+    param_input, names = reader.read_file(write(tmp_path, ['Andy,260,45,0.5,0.075,0.785,0.145,0',
+                                                           'Alex,250,20,0,0,0,0,2']))
+    np.testing.assert_array_equal(param_input, [[260, 45, 0.5, 0.075, 0.785, 0.145, 0], [250, 20, 0, 0, 0, 0, 2]])
+    assert list(names) == ['Andy', 'Alex']
+    assert reader.errors == []
+
+
+def test_bad_rows_are_skipped_with_their_line_number(tmp_path):
+    reader = read_data()
+    param_input, names = reader.read_file(write(tmp_path, [
+        'Ok,100,30,0,0,0,0,1',
+        'Type,100,30,0,0,0,0,9',
+        'Fraction,100,30,0,0,0,0,1.7',
+        'Cd,100,30,-0.5,0.1,0.5,1,0',
+        'NoDrag,100,30,0,0.1,0.5,1,0',
+        'Area,100,30,0.5,0.1,0,1,0',
+        'Mass,100,30,0.5,0.1,0.5,0,0',
+        'Infinite,inf,30,0,0,0,0,1',
+        'Text,fast,30,0,0,0,0,1',
+        'Short,100,30',
+        'Whole,100,30,0,0,0,0,3.0',
+    ]))
+    assert list(names) == ['Ok', 'Whole']
+    assert param_input[1, 6] == 3
+    assert [line for line, message in reader.errors] == list(range(3, 12))
+    messages = dict(reader.errors)
+    assert 'invalid' in messages[3]
+    assert 'integer' in messages[4]
+    assert 'mass' in messages[8]
+
+
+def test_names_are_not_truncated(tmp_path):
+    name = 'A very long player name with unicode éè ' * 4
+    param_input, names = read_data().read_file(write(tmp_path, ['%s,100,30,0,0,0,0,1' % name.strip()]))
+    assert names[0] == name.strip()
+
+
+def test_read_chunks_yields_bounded_chunks(tmp_path):
+    rows = ['p%d,%d,30,0,0,0,0,1' % (i, 50 + i) for i in range(10)]
+    chunks = list(read_data().read_chunks(write(tmp_path, rows), chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert all(chunk.dtype == row_dtype for chunk in chunks)
+    assert np.concatenate(chunks)['speed'].tolist() == [50 + i for i in range(10)]
+
+
+def test_missing_file_and_wrong_header(tmp_path):
+    with pytest.raises(ReadError):
+        read_data().read_file(str(tmp_path / 'missing.csv'))
+    path = tmp_path / 'bad.csv'
+    path.write_text('name,speed\nAndy,100\n')
+    with pytest.raises(ReadError):
+        read_data().read_file(str(path))
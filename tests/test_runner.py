@@ -0,0 +1,62 @@
+import io
+
+import numpy as np
+
+import projectile as proj
+import runner
+from storage import TrajectoryFile, TrajectoryWriter
+
+
+def random_launches(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(20, 280, n), rng.uniform(5, 85, n), rng.uniform(0.05, 1.2, n),
+                            rng.uniform(0.01, 0.1, n), rng.uniform(0.1, 5.0, n), np.zeros(n), rng.uniform(0, 20, n)])
+
+
+def assert_outcomes_equal(a, b):
+    for field in proj.Outcome._fields:
+        np.testing.assert_array_equal(a[field], b[field])
+
+
+def test_run_keeps_the_order_of_the_launches_across_workers(tmp_path):
+    launches = random_launches(500)
+    T, X, Y, landing, expected = proj.motion().DragBatch(*launches.T)
+
+    with TrajectoryWriter(str(tmp_path)) as writer:
+        outcome = runner.run(launches, workers=3, chunk_size=37, trajectories=writer)
+    assert_outcomes_equal(outcome, expected)
+    assert_outcomes_equal(runner.run(launches, workers=1, chunk_size=64), expected)
+
+    stored = TrajectoryFile(str(tmp_path))
+    assert len(stored) == len(launches)
+    for i in (0, 1, 36, 37, 250, 499):
+        t, x, y = stored[i]
+        n = landing[i] + 1
+        np.testing.assert_array_equal(t, T[:n])
+        np.testing.assert_array_equal(x, X[i, :n])
+        np.testing.assert_array_equal(y, Y[i, :n])
+
+
+def test_groups_of_long_flights_give_the_same_results():
+    launches = random_launches(200, seed=1)
+    launches[[3, 150], 6] = 2e4 # two launches from very high up
+    outcome, packed = runner._score(launches, 0.1, True)
+    grouped, grouped_packed = runner._score(launches, 0.1, True, max_points=50000)
+    assert len(runner._groups(launches, 0.1, 50000)) > 1
+    assert_outcomes_equal(grouped, outcome)
+    for a, b in zip(grouped_packed, packed):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_score_file_writes_one_line_per_row_in_order(tmp_path):
+    path = tmp_path / 'input.csv'
+    path.write_text('name,initial_speed,initial_angle,drag_coefficent,diameter,ref_area,mass,obj_type\n'
+                    'Andy,260,45,0.5,0.075,0.785,0.145,0\n'
+                    'Alex,250,20,0,0,0,0,2\n'
+                    'Luis,219,30,0,0,0,0,1\n')
+    stream = io.StringIO()
+    errors = runner.score_file(str(path), stream, workers=2, chunk_size=1)
+    lines = stream.getvalue().splitlines()
+    assert errors == []
+    assert lines[0].split(',') == ['name'] + list(proj.Outcome._fields)
+    assert [line.split(',')[0] for line in lines[1:]] == ['Andy', 'Alex', 'Luis']
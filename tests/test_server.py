@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+import objects as obj
+import projectile as proj
+import server
+
+
+def test_launch_row_columns():
+    assert server.launch_row({'v0': 100, 'deg': 30, 'obj_type': 1}) == (100.0, 30.0, 0.47, 0.05, 1.0, 0.0, 0.0)
+    assert server.launch_row({'v0': 100, 'deg': 30, 'Cd': 0.3, 'A': 0.02, 'mass': 2.0, 'y0': 5})[2:] == \
+        (0.3, 0.02, 2.0, 0.0, 5.0)
+
+
+@pytest.mark.parametrize('request_, message', [
+    ({'deg': 30}, 'Missing'),
+    ({'v0': 100, 'deg': 30, 'Cd': 0}, 'drag coefficient'),
+    ({'v0': 100, 'deg': 30, 'mass': 0}, 'mass'),
+    ({'v0': 100, 'deg': 30, 'mass': -1}, 'mass'),
+    ({'v0': 100, 'deg': 30, 'obj_type': 9}, 'invalid'),
+    ({'v0': 100, 'deg': 30, 'obj_type': 1.5}, 'integer'),
+    ({'v0': 1e9, 'deg': 30}, 'v0'),
+    ({'v0': 100, 'deg': 30, 'y0': 999, 'Cd': 0.001, 'A': 0.01, 'mass': 1000}, 'flight'),
+    ({'v0': 'fast', 'deg': 30}, 'float'),
+    ([1, 2], 'JSON object'),
+])
+def test_launch_row_rejects_bad_requests(request_, message):
+    with pytest.raises(ValueError, match=message):
+        server.launch_row(request_)
+
+
+async def exchange(port, data):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(data)
+    writer.write_eof()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+async def session(*messages):
+    scorer = server.ScoringServer(server.Batcher(max_delay=0.001))
+    await scorer.start(port=0)
+    try:
+        return [await exchange(scorer.port, message) for message in messages]
+    finally:
+        await scorer.stop()
+
+
+def http(method, path, body=b'', length=None):
+    length = len(body) if length is None else length
+    return b'%s %s HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % (method, path, length) + body
+
+
+def status(response):
+    return int(response.split(b' ', 2)[1])
+
+
+def test_json_lines_answers_match_drag():
+    launches = [{'id': i, 'v0': 60.0 + 40 * i, 'deg': 20.0 + 10 * i, 'obj_type': i % 4} for i in range(6)]
+    lines, = asyncio.run(session(b''.join(json.dumps(launch).encode() + b'\n' for launch in launches) +
+                                 b'{"id": 9, "v0": 100, "deg": 30, "Cd": 0}\nnot json\n'))
+    answers = {answer.get('id'): answer for answer in map(json.loads, lines.splitlines())}
+    for launch in launches:
+        expected = proj.motion().Drag(obj.types[launch['obj_type']](), launch['v0'], launch['deg'])[3]
+        assert answers[launch['id']]['result'] == expected.result
+        assert answers[launch['id']]['landing_x'] == pytest.approx(expected.landing_x)
+    assert 'drag coefficient' in answers[9]['error']
+    assert answers[None] == {'error': 'Not valid JSON'}
+
+
+def test_http_status_codes():
+    ok, bad, zero_mass, too_big, malformed, missing = asyncio.run(session(
+        http(b'POST', b'/score', b'{"v0": 100, "deg": 30}'),
+        http(b'POST', b'/score', b'[{"v0": 100, "deg": 30}, {"v0": 100, "deg": 30, "Cd": 0}]'),
+        http(b'POST', b'/score', b'{"v0": 100, "deg": 30, "mass": 0}'),
+        http(b'POST', b'/score', length=server.max_body + 1),
+        b'POST /score HTTP/1.1\r\nContent-Length: many\r\n\r\n',
+        http(b'GET', b'/nothing')))
+    assert status(ok) == 200 and b'"result": "Fail"' in ok
+    assert status(bad) == 400
+    assert status(zero_mass) == 400 and b'nan' not in zero_mass
+    assert status(too_big) == 413
+    assert status(malformed) == 400
+    assert status(missing) == 404
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import projectile as proj
+import spatial
+from storage import TrajectoryCollection, TrajectoryFile
+
+
+@pytest.fixture(scope='module')
+def trajectories():
+    rng = np.random.default_rng(0)
+    n = 300
+    T, X, Y, landing, outcome = proj.motion().DragBatch(rng.uniform(20, 280, n), rng.uniform(5, 85, n),
+                                                        rng.uniform(0.05, 1.2, n), 0.05, 1.0, dt=0.2)
+    collection = TrajectoryCollection()
+    for i in range(n):
+        collection.append(T[:landing[i] + 1], X[i, :landing[i] + 1], Y[i, :landing[i] + 1])
+        if i % 50 == 0:
+            collection.append([0.0], [400.0], [50.0]) # a single point has no segment
+    return collection
+
+
+def segments(collection):
+    # Every segment of every trajectory, with its trajectory, for the brute force answers
+    offsets, t, x, y = collection.arrays()
+    owner = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    keep = owner[:-1] == owner[1:]
+    return owner[:-1][keep], x[:-1][keep], y[:-1][keep], x[1:][keep], y[1:][keep]
+
+
+def test_queries_match_brute_force(trajectories):
+    index = spatial.SegmentIndex(trajectories, chunk_size=1000)
+    owner, x1, y1, x2, y2 = segments(trajectories)
+
+    for box in ((390, 40, 410, 60), (0, 0, 50, 10), (450, -1, 550, 5), (-100, -100, -50, -50)):
+        expected = np.unique(owner[spatial._in_box(x1, y1, x2, y2, *box)])
+        np.testing.assert_array_equal(index.box(*box), expected)
+
+    for point in ((400, 50, 5), (500, 50, 2), (200, 100, 30), (1e4, 0, 1)):
+        expected = np.unique(owner[spatial._distance(x1, y1, x2, y2, point[0], point[1]) <= point[2]])
+        np.testing.assert_array_equal(index.radius(*point), expected)
+
+    for window in ((400, 0, 400, 50), (400, 50, 500, 50), (0, 300, 800, 0), (450, 20, 450, 20)):
+        hit, s = spatial.intersect(x1, y1, x2, y2, *window)
+        np.testing.assert_array_equal(index.segment(*window), np.unique(owner[hit]))
+        found, t, x, y = index.crossings(*window)
+        assert len(found) == hit.sum()
+
+
+def test_store_and_collection_give_the_same_index(trajectories, tmp_path):
+    trajectories.save(str(tmp_path))
+    stored = spatial.SegmentIndex(TrajectoryFile(str(tmp_path)), chunk_size=777)
+    index = spatial.SegmentIndex(trajectories)
+    np.testing.assert_array_equal(stored.radius(400, 50, 5), index.radius(400, 50, 5))
+    np.testing.assert_array_equal(stored.segment(400, 0, 400, 50), index.segment(400, 0, 400, 50))
+
+
+def test_crossings_are_on_both_segments(trajectories):
+    found, t, x, y = spatial.SegmentIndex(trajectories).crossings(400, 0, 400, 300)
+    assert len(found) > 0
+    np.testing.assert_allclose(x, 400)
+    for i, ti, yi in zip(found[:20], t[:20], y[:20]):
+        ts, xs, ys = trajectories[i]
+        assert yi == pytest.approx(np.interp(ti, ts, ys))
+
+
+def test_intersect():
+    hit, s = spatial.intersect([0, 0, 0, 0, 1], [0, 0, 0, 0, 1], [2, 2, 2, 2, 1], [2, 0, 0, 0, 1],
+                               [0, 0, 1, 0, 0], [2, 1, 0, 1, 0], [2, 2, 3, 2, 2], [0, 1, 0, 1, 2])
+    # crossing, parallel, collinear overlap, parallel apart and a point on the segment
+    assert hit.tolist() == [True, False, True, False, True]
+    assert s[0] == 0.5 and s[2] == 0.5 and s[4] == 0.0
+    assert np.isnan(s[1])
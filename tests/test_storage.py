@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import projectile as proj
+import storage
+from read_data import read_data, ReadError
+
+
+def test_launches_round_trip(tmp_path):
+    path = tmp_path / 'input.csv'
+    rows = ['Andy,260,45,0.5,0.075,0.785,0.145,0', 'Alex,250,20,0,0,0,0,2', 'Lúis the third,219,30,0,0,0,0,1']
+    path.write_text('name,initial_speed,initial_angle,drag_coefficent,diameter,ref_area,mass,obj_type\n' +
+                    '\n'.join(rows) + '\n', encoding='utf-8')
+    assert storage.convert(str(path), str(tmp_path / 'store'), chunk_size=2) == []
+
+    expected, names = read_data().read_file(str(path))
+    param_input, stored_names = read_data().read_file(str(tmp_path / 'store'))
+    np.testing.assert_array_equal(param_input, expected)
+    assert list(stored_names) == list(names)
+    chunks = list(read_data().read_chunks(str(tmp_path / 'store'), chunk_size=2))
+    assert [list(chunk['name']) for chunk in chunks] == [['Andy', 'Alex'], ['Lúis the third']]
+
+
+def test_trajectories_round_trip(tmp_path):
+    T, X, Y, landing, outcome = proj.motion().DragBatch([100, 200, 50], [30, 45, 80], 0.47, 0.05, 1.0)
+    t, x, y, counts = storage.pack(T, X, Y, landing)
+    with storage.TrajectoryWriter(str(tmp_path)) as writer:
+        writer.append(t[:counts[0]], x[:counts[0]], y[:counts[0]], counts[:1])
+        writer.append(t[counts[0]:], x[counts[0]:], y[counts[0]:], counts[1:])
+
+    stored = storage.TrajectoryFile(str(tmp_path))
+    assert len(stored) == 3
+    for i in range(3):
+        n = landing[i] + 1
+        for column, expected in zip(stored[i], (T[:n], X[i, :n], Y[i, :n])):
+            np.testing.assert_array_equal(column, expected)
+    np.testing.assert_array_equal(stored[-1][1], X[2, :landing[2] + 1])
+    with pytest.raises(IndexError):
+        stored[3]
+    offsets, t_all, x_all, y_all = stored.arrays()
+    np.testing.assert_array_equal(np.diff(offsets), counts)
+    np.testing.assert_array_equal(x_all, x)
+
+
+def test_collection_grows_and_saves(tmp_path):
+    collection = storage.TrajectoryCollection(capacity=4)
+    rng = np.random.default_rng(0)
+    items = [rng.normal(size=(3, n)) for n in (3, 0, 10, 7) * 20]
+    for t, x, y in items:
+        collection.append(t, x, y)
+    assert len(collection) == len(items)
+    assert collection.x_max == max(item[1].max() for item in items if item.size)
+    for i in (0, 1, 2, 79):
+        np.testing.assert_array_equal(np.array(collection[i]), items[i])
+
+    collection.save(str(tmp_path))
+    stored = storage.TrajectoryFile(str(tmp_path))
+    for i in range(len(items)):
+        np.testing.assert_array_equal(np.array(stored[i]), items[i])
+
+
+def test_missing_launches(tmp_path):
+    with pytest.raises(ReadError):
+        storage.read_launches(str(tmp_path))